@@ -1,5 +1,5 @@
 // file: client/src/App.js
-import React, { useState, useEffect, useRef, useCallback } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import Chart from 'chart.js/auto';
 import 'chartjs-adapter-date-fns';
 
@@ -42,44 +42,35 @@ function App() {
         fetchZones();
     }, []);
 
-    // 获取并刷新数据的核心函数 (使用useCallback进行性能优化)
-    const fetchZoneData = useCallback(async () => {
+    // 订阅当前分区的实时推送 (Server-Sent Events)，取代每5秒轮询 /status 和 /stats
+    // 连接建立后服务端先发送一条完整的 snapshot，之后只推送发生变化的字段 (update)
+    useEffect(() => {
         if (!currentZoneId) return;
-        try {
-            const [statusRes, statsRes] = await Promise.all([
-                fetch(`/api/zones/${currentZoneId}/status`),
-                fetch(`/api/zones/${currentZoneId}/stats`)
-            ]);
-
-            if (!statusRes.ok || !statsRes.ok) throw new Error('无法获取分区数据');
+        const source = new EventSource(`/api/zones/${currentZoneId}/events`);
 
-            const statusData = await statusRes.json();
-            const statsData = await statsRes.json();
+        const applyState = (state) => {
+            const { stats: newStats, history_point, ...status } = state;
+            if (Object.keys(status).length > 0) {
+                setZoneData(prev => ({ ...prev, zone_id: currentZoneId, ...status }));
+            }
+            if (newStats) setStats(newStats);
+        };
 
-            setZoneData(statusData);
-            setStats(statsData);
+        source.addEventListener('snapshot', (event) => {
+            const snapshot = JSON.parse(event.data);
+            if (snapshot[currentZoneId]) applyState(snapshot[currentZoneId]);
+            setMessage('');
+        });
+        source.addEventListener('update', (event) => {
+            applyState(JSON.parse(event.data).changes);
+        });
+        // EventSource 断线后会自动重连，重连成功时会重新收到 snapshot
+        source.onerror = () => setMessage('实时连接中断，正在重连...');
 
-        } catch (error) {
-             setMessage(`数据刷新失败: ${error.message}`);
-        }
+        // 组件卸载或切换分区时关闭连接，避免资源泄漏
+        return () => source.close();
     }, [currentZoneId]);
 
-    // 依赖于currentZoneId变化，立即获取一次数据
-    useEffect(() => {
-        fetchZoneData();
-    }, [fetchZoneData]);
-
-    // 在仪表盘视图下，设置一个定时器，每5秒刷新一次数据
-    useEffect(() => {
-        let intervalId = null;
-        if (view === 'dashboard') {
-            const id = setInterval(fetchZoneData, 5000); // 每5秒刷新
-            intervalId = id;
-        }
-        // 组件卸载或视图切换时，清除定时器，避免内存泄漏
-        return () => clearInterval(intervalId); 
-    }, [view, fetchZoneData]);
-
     // 更新图表的逻辑
     useEffect(() => {
         if (view === 'dashboard' && chartRef.current) {
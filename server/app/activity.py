@@ -0,0 +1,170 @@
+# file: server/app/activity.py
+import argparse
+import threading
+from datetime import datetime, timedelta
+from uuid import UUID
+
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+
+from . import models, strategy
+from .database import SessionLocal, dialect_insert
+
+# 进程内缓存的最大用户数，超过后整体清空（frequent_since 一旦确定就不会再变，缓存总是安全的）
+FREQUENT_CACHE_MAX_SIZE = 100_000
+
+_cache_lock = threading.Lock()
+_frequent_since_cache: dict = {}   # user_id -> frequent_since
+
+
+def _nth_vote_time(previous_total: int, timestamps: list[datetime]):
+    # 本批投票中使用户票数达到阈值的那一票的时间
+    index = max(0, strategy.FREQUENT_USER_VOTES_THRESHOLD - previous_total - 1)
+    return sorted(timestamps)[min(index, len(timestamps) - 1)]
+
+
+def record_votes(db: Session, votes: list[tuple]):
+    """
+    【增量维护】在写入投票的同一事务中更新用户活跃度计数（不提交）。
+    votes 为 (user_id, created_at) 列表；每个用户一次 upsert 累加总票数，
+    票数首次达到阈值时记录该用户成为固定用户的时间 frequent_since。
+    """
+    per_user: dict = {}
+    for user_id, created_at in votes:
+        per_user.setdefault(user_id, []).append(created_at)
+    if not per_user:
+        return
+
+    # 按ID排序，避免并发写入时因加锁顺序不同而死锁
+    user_ids = sorted(per_user, key=str)
+    stmt = dialect_insert(db, models.UserActivity).values([
+        {"user_id": user_id, "total_votes": len(per_user[user_id])} for user_id in user_ids
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[models.UserActivity.user_id],
+        set_={"total_votes": models.UserActivity.total_votes + stmt.excluded.total_votes}
+    ).returning(models.UserActivity.user_id, models.UserActivity.total_votes,
+                models.UserActivity.frequent_since)
+    crossing = [
+        row for row in db.execute(stmt).all()
+        if row.frequent_since is None and row.total_votes >= strategy.FREQUENT_USER_VOTES_THRESHOLD
+    ]
+    if not crossing:
+        return
+
+    # 票数刚刚达标的用户：frequent_since = max(首次出现 + N天, 达标那一票的时间)
+    first_seen = dict(
+        db.query(models.User.user_id, models.User.first_seen_at)
+        .filter(models.User.user_id.in_([row.user_id for row in crossing]))
+        .all()
+    )
+    updates = []
+    for row in crossing:
+        if row.user_id not in first_seen:
+            continue
+        timestamps = per_user[row.user_id]
+        nth_vote_at = _nth_vote_time(row.total_votes - len(timestamps), timestamps)
+        eligible_at = first_seen[row.user_id] + timedelta(days=strategy.FREQUENT_USER_DAYS_THRESHOLD)
+        updates.append({"user_id": row.user_id, "frequent_since": max(eligible_at, nth_vote_at)})
+    if updates:
+        db.execute(update(models.UserActivity), updates)
+
+
+def load_user_activity(db: Session, user_ids: list[UUID], now: datetime = None) -> dict:
+    """
+    批量读取用户是否为固定用户：已达标的用户直接命中进程内缓存，其余用户按主键一次查询。
+    返回 {user_id: {'is_frequent': bool, 'frequent_since': datetime | None}}。
+    """
+    now = now or datetime.utcnow()
+    result, missing = {}, []
+    with _cache_lock:
+        for user_id in user_ids:
+            frequent_since = _frequent_since_cache.get(user_id)
+            if frequent_since is None:
+                missing.append(user_id)
+            else:
+                result[user_id] = {'is_frequent': frequent_since < now, 'frequent_since': frequent_since}
+
+    if missing:
+        rows = (
+            db.query(models.UserActivity.user_id, models.UserActivity.frequent_since)
+            .filter(models.UserActivity.user_id.in_(missing))
+            .all()
+        )
+        with _cache_lock:
+            if len(_frequent_since_cache) + len(rows) > FREQUENT_CACHE_MAX_SIZE:
+                _frequent_since_cache.clear()
+            for user_id, frequent_since in rows:
+                if frequent_since is not None:
+                    _frequent_since_cache[user_id] = frequent_since
+                result[user_id] = {
+                    'is_frequent': frequent_since is not None and frequent_since < now,
+                    'frequent_since': frequent_since
+                }
+    return result
+
+
+def clear_cache():
+    with _cache_lock:
+        _frequent_since_cache.clear()
+
+
+def rebuild_user_activity(db: Session, chunk_size: int = 1000) -> int:
+    """
+    【管理功能】根据原始投票表重新计算全部用户的活跃度计数，返回写入的用户数。
+    用于首次部署该表，或怀疑计数与投票表不一致时。
+    """
+    ranked = select(
+        models.Vote.user_id,
+        models.Vote.created_at,
+        func.row_number().over(
+            partition_by=models.Vote.user_id,
+            order_by=(models.Vote.created_at, models.Vote.vote_id)
+        ).label("rn")
+    ).subquery()
+    nth_vote = (
+        select(ranked.c.user_id, ranked.c.created_at.label("nth_vote_at"))
+        .where(ranked.c.rn == strategy.FREQUENT_USER_VOTES_THRESHOLD)
+        .subquery()
+    )
+    totals = (
+        select(models.Vote.user_id, func.count(models.Vote.vote_id).label("total_votes"))
+        .group_by(models.Vote.user_id)
+        .subquery()
+    )
+    query = (
+        select(totals.c.user_id, totals.c.total_votes, models.User.first_seen_at, nth_vote.c.nth_vote_at)
+        .join(models.User, models.User.user_id == totals.c.user_id)
+        .outerjoin(nth_vote, nth_vote.c.user_id == totals.c.user_id)
+    )
+
+    db.query(models.UserActivity).delete()
+    rebuilt = 0
+    result = db.execute(query, execution_options={"yield_per": chunk_size})
+    for chunk in result.partitions():
+        rows = []
+        for user_id, total_votes, first_seen_at, nth_vote_at in chunk:
+            frequent_since = None
+            if nth_vote_at is not None:
+                eligible_at = first_seen_at + timedelta(days=strategy.FREQUENT_USER_DAYS_THRESHOLD)
+                frequent_since = max(eligible_at, nth_vote_at)
+            rows.append({"user_id": user_id, "total_votes": total_votes, "frequent_since": frequent_since})
+        db.execute(dialect_insert(db, models.UserActivity), rows)
+        rebuilt += len(rows)
+    db.commit()
+    clear_cache()
+    return rebuilt
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="用户活跃度计数维护工具")
+    parser.add_argument("--rebuild", action="store_true", help="根据投票表重建 user_activity")
+    args = parser.parse_args()
+    if not args.rebuild:
+        parser.print_help()
+    else:
+        db = SessionLocal()
+        try:
+            print(f"✅ 已重建 {rebuild_user_activity(db)} 个用户的活跃度计数")
+        finally:
+            db.close()
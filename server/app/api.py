@@ -1,15 +1,28 @@
 # file: server/app/api.py
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Request
-from fastapi.responses import HTMLResponse
+from fastapi import APIRouter, Depends, HTTPException, Path, Query, Request, Response
+from fastapi.responses import HTMLResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from sqlalchemy import func
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+import asyncio
+from itertools import groupby
 import json
 from decimal import Decimal
+from typing import Optional, Union
 
 # 导入项目内部模块
-from . import models, schemas, crud, strategy
+from . import models, schemas, crud, strategy, rollups, events, batch_strategy, metrics, vote_policy, export, retention
+from .scheduler import recompute_scheduler
+from .periodic import periodic_scheduler
+from .sharding import zone_sharding
+from .hvac_dispatcher import hvac_dispatcher
+from .ingest import vote_write_buffer, buffer_votes, persist_votes, notify_votes_written
 from .database import SessionLocal
+from .downsample import lttb_indices
+from .zone_cache import zone_cache, known_zone_ids, ZONES_KEY
+from .shared_state import shared_zone_table
+from .vote_counts import vote_count_publisher
 # 从main.py中导入templates实例，以避免循环导入
 from .main import templates
 
@@ -26,59 +39,123 @@ def get_db():
 user_router = APIRouter(prefix="/api", tags=["User Endpoints"])
 
 @user_router.get("/zones/", response_model=list[schemas.Zone])
-def get_zones(db: Session = Depends(get_db)):
+def get_zones(request: Request, db: Session = Depends(get_db)):
     """
     获取所有可用分区的列表，供前端下拉框使用。
+    结果来自分区快照缓存，并支持 ETag 条件请求。
     """
-    return db.query(models.Zone).all()
+    entry = zone_cache.get(ZONES_KEY)
+    if entry is None:
+        zones = [schemas.Zone.model_validate(zone) for zone in db.query(models.Zone).all()]
+        entry = zone_cache.put(ZONES_KEY, zones)
+    return zone_cache.respond(request, entry)
 
 # 【BUG修复】修正了装饰器中的拼写错误 (user_-router -> user_router)
 @user_router.get("/zones/{zone_id}/status", response_model=schemas.ZoneStatus)
 def get_zone_status(zone_id: str, db: Session = Depends(get_db)):
     """
     获取单个分区的详细状态，包括当前温度和推荐温度。
+    优先读取跨worker共享的分区状态表，不访问数据库。
     """
+    state = shared_zone_table.read(zone_id)
+    if state is not None:
+        return state.status()
     zone = db.query(models.Zone).filter(models.Zone.zone_id == zone_id).first()
     if not zone:
         raise HTTPException(status_code=404, detail="Zone not found")
     return zone
 
-@user_router.post("/vote/", response_model=schemas.Vote)
-def submit_vote(vote: schemas.VoteCreate, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+@user_router.get("/zones/{zone_id}/snapshot", response_model=schemas.ZoneSnapshot)
+def get_zone_snapshot(zone_id: str, request: Request, db: Session = Depends(get_db)):
     """
-    接收一次用户投票，存入数据库，并异步触发核心算法。
+    一次请求获取分区状态和投票统计（合并 /status 与 /stats）。
+    结果缓存在进程内，投票写入或重算提交时失效；带 If-None-Match 且数据未变化时返回 304。
+    状态和票数优先读取共享分区状态表（票数由 vote_counts.py 保持与时间窗同步），读不到时回退到数据库查询。
     """
-    # 检查用户是否存在，如果不存在则创建
-    db_user = crud.get_user(db, user_id=vote.user_id)
-    if not db_user:
-        crud.create_user(db, user_id=vote.user_id)
-    else:
-        # 如果用户存在，则更新其最近活跃时间
-        db_user.last_seen_at = datetime.utcnow()
-        db.commit()
+    entry = zone_cache.get(zone_id)
+    if entry is None:
+        state = shared_zone_table.read(zone_id)
+        if state is not None:
+            stats = state.votes if vote_count_publisher.running else _vote_counts(db, zone_id)
+            snapshot = schemas.ZoneSnapshot(**state.status(), stats=stats)
+        else:
+            zone = db.query(models.Zone).filter(models.Zone.zone_id == zone_id).first()
+            if not zone:
+                raise HTTPException(status_code=404, detail="Zone not found")
+            snapshot = schemas.ZoneSnapshot(
+                **schemas.ZoneStatus.model_validate(zone).model_dump(),
+                stats=_vote_counts(db, zone_id)
+            )
+        entry = zone_cache.put(zone_id, snapshot.model_dump(by_alias=True))
+    return zone_cache.respond(request, entry)
 
-    # 检查投票的分区是否存在
-    db_zone = db.query(models.Zone).filter(models.Zone.zone_id == vote.zone_id).first()
-    if not db_zone:
+def _known_zone_ids(db: Session, zone_ids) -> set[str]:
+    # 校验一批投票涉及的分区是否存在：先查进程内的分区ID集合，集合中没有的ID再一次查询数据库
+    known, unknown = known_zone_ids.partition(zone_ids)
+    if unknown:
+        rows = db.query(models.Zone.zone_id).filter(models.Zone.zone_id.in_(unknown)).all()
+        known |= known_zone_ids.add(zone_id for (zone_id,) in rows)
+    return known
+
+@user_router.post("/vote/", response_model=Union[schemas.Vote, schemas.VoteAccepted])
+def submit_vote(vote: schemas.VoteCreate, response: Response, db: Session = Depends(get_db)):
+    """
+    接收一次用户投票，存入数据库，并通知调度器异步触发核心算法。
+    启用写后缓冲时，投票只进入内存缓冲区，接口返回 202；同一用户对同一分区投票过于频繁时返回 429。
+    """
+    # 【性能优化】分区用进程内的ID集合校验，用户upsert和投票写入在同一个事务中完成，只提交一次
+    if not _known_zone_ids(db, [vote.zone_id]):
         raise HTTPException(status_code=404, detail="Zone not found")
-    
-    # 创建投票记录
-    new_vote = crud.create_vote(db=db, vote=vote)
-    
-    # 将耗时的温度计算任务放入后台执行，立即返回响应给用户
-    background_tasks.add_task(strategy.calculate_recommended_temperature, db=db, zone_id=vote.zone_id)
-    
+    vote_policy.enforce(vote)
+
+    if vote_write_buffer.enabled:
+        buffer_votes([vote])
+        response.status_code = 202
+        return schemas.VoteAccepted(**vote.model_dump())
+
+    new_vote = crud.create_vote(db, vote)
+    # 把新投票推入本进程的滑动窗口聚合器、失效分区快照缓存，并把分区标记为待重算（由调度器在后台合并执行）
+    notify_votes_written([new_vote])
     return new_vote
 
+@user_router.post("/votes/batch", response_model=schemas.VoteBatchResult)
+def submit_vote_batch(batch: schemas.VoteBatch, response: Response, db: Session = Depends(get_db)):
+    """
+    批量接收投票（例如信息亭网关汇总上报），一次用户upsert + 一条多行INSERT写入。
+    不存在的分区的投票会被拒绝并在 rejected_zone_ids 中返回，超出 (用户, 分区) 限流的投票被丢弃并计入 throttled，
+    其余投票照常写入。
+    """
+    known = _known_zone_ids(db, [vote.zone_id for vote in batch.votes])
+    accepted, throttled = vote_policy.vote_limiter.admit([vote for vote in batch.votes if vote.zone_id in known])
+    rejected = sorted({vote.zone_id for vote in batch.votes} - known)
+
+    if vote_write_buffer.enabled:
+        buffer_votes(accepted)
+        response.status_code = 202
+        return {"accepted": len(accepted), "queued": True, "rejected_zone_ids": rejected, "throttled": throttled}
+
+    persist_votes(db, accepted)
+    return {"accepted": len(accepted), "queued": False, "rejected_zone_ids": rejected, "throttled": throttled}
+
 @user_router.get("/zones/{zone_id}/stats", response_model=schemas.VoteStats)
 def get_vote_stats(zone_id: str, db: Session = Depends(get_db)):
     """
     获取指定分区最近一段时间的投票统计数据，用于前端仪表盘图表。
+    票数优先读取共享分区状态表，不访问数据库；票数发布器（vote_counts.py）每 VOTE_COUNTS_PUBLISH_SECONDS 秒
+    把新投票和过期投票引起的变化写入该表，因此最多滞后一个发布周期。表未启用或读不到时按时间窗查询投票表。
     """
+    if vote_count_publisher.running:
+        state = shared_zone_table.read(zone_id)
+        if state is not None:
+            return state.votes
+    return _vote_counts(db, zone_id)
+
+def _vote_counts(db: Session, zone_id: str) -> dict:
     # 【BUG修复】使用与核心算法一致的、更可靠的时间计算方式
     time_threshold = datetime.utcnow() - timedelta(minutes=strategy.VOTE_VALID_DURATION_MINUTES)
+    # count(*)：只用到 ix_votes_zone_id_created_at 中的列，PostgreSQL 上可以只扫描索引
     results = (
-        db.query(models.Vote.vote_value, func.count(models.Vote.vote_id))
+        db.query(models.Vote.vote_value, func.count())
         .filter(models.Vote.zone_id == zone_id, models.Vote.created_at >= time_threshold)
         .group_by(models.Vote.vote_value).all()
     )
@@ -94,28 +171,342 @@ def get_vote_stats(zone_id: str, db: Session = Depends(get_db)):
 admin_router = APIRouter(prefix="/admin", tags=["Admin Panel"])
 
 @admin_router.get("/monitoring-panel", response_class=HTMLResponse)
-def get_monitoring_panel(request: Request, db: Session = Depends(get_db)):
+def get_monitoring_panel(request: Request):
     """
-    获取并渲染包含所有分区历史数据的监控面板HTML页面。
+    渲染监控面板HTML页面。图表数据由页面通过 /admin/history 按需加载（已降采样），不再内嵌在HTML中。
     """
-    all_zones = db.query(models.Zone).all()
-    history_data = {}
-    time_threshold = datetime.utcnow() - timedelta(hours=1) # 只看最近一小时
+    return templates.TemplateResponse(request, "monitoring.html", {})
+
+def _naive_utc(value: datetime) -> datetime:
+    # 数据库中的时间均为不带时区的UTC时间，带时区的查询参数先转换为UTC
+    return value.astimezone(timezone.utc).replace(tzinfo=None) if value.tzinfo else value
 
-    for zone in all_zones:
-        history = (
-            db.query(models.History)
-            .filter(models.History.zone_id == zone.zone_id, models.History.timestamp >= time_threshold)
-            .order_by(models.History.timestamp.asc()).all()
+# 历史查询的时间范围超过这些阈值时，改为读取分钟/小时汇总表而不是原始 history 表
+HISTORY_RAW_MAX_RANGE = timedelta(hours=6)
+HISTORY_MINUTE_ROLLUP_MAX_RANGE = timedelta(days=7)
+
+def _history_source(start: datetime, end: datetime, now: datetime = None) -> str:
+    # 选择时间范围允许、且保留期仍覆盖 start 的最细粒度数据源；小时汇总永久保留，作为兜底
+    # （原始记录和分钟汇总会被数据保留任务删除，按时间跨度选到已删除的数据源会返回空曲线）
+    now = now or datetime.utcnow()
+    span = end - start
+    if span <= HISTORY_RAW_MAX_RANGE and start >= now - timedelta(days=retention.RAW_RETENTION_DAYS):
+        return "raw"
+    if span <= HISTORY_MINUTE_ROLLUP_MAX_RANGE and start >= now - timedelta(days=retention.MINUTE_ROLLUP_RETENTION_DAYS):
+        return "minute"
+    return "hour"
+
+def _history_query(db: Session, source: str, start: datetime, end: datetime):
+    # 返回 (查询, 分区列, 时间列)，查询结果为 (zone_id, 时间, 当前温度, 推荐温度)；汇总表使用各时间桶的平均温度
+    if source == "raw":
+        query = (
+            db.query(models.History.zone_id, models.History.timestamp,
+                     models.History.current_temp, models.History.recommended_temp)
+            .filter(models.History.timestamp >= start, models.History.timestamp <= end)
         )
-        history_data[zone.zone_id] = {
-            "name": zone.name,
-            "data": [schemas.HistoryRecord.from_orm(h).dict() for h in history]
+        return query, models.History.zone_id, models.History.timestamp
+    model = rollups.GRANULARITIES[source]
+    query = (
+        db.query(model.zone_id, model.bucket,
+                 model.current_temp_sum / model.temp_count,
+                 model.recommended_temp_sum / model.temp_count)
+        .filter(model.bucket >= rollups.truncate(start, source), model.bucket <= end, model.temp_count > 0)
+    )
+    return query, model.zone_id, model.bucket
+
+def _stream_history(start: datetime, end: datetime, points: int, zone_ids: Optional[list[str]]):
+    """
+    逐个分区生成降采样后的历史数据JSON片段。
+    所有分区的历史记录由一条按 (zone_id, 时间) 排序的查询分批读取，内存中只保留当前分区的数据；
+    长时间范围读取分钟/小时汇总表。
+    使用独立的数据库会话，因为流式响应在请求依赖项关闭之后才会被消费。
+    """
+    db = SessionLocal()
+    try:
+        source = _history_source(start, end)
+        zone_query = db.query(models.Zone.zone_id, models.Zone.name)
+        history_query, zone_column, time_column = _history_query(db, source, start, end)
+        if zone_ids:
+            zone_query = zone_query.filter(models.Zone.zone_id.in_(zone_ids))
+            history_query = history_query.filter(zone_column.in_(zone_ids))
+        names = dict(zone_query.all())
+        rows = history_query.order_by(zone_column, time_column).yield_per(5000)
+
+        yield '{"start":%s,"end":%s,"source":%s,"zones":{' % (
+            json.dumps(start.isoformat()), json.dumps(end.isoformat()), json.dumps(source))
+        first = True
+        for zone_id, zone_rows in groupby(rows, key=lambda row: row[0]):
+            xs, current, recommended = [], [], []
+            for _, timestamp, current_temp, recommended_temp in zone_rows:
+                xs.append(timestamp.replace(tzinfo=timezone.utc).timestamp())
+                current.append(current_temp)
+                recommended.append(recommended_temp)
+            indices = lttb_indices(xs, [current, recommended], points)
+            payload = {
+                "name": names.get(zone_id, zone_id),
+                "raw_points": len(xs),
+                "t": [int(xs[i] * 1000) for i in indices],   # 毫秒时间戳，前端可直接 new Date(t)
+                "current_temp": [current[i] for i in indices],
+                "recommended_temp": [recommended[i] for i in indices],
+            }
+            yield ("" if first else ",") + json.dumps(zone_id) + ":" + json.dumps(payload, ensure_ascii=False)
+            first = False
+        yield "}}"
+    finally:
+        db.close()
+
+@admin_router.get("/history")
+def get_history(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    points: int = Query(300, ge=3, le=5000),
+    zone_id: Optional[list[str]] = Query(None),
+):
+    """
+    一次查询获取所有分区（或指定分区）在任意时间范围内的历史温度，并在服务端降采样（LTTB）。
+    每个分区最多返回 points 个点，响应以紧凑的列式JSON流式输出。默认时间范围为最近一小时。
+    超过6小时的范围读取分钟级汇总，超过7天的范围读取小时级汇总（source 字段标明数据来源）；
+    起点早于原始数据或分钟汇总的保留期时，改用仍保留着该时段数据的更粗粒度汇总。
+    """
+    end = _naive_utc(end) if end else datetime.utcnow()
+    start = _naive_utc(start) if start else end - timedelta(hours=1)
+    if start >= end:
+        raise HTTPException(status_code=422, detail="start must be earlier than end")
+    return StreamingResponse(_stream_history(start, end, points, zone_id), media_type="application/json")
+
+@admin_router.get("/export/{table}")
+def export_raw_data(
+    table: str = Path(..., pattern="^(votes|history)$"),
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    gzip: bool = False,
+    zone_id: Optional[list[str]] = Query(None),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+):
+    """
+    流式导出 votes / history 的原始记录（CSV 或 NDJSON，可选 gzip），按 (时间, 主键) 排序，时间范围为 [start, end)。
+    中断后把已收到的最后一行的 "<时间>,<主键>" 作为 cursor 重新请求即可续传（续传时 CSV 不重复表头）。
+    """
+    if cursor:
+        try:
+            export.decode_cursor(cursor)
+        except ValueError as exc:
+            raise HTTPException(status_code=422, detail=str(exc))
+    start = _naive_utc(start) if start else None
+    end = _naive_utc(end) if end else None
+    filename = f"{table}.{format}" + (".gz" if gzip else "")
+    media_type = "application/gzip" if gzip else ("text/csv" if format == "csv" else "application/x-ndjson")
+    return StreamingResponse(
+        export.stream_export(table, format, gzip, zone_id, start, end, cursor),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+@admin_router.get("/zones/{zone_id}/rollups", response_model=list[schemas.ZoneRollup])
+def get_zone_rollups(
+    zone_id: str,
+    start: datetime,
+    end: Optional[datetime] = None,
+    granularity: str = Query("hour", pattern="^(minute|hour)$"),
+    db: Session = Depends(get_db),
+):
+    """
+    读取分区在指定时间范围内按分钟/小时汇总的温度 (min/max/avg) 和各投票值的票数，
+    用于长时间范围的统计，不扫描原始的 votes / history 表。
+    """
+    model = rollups.GRANULARITIES[granularity]
+    end = _naive_utc(end) if end else datetime.utcnow()
+    start = rollups.truncate(_naive_utc(start), granularity)
+    rows = (
+        db.query(model)
+        .filter(model.zone_id == zone_id, model.bucket >= start, model.bucket <= end)
+        .order_by(model.bucket.asc())
+        .all()
+    )
+    return [
+        {
+            "bucket": row.bucket,
+            "temp_count": row.temp_count,
+            "current_temp_min": row.current_temp_min,
+            "current_temp_max": row.current_temp_max,
+            "current_temp_avg": row.current_temp_sum / row.temp_count if row.temp_count else None,
+            "recommended_temp_min": row.recommended_temp_min,
+            "recommended_temp_max": row.recommended_temp_max,
+            "recommended_temp_avg": row.recommended_temp_sum / row.temp_count if row.temp_count else None,
+            "votes": {"-1": row.votes_minus_one, "0": row.votes_zero, "1": row.votes_plus_one},
+        }
+        for row in rows
+    ]
+
+@admin_router.get("/vote-window/verify")
+def verify_vote_window(db: Session = Depends(get_db)):
+    """
+    校验滑动窗口聚合器与原始SQL实现的 avg_score 是否一致，返回不一致的分区列表。
+    """
+    mismatches = strategy.verify_vote_window(db)
+    return {
+        "consistent": not mismatches,
+        "mismatches": {zone_id: {"window": w, "sql": s} for zone_id, (w, s) in mismatches.items()}
+    }
+
+@admin_router.get("/batch-engine/verify")
+def verify_batch_engine(db: Session = Depends(get_db)):
+    """
+    校验批量策略引擎与逐分区实现的计算结果是否一致（只读，不写库），返回不一致的分区列表。
+    """
+    mismatches = batch_strategy.verify_batch_engine(db)
+    return {
+        "consistent": not mismatches,
+        "mismatches": {
+            zone_id: {"batch": batch._asdict() if batch else None, "per_zone": expected._asdict()}
+            for zone_id, (batch, expected) in mismatches.items()
         }
-    
-    history_data_json = json.dumps(history_data, default=str) # 使用default=str处理Decimal和DateTime
+    }
+
+@admin_router.get("/recompute-scheduler")
+def get_recompute_scheduler_stats():
+    """
+    查看重算调度器的运行指标，包括每次重算合并了多少张投票。
+    """
+    return recompute_scheduler.stats()
 
-    return templates.TemplateResponse(
-        "monitoring.html", 
-        {"request": request, "history_data_json": history_data_json}
-    )
\ No newline at end of file
+@admin_router.get("/sharding")
+def get_sharding_stats(zone_id: Optional[str] = None, db: Session = Depends(get_db)):
+    """
+    查看分区分片的成员租约和本worker的路由情况；指定 zone_id 时同时返回该分区的归属成员。
+    """
+    members = db.query(models.ShardMember).order_by(models.ShardMember.member_id).all()
+    result = {
+        **zone_sharding.stats(),
+        "leases": [
+            {"member_id": m.member_id, "hostname": m.hostname, "pid": m.pid,
+             "started_at": m.started_at, "heartbeat_at": m.heartbeat_at}
+            for m in members
+        ],
+    }
+    if zone_id is not None:
+        result["zone_owner"] = zone_sharding.owner(zone_id)
+    return result
+
+@admin_router.get("/periodic-scheduler")
+def get_periodic_scheduler_stats():
+    """
+    查看周期性重算的运行指标：当前worker是否为leader、每轮耗时、延迟和顺延的分片数。
+    """
+    return periodic_scheduler.stats()
+
+@admin_router.get("/hvac")
+def get_hvac_dispatcher_stats():
+    """
+    查看HVAC下发队列的运行指标：去重、合并、重试、超时和死信数量。
+    """
+    return hvac_dispatcher.stats()
+
+@admin_router.get("/hvac/dead-letters", response_model=list[schemas.HVACDeadLetter])
+def get_hvac_dead_letters(limit: int = Query(50, ge=1, le=1000), db: Session = Depends(get_db)):
+    """
+    查看最近多次重试后仍下发失败的温度指令。
+    """
+    return (
+        db.query(models.HVACDeadLetter)
+        .order_by(models.HVACDeadLetter.id.desc())
+        .limit(limit)
+        .all()
+    )
+
+@admin_router.get("/vote-buffer")
+def get_vote_buffer_stats():
+    """
+    查看投票写后缓冲区的状态和落库统计。
+    """
+    return vote_write_buffer.stats()
+
+@admin_router.get("/vote-policy")
+def get_vote_policy_stats():
+    """
+    查看 (用户, 分区) 投票限流的配置、放行/限流次数，以及是否开启“最新一票生效”模式。
+    """
+    return vote_policy.vote_limiter.stats()
+
+@admin_router.get("/zone-cache")
+def get_zone_cache_stats():
+    """
+    查看分区快照缓存的命中率、304次数和失效次数，投票校验用的分区ID集合的命中情况，以及共享分区状态表的读写情况。
+    """
+    return {**zone_cache.stats(), "known_zone_ids": known_zone_ids.stats(), "shared_zone_state": shared_zone_table.stats()}
+
+@admin_router.get("/push")
+def get_push_stats():
+    """
+    查看服务端推送的订阅数和推送统计。
+    """
+    return events.event_broker.stats()
+
+# --- 路由组 3: 服务端推送 (SSE) ---
+# 与同步/异步模式无关，两种模式下都会挂载
+push_router = APIRouter(tags=["Push Endpoints"])
+
+# 空闲连接的心跳间隔（秒），防止代理因长时间无数据而断开连接
+SSE_HEARTBEAT_SECONDS = 15
+
+def _read_zone_states(zone_id: Optional[str]) -> dict:
+    # 读取订阅范围内各分区的完整状态，作为SSE连接建立后的第一条快照
+    db = SessionLocal()
+    try:
+        zone_ids = [zone_id] if zone_id else [z for (z,) in db.query(models.Zone.zone_id).all()]
+        states = {z: events.zone_state(db, z) for z in zone_ids}
+        return {z: state for z, state in states.items() if state is not None}
+    finally:
+        db.close()
+
+async def _event_stream(request: Request, zone_id: Optional[str]):
+    queue = events.event_broker.subscribe(zone_id)
+    try:
+        snapshot = await run_in_threadpool(_read_zone_states, zone_id)
+        yield f"event: snapshot\ndata: {json.dumps(snapshot, ensure_ascii=False)}\n\n"
+        while not await request.is_disconnected():
+            try:
+                message = await asyncio.wait_for(queue.get(), timeout=SSE_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"
+                continue
+            yield f"event: update\ndata: {message}\n\n"
+    finally:
+        events.event_broker.unsubscribe(queue)
+
+def _sse_response(request: Request, zone_id: Optional[str]) -> StreamingResponse:
+    return StreamingResponse(
+        _event_stream(request, zone_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@push_router.get("/api/zones/{zone_id}/events")
+async def stream_zone_events(zone_id: str, request: Request):
+    """
+    订阅单个分区的实时状态（Server-Sent Events）。
+    连接建立后先发送一条 snapshot 事件，之后每当重算改变了温度、投票统计或产生新的历史点时，
+    推送一条只包含变化字段的 update 事件。
+    """
+    return _sse_response(request, zone_id)
+
+@push_router.get("/admin/events")
+async def stream_all_zone_events(request: Request):
+    """
+    订阅全部分区的实时状态（Server-Sent Events），供监控面板追加新的历史点。
+    """
+    return _sse_response(request, None)
+
+
+# --- 【性能优化】Prometheus 指标 ---
+metrics_router = APIRouter(tags=["Metrics"])
+
+@metrics_router.get("/metrics", include_in_schema=False)
+def get_metrics():
+    """
+    以 Prometheus 文本格式导出请求延迟、每个请求的SQL次数/耗时、推荐温度计算各步骤耗时、HVAC下发延迟，
+    以及各后台组件 stats() 中的计数。
+    """
+    content, content_type = metrics.render()
+    return Response(content=content, media_type=content_type)
@@ -0,0 +1,137 @@
+# file: server/app/async_api.py
+from datetime import datetime, timedelta
+from typing import Union
+
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# 导入项目内部模块
+from . import schemas, async_crud, strategy, vote_policy
+from .database import AsyncSessionLocal
+from .ingest import vote_write_buffer, buffer_votes, notify_votes_written
+from .zone_cache import zone_cache, ZONES_KEY
+from .shared_state import shared_zone_table
+from .vote_counts import vote_count_publisher
+
+# 依赖项：异步模式下为每个请求提供一个独立的异步数据库会话
+async def get_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+# --- 路由组 1 (异步版): 面向用户的API ---
+# 路径和返回值与 api.user_router 完全相同，由 main.py 根据 DB_ASYNC_MODE 二选一挂载
+user_router = APIRouter(prefix="/api", tags=["User Endpoints"])
+
+@user_router.get("/zones/", response_model=list[schemas.Zone])
+async def get_zones(request: Request, db: AsyncSession = Depends(get_db)):
+    """
+    获取所有可用分区的列表，供前端下拉框使用。
+    结果来自分区快照缓存，并支持 ETag 条件请求。
+    """
+    entry = zone_cache.get(ZONES_KEY)
+    if entry is None:
+        zones = [schemas.Zone.model_validate(zone) for zone in await async_crud.get_zones(db)]
+        entry = zone_cache.put(ZONES_KEY, zones)
+    return zone_cache.respond(request, entry)
+
+@user_router.get("/zones/{zone_id}/status", response_model=schemas.ZoneStatus)
+async def get_zone_status(zone_id: str, db: AsyncSession = Depends(get_db)):
+    """
+    获取单个分区的详细状态，包括当前温度和推荐温度。
+    优先读取跨worker共享的分区状态表，不访问数据库。
+    """
+    state = shared_zone_table.read(zone_id)
+    if state is not None:
+        return state.status()
+    zone = await async_crud.get_zone(db, zone_id)
+    if not zone:
+        raise HTTPException(status_code=404, detail="Zone not found")
+    return zone
+
+@user_router.get("/zones/{zone_id}/snapshot", response_model=schemas.ZoneSnapshot)
+async def get_zone_snapshot(zone_id: str, request: Request, db: AsyncSession = Depends(get_db)):
+    """
+    一次请求获取分区状态和投票统计（合并 /status 与 /stats）。
+    结果缓存在进程内，投票写入或重算提交时失效；带 If-None-Match 且数据未变化时返回 304。
+    状态和票数优先读取共享分区状态表（票数由 vote_counts.py 保持与时间窗同步），读不到时回退到数据库查询。
+    """
+    entry = zone_cache.get(zone_id)
+    if entry is None:
+        state = shared_zone_table.read(zone_id)
+        if state is not None:
+            stats = state.votes if vote_count_publisher.running else await _vote_counts(db, zone_id)
+            snapshot = schemas.ZoneSnapshot(**state.status(), stats=stats)
+        else:
+            zone = await async_crud.get_zone(db, zone_id)
+            if not zone:
+                raise HTTPException(status_code=404, detail="Zone not found")
+            snapshot = schemas.ZoneSnapshot(
+                **schemas.ZoneStatus.model_validate(zone).model_dump(),
+                stats=await _vote_counts(db, zone_id)
+            )
+        entry = zone_cache.put(zone_id, snapshot.model_dump(by_alias=True))
+    return zone_cache.respond(request, entry)
+
+@user_router.post("/vote/", response_model=Union[schemas.Vote, schemas.VoteAccepted])
+async def submit_vote(vote: schemas.VoteCreate, response: Response, db: AsyncSession = Depends(get_db)):
+    """
+    接收一次用户投票，存入数据库，并通知调度器异步触发核心算法。
+    启用写后缓冲时，投票只进入内存缓冲区，接口返回 202；同一用户对同一分区投票过于频繁时返回 429。
+    """
+    if not await async_crud.get_known_zone_ids(db, [vote.zone_id]):
+        raise HTTPException(status_code=404, detail="Zone not found")
+    vote_policy.enforce(vote)
+
+    if vote_write_buffer.enabled:
+        buffer_votes([vote])
+        response.status_code = 202
+        return schemas.VoteAccepted(**vote.model_dump())
+
+    new_vote = await async_crud.create_vote(db, vote)
+    # 路由到其它worker的重算请求需要一次同步的 NOTIFY，放到线程池中执行，不阻塞事件循环
+    await run_in_threadpool(notify_votes_written, [new_vote])
+    return new_vote
+
+@user_router.post("/votes/batch", response_model=schemas.VoteBatchResult)
+async def submit_vote_batch(batch: schemas.VoteBatch, response: Response, db: AsyncSession = Depends(get_db)):
+    """
+    批量接收投票，一次用户upsert + 一条多行INSERT写入。
+    不存在的分区的投票会被拒绝并在 rejected_zone_ids 中返回，超出 (用户, 分区) 限流的投票被丢弃并计入 throttled，
+    其余投票照常写入。
+    """
+    known = await async_crud.get_known_zone_ids(db, [vote.zone_id for vote in batch.votes])
+    accepted, throttled = vote_policy.vote_limiter.admit([vote for vote in batch.votes if vote.zone_id in known])
+    rejected = sorted({vote.zone_id for vote in batch.votes} - known)
+
+    if vote_write_buffer.enabled:
+        buffer_votes(accepted)
+        response.status_code = 202
+        return {"accepted": len(accepted), "queued": True, "rejected_zone_ids": rejected, "throttled": throttled}
+
+    rows = await async_crud.bulk_create_votes(db, accepted)
+    await run_in_threadpool(notify_votes_written, rows)
+    return {"accepted": len(accepted), "queued": False, "rejected_zone_ids": rejected, "throttled": throttled}
+
+@user_router.get("/zones/{zone_id}/stats", response_model=schemas.VoteStats)
+async def get_vote_stats(zone_id: str, db: AsyncSession = Depends(get_db)):
+    """
+    获取指定分区最近一段时间的投票统计数据，用于前端仪表盘图表。
+    票数优先读取共享分区状态表，不访问数据库；票数发布器（vote_counts.py）每 VOTE_COUNTS_PUBLISH_SECONDS 秒
+    把新投票和过期投票引起的变化写入该表，因此最多滞后一个发布周期。表未启用或读不到时按时间窗查询投票表。
+    """
+    if vote_count_publisher.running:
+        state = shared_zone_table.read(zone_id)
+        if state is not None:
+            return state.votes
+    return await _vote_counts(db, zone_id)
+
+async def _vote_counts(db: AsyncSession, zone_id: str) -> dict:
+    time_threshold = datetime.utcnow() - timedelta(minutes=strategy.VOTE_VALID_DURATION_MINUTES)
+    counts = await async_crud.get_vote_counts(db, zone_id, time_threshold)
+    # 确保所有投票类型都有返回值
+    return {
+        "-1": counts.get("-1", 0),
+        "0": counts.get("0", 0),
+        "1": counts.get("1", 0)
+    }
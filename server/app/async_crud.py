@@ -0,0 +1,44 @@
+# file: server/app/async_crud.py
+from datetime import datetime
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models, schemas, crud
+from .zone_cache import known_zone_ids
+
+# 异步模式下用户端接口的数据访问函数。
+# 只读查询直接使用异步会话；投票写入（用户upsert、投票INSERT以及同一事务中的活跃度计数、汇总表维护）
+# 通过 run_sync 在同一条异步连接上执行 crud.py 的同步实现，保证两条路径写入的数据完全一致。
+
+# --- Zone ---
+async def get_zones(db: AsyncSession):
+    result = await db.execute(select(models.Zone))
+    return result.scalars().all()
+
+async def get_zone(db: AsyncSession, zone_id: str):
+    return await db.get(models.Zone, zone_id)
+
+async def get_known_zone_ids(db: AsyncSession, zone_ids) -> set[str]:
+    # 校验一批投票涉及的分区是否存在：先查进程内的分区ID集合，集合中没有的ID再一次查询数据库
+    known, unknown = known_zone_ids.partition(zone_ids)
+    if unknown:
+        result = await db.execute(select(models.Zone.zone_id).where(models.Zone.zone_id.in_(unknown)))
+        known |= known_zone_ids.add(result.scalars().all())
+    return known
+
+# --- Vote ---
+async def create_vote(db: AsyncSession, vote: schemas.VoteCreate):
+    return await db.run_sync(crud.create_vote, vote)
+
+async def bulk_create_votes(db: AsyncSession, votes: list[schemas.VoteCreate]):
+    return await db.run_sync(crud.bulk_create_votes, votes)
+
+async def get_vote_counts(db: AsyncSession, zone_id: str, since: datetime) -> dict:
+    # 统计指定分区自 since 以来每种投票值的票数
+    result = await db.execute(
+        select(models.Vote.vote_value, func.count())
+        .where(models.Vote.zone_id == zone_id, models.Vote.created_at >= since)
+        .group_by(models.Vote.vote_value)
+    )
+    return {str(value): count for value, count in result.all()}
@@ -0,0 +1,185 @@
+# file: server/app/batch_strategy.py
+from datetime import datetime, timedelta
+from decimal import Decimal
+from itertools import chain
+from typing import NamedTuple, Optional
+
+import numpy as np
+from sqlalchemy import case, insert, select, update
+from sqlalchemy.orm import Session
+
+from . import models, strategy, rollups, metrics
+from .hvac_dispatcher import hvac_dispatcher
+
+
+class ZonePlan(NamedTuple):
+    """批量引擎对单个分区的计算结果。"""
+    zone_id: str
+    vote_count: int
+    avg_score: Optional[float]
+    current_temp: Decimal                # 模拟物理变化后的当前温度（控制器报告室温时为库中的值）
+    recommended_temp: Optional[float]    # 新的推荐温度，None 表示本轮不更新
+
+
+class BatchResult(NamedTuple):
+    zones: int
+    updated: list            # 推荐温度发生变化的分区ID
+    skipped: int             # 票数不足 MIN_VALID_VOTES_TO_CALCULATE 的分区数
+
+
+def _simulate_current_temps(current_temps: list, recommended_temps: list) -> list[Decimal]:
+    """
+    strategy._simulate_physical_temperature_change 的向量化版本：当前温度向推荐温度靠近温差的10%，单次最多0.2°C。
+    温度按输入中最多的小数位数 p 换算成以 10^-p °C 为单位的整数，温差的10%恰好是以 10^-(p+1) °C 为单位的同一个整数，
+    因此结果与标量路径的 Decimal 运算完全相同（不要求温度是0.1的倍数，负的温差也不需要取整）。
+    """
+    decimals = [Decimal(value) for value in chain(current_temps, recommended_temps)]
+    places = max([1] + [-value.as_tuple().exponent for value in decimals])
+    # 小数位数很多时换成 Python 整数，避免 int64 溢出
+    dtype = np.int64 if places <= 15 else object
+    scaled = np.array([int(value.scaleb(places)) for value in decimals], dtype=dtype)
+    current, recommended = scaled[:len(current_temps)], scaled[len(current_temps):]
+    # 以 10^-(p+1) °C 为单位：温差的10% = recommended - current，0.2°C = 2 * 10^p
+    limit = 2 * 10 ** places
+    simulated = current * 10 + np.clip(recommended - current, -limit, limit)
+    return [Decimal(int(value)).scaleb(-(places + 1)) for value in simulated]
+
+
+def plan_all_zones(db: Session, now: datetime = None, zone_ids: list = None) -> list[ZonePlan]:
+    """
+    【性能优化】一次性计算全部分区（或 zone_ids 指定的分区）的新温度（只读，不写库）。
+
+    - 一条查询取出时间窗内的全部投票，并在SQL中关联 user_activity 得到每票是否来自固定用户；
+    - 用 NumPy bincount 按分区分组求票数和加权平均分，再向量化计算 alpha、限幅和新推荐温度；
+    - 每一步与 calculate_recommended_temperature 使用相同的运算顺序，结果逐位一致。
+    """
+    now = now or datetime.utcnow()
+    zone_query = select(models.Zone.zone_id, models.Zone.current_temp, models.Zone.recommended_temp)
+    vote_query = select(models.Vote.zone_id, models.Vote.vote_value,
+                        case((models.UserActivity.frequent_since < now, 1), else_=0))
+    if zone_ids is not None:
+        zone_query = zone_query.where(models.Zone.zone_id.in_(zone_ids))
+        vote_query = vote_query.where(models.Vote.zone_id.in_(zone_ids))
+    zones = sorted(db.execute(zone_query).all(), key=lambda zone: zone.zone_id)
+    if not zones:
+        return []
+    sorted_ids = np.array([zone.zone_id for zone in zones])
+
+    # --- 一次查询加载全部有效投票及其用户类型 ---
+    time_threshold = now - timedelta(minutes=strategy.VOTE_VALID_DURATION_MINUTES)
+    votes = db.execute(
+        vote_query
+        .outerjoin(models.UserActivity, models.UserActivity.user_id == models.Vote.user_id)
+        .where(models.Vote.created_at >= time_threshold)
+    ).all()
+
+    # --- 按分区分组求和（与滑动窗口聚合器的 WindowStats 字段一一对应） ---
+    size = len(zones)
+    if votes:
+        vote_zones, vote_values, vote_frequent = zip(*votes)
+        index = np.searchsorted(sorted_ids, np.array(vote_zones))
+        values = np.array(vote_values, dtype=np.float64)
+        frequent = np.array(vote_frequent, dtype=bool)
+        count = np.bincount(index, minlength=size)
+        value_sum = np.bincount(index, weights=values, minlength=size)
+        frequent_count = np.bincount(index[frequent], minlength=size)
+        frequent_value_sum = np.bincount(index[frequent], weights=values[frequent], minlength=size)
+    else:
+        count = frequent_count = np.zeros(size, dtype=np.int64)
+        value_sum = frequent_value_sum = np.zeros(size)
+
+    # --- 加权平均分 (S_zone)，同 strategy._weighted_average ---
+    normal_count = count - frequent_count
+    normal_value_sum = value_sum - frequent_value_sum
+    total_weight = normal_count * strategy.WEIGHT_NORMAL_USER + frequent_count * strategy.WEIGHT_FREQUENT_USER
+    weighted_vote_sum = (normal_value_sum * strategy.WEIGHT_NORMAL_USER
+                         + frequent_value_sum * strategy.WEIGHT_FREQUENT_USER)
+    has_weight = total_weight != 0
+    avg_score = np.divide(weighted_vote_sum, total_weight, out=np.zeros(size), where=has_weight)
+
+    # --- 模拟物理温度变化，同 strategy._simulate_physical_temperature_change ---
+    if strategy.simulates_room_temperature():
+        simulated = _simulate_current_temps([zone.current_temp for zone in zones],
+                                           [zone.recommended_temp for zone in zones])
+    else:
+        simulated = [zone.current_temp for zone in zones]
+
+    # --- alpha、限幅和新推荐温度，同 strategy._compute_new_temp ---
+    alpha = np.where(avg_score < -0.5, 0.7, strategy.TEMPERATURE_ADJUSTMENT_FACTOR)
+    change = np.clip(alpha * avg_score, -strategy.MAX_TEMP_CHANGE_PER_CYCLE, strategy.MAX_TEMP_CHANGE_PER_CYCLE)
+    new_temp = np.array([float(zone.recommended_temp) for zone in zones]) + change
+    eligible = (count >= strategy.MIN_VALID_VOTES_TO_CALCULATE) & has_weight
+
+    plans = []
+    for i, zone in enumerate(zones):
+        new_recommended = None
+        # 是否变化的判断需要精确的 Decimal 比较，只对票数达标的分区逐个进行
+        if eligible[i] and strategy._setpoint_changed(zone.recommended_temp, float(new_temp[i])):
+            new_recommended = round(float(new_temp[i]), 1)
+        plans.append(ZonePlan(
+            zone_id=zone.zone_id,
+            vote_count=int(count[i]),
+            avg_score=float(avg_score[i]) if has_weight[i] else None,
+            current_temp=simulated[i],
+            recommended_temp=new_recommended
+        ))
+    return plans
+
+
+def calculate_zones_batch(db: Session, now: datetime = None, zone_ids: list = None) -> BatchResult:
+    """
+    批量版本的 calculate_recommended_temperature：计算全部分区（或 zone_ids 指定的分区），
+    把所有变化的分区、历史记录和汇总表在一个事务中写入，提交后把新设定值交给HVAC下发队列。
+    """
+    now = now or datetime.utcnow()
+    plans = plan_all_zones(db, now, zone_ids)
+    changed = [plan for plan in plans if plan.recommended_temp is not None]
+    if changed:
+        # 控制器报告室温时不写 current_temp，避免用计划开始时读到的旧值覆盖模拟建筑刚写回的室温
+        columns = ("current_temp", "recommended_temp") if strategy.simulates_room_temperature() else ("recommended_temp",)
+        db.execute(update(models.Zone), [
+            {"zone_id": plan.zone_id, **{column: getattr(plan, column) for column in columns}}
+            for plan in changed
+        ])
+        db.execute(insert(models.History), [
+            {"zone_id": plan.zone_id, "current_temp": plan.current_temp,
+             "recommended_temp": plan.recommended_temp, "timestamp": now}
+            for plan in changed
+        ])
+        rollups.record_history(db, [
+            (plan.zone_id, now, plan.current_temp, plan.recommended_temp) for plan in changed
+        ])
+        db.commit()
+
+    for plan in changed:
+        hvac_dispatcher.submit(plan.zone_id, plan.recommended_temp)
+    skipped = sum(1 for plan in plans if plan.vote_count < strategy.MIN_VALID_VOTES_TO_CALCULATE)
+    metrics.RECOMPUTE_TOTAL.labels("batch", "updated").inc(len(changed))
+    metrics.RECOMPUTE_TOTAL.labels("batch", "skipped_min_votes").inc(skipped)
+    metrics.RECOMPUTE_TOTAL.labels("batch", "unchanged").inc(len(plans) - len(changed) - skipped)
+    return BatchResult(zones=len(plans), updated=[plan.zone_id for plan in changed], skipped=skipped)
+
+
+def verify_batch_engine(db: Session) -> dict:
+    """
+    【校验工具】用逐分区的标量实现（_sql_vote_score、_simulate_physical_temperature_change、
+    _compute_new_temp）重新计算每个分区，与批量引擎的结果比较。
+    返回不一致的分区 {zone_id: (批量结果, 逐分区结果)}，为空表示两者完全一致。不写库。
+    """
+    mismatches = {}
+    plans = {plan.zone_id: plan for plan in plan_all_zones(db)}
+    for zone in db.query(models.Zone).all():
+        vote_count, avg_score = strategy._sql_vote_score(db, zone.zone_id)
+        # 在游离的副本上模拟，不修改会话中的分区对象
+        simulated = models.Zone(current_temp=zone.current_temp, recommended_temp=zone.recommended_temp)
+        if strategy.simulates_room_temperature():
+            strategy._simulate_physical_temperature_change(simulated)
+        new_recommended = None
+        if vote_count >= strategy.MIN_VALID_VOTES_TO_CALCULATE and avg_score is not None:
+            new_temp = strategy._compute_new_temp(zone.recommended_temp, avg_score)
+            if strategy._setpoint_changed(zone.recommended_temp, new_temp):
+                new_recommended = round(new_temp, 1)
+        expected = ZonePlan(zone.zone_id, vote_count, avg_score, simulated.current_temp, new_recommended)
+        if plans.get(zone.zone_id) != expected:
+            mismatches[zone.zone_id] = (plans.get(zone.zone_id), expected)
+    return mismatches
@@ -1,6 +1,10 @@
 # file: server/app/crud.py
 from sqlalchemy.orm import Session
-from . import models, schemas
+from sqlalchemy import func, select, text, update
+from datetime import datetime, timedelta
+from typing import NamedTuple
+from . import models, schemas, activity, rollups, strategy, metrics, vote_policy
+from .database import dialect_insert
 from uuid import UUID
 
 # --- User CRUD ---
@@ -18,13 +22,116 @@ def create_user(db: Session, user_id: UUID):
 
 # --- Vote CRUD ---
 def create_vote(db: Session, vote: schemas.VoteCreate):
-    # 创建一条新的投票记录
-    db_vote = models.Vote(
-        user_id=vote.user_id,
-        zone_id=vote.zone_id,
-        vote_value=vote.vote_value
+    # 【性能优化】一个事务写入一票：用户upsert（新用户插入、老用户刷新最近活跃时间）+ INSERT ... RETURNING，
+    # 派生数据在同一事务中维护，只提交一次；取代原先的查用户、建用户/更新活跃时间、写投票三次提交
+    return bulk_create_votes(db, [vote])[0]
+
+class WrittenVote(NamedTuple):
+    # 与 INSERT ... RETURNING 的行字段相同，用于“最新一票生效”模式下被更新的投票
+    vote_id: int
+    user_id: UUID
+    zone_id: str
+    vote_value: int
+    created_at: datetime
+
+def record_vote_writes(db: Session, votes: list[tuple], replaced: list[tuple] = ()):
+    # 在写入投票的同一个事务中增量维护派生数据（不提交）：用户活跃度计数、分区分钟/小时汇总
+    # votes 为新插入投票的 (user_id, zone_id, vote_value, created_at) 列表；
+    # replaced 为被改写投票的 (旧值, 新值) 列表，格式同上：不增加用户的总票数，汇总表中旧值扣减、新值累加
+    activity.record_votes(db, [(user_id, created_at) for user_id, _, _, created_at in votes])
+    rollups.record_votes(
+        db,
+        [(zone_id, vote_value, created_at) for _, zone_id, vote_value, created_at in votes]
+        + [(new[1], new[2], new[3]) for _, new in replaced],
+        removed=[(old[1], old[2], old[3]) for old, _ in replaced]
     )
-    db.add(db_vote)
+
+# --- 批量写入 ---
+def upsert_users(db: Session, user_ids):
+    # 一条语句批量插入新用户，已存在的用户只刷新最近活跃时间（不提交）
+    # 按ID排序，避免并发批量写入时因加锁顺序不同而死锁
+    unique_ids = sorted(set(user_ids), key=str)
+    if not unique_ids:
+        return
+    stmt = dialect_insert(db, models.User).values([{"user_id": user_id} for user_id in unique_ids])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[models.User.user_id],
+        set_={"last_seen_at": func.now()}
+    )
+    db.execute(stmt)
+
+# 最新一票生效模式下按 (用户, 分区) 加的事务级咨询锁的命名空间（两个int参数的形式，与单个bigint键的leader锁互不冲突）
+_LATEST_WINS_LOCK_NAMESPACE = 0x7476   # "tv"
+
+def replace_window_votes(db: Session, votes: list[schemas.VoteCreate]):
+    """
+    【最新一票生效】同一用户在时间窗内对同一分区的重复投票改为更新已有的一票（投票值和时间），不提交。
+    同一批中的重复投票只保留最后一票。返回 (仍需插入的投票, 被更新投票的 (旧行, 新行) 列表)。
+    PostgreSQL 下先按 (用户, 分区) 加事务级咨询锁，并发写入同一 (用户, 分区) 的事务依次执行，
+    后执行的事务能看到先提交的那一票并更新它，不会各自插入一票。
+    """
+    latest = {}
+    for vote in votes:
+        latest[(vote.user_id, vote.zone_id)] = vote
+    if db.get_bind().dialect.name == "postgresql":
+        # 按键排序加锁，避免两个批次以相反的顺序加锁而死锁；锁在事务提交或回滚时释放
+        db.execute(
+            text("SELECT pg_advisory_xact_lock(:namespace, hashtext(key)) "
+                 "FROM unnest(CAST(:keys AS text[])) AS key ORDER BY key"),
+            {"namespace": _LATEST_WINS_LOCK_NAMESPACE,
+             "keys": [f"{user_id}:{zone_id}" for user_id, zone_id in latest]}
+        )
+    # 投票时间与 INSERT 的默认值 func.now() 取自同一个数据库时钟，不受各worker本机时钟偏差的影响
+    now = db.execute(select(func.now())).scalar().replace(tzinfo=None)
+    threshold = now - timedelta(minutes=strategy.VOTE_VALID_DURATION_MINUTES)
+    rows = db.execute(
+        select(models.Vote.vote_id, models.Vote.user_id, models.Vote.zone_id,
+               models.Vote.vote_value, models.Vote.created_at)
+        .where(models.Vote.user_id.in_({user_id for user_id, _ in latest}),
+               models.Vote.zone_id.in_({zone_id for _, zone_id in latest}),
+               models.Vote.created_at >= threshold)
+        .order_by(models.Vote.created_at, models.Vote.vote_id)
+    ).all()
+    # 时间窗内已有多票时（例如开启该模式之前写入的），更新最近的一票
+    existing = {(row.user_id, row.zone_id): row for row in rows if (row.user_id, row.zone_id) in latest}
+    if not existing:
+        return list(latest.values()), []
+
+    replaced = sorted(
+        ((old, WrittenVote(old.vote_id, old.user_id, old.zone_id, latest[key].vote_value, now))
+         for key, old in existing.items()),
+        key=lambda pair: pair[0].vote_id   # 按主键顺序加锁，避免死锁
+    )
+    db.execute(update(models.Vote), [
+        {"vote_id": new.vote_id, "vote_value": new.vote_value, "created_at": new.created_at} for _, new in replaced
+    ])
+    return [vote for key, vote in latest.items() if key not in existing], replaced
+
+def bulk_create_votes(db: Session, votes: list[schemas.VoteCreate]):
+    # 一次用户upsert + 一条多行INSERT写入全部投票，并在同一个事务中提交
+    # 返回 (vote_id, user_id, zone_id, vote_value, created_at) 行，供聚合器和调度器使用
+    if not votes:
+        return []
+    upsert_users(db, [vote.user_id for vote in votes])
+    replaced = []
+    if vote_policy.VOTE_LATEST_WINS:
+        votes, replaced = replace_window_votes(db, votes)
+    rows = []
+    if votes:
+        stmt = (
+            dialect_insert(db, models.Vote)
+            .values([
+                {"user_id": vote.user_id, "zone_id": vote.zone_id, "vote_value": vote.vote_value}
+                for vote in votes
+            ])
+            .returning(models.Vote.vote_id, models.Vote.user_id, models.Vote.zone_id,
+                       models.Vote.vote_value, models.Vote.created_at)
+        )
+        rows = db.execute(stmt).all()
+    record_vote_writes(db, [(row.user_id, row.zone_id, row.vote_value, row.created_at) for row in rows],
+                       [((old.user_id, old.zone_id, old.vote_value, old.created_at),
+                         (new.user_id, new.zone_id, new.vote_value, new.created_at)) for old, new in replaced])
     db.commit()
-    db.refresh(db_vote)
-    return db_vote
\ No newline at end of file
+    metrics.VOTES_TOTAL.labels("inserted").inc(len(rows))
+    metrics.VOTES_TOTAL.labels("replaced").inc(len(replaced))
+    return [new for _, new in replaced] + rows
@@ -1,14 +1,51 @@
 # file: server/app/database.py
 import os
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.dialects import postgresql, sqlite
 from dotenv import load_dotenv
 
 load_dotenv() # 加载.env文件中的变量
 
-DATABASE_URL = f"postgresql://{os.getenv('POSTGRES_USER')}:{os.getenv('POSTGRES_PASSWORD')}@db:5432/{os.getenv('POSTGRES_DB')}"
+# 默认连接 docker-compose 中的 db 服务；设置 DATABASE_URL 可改用其它数据库，
+# 例如压测时使用本地 SQLite 文件（sqlite:///bench.db）或临时的 PostgreSQL 数据库
+DATABASE_URL = os.getenv("DATABASE_URL") or (
+    f"postgresql+psycopg2://{os.getenv('POSTGRES_USER')}:{os.getenv('POSTGRES_PASSWORD')}@db:5432/{os.getenv('POSTGRES_DB')}"
+)
+IS_SQLITE = make_url(DATABASE_URL).get_backend_name() == "sqlite"
 
-engine = create_engine(DATABASE_URL)
+# 连接池配置：同步和异步引擎共用
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+# 是否启用异步请求路径（asyncpg驱动 + 异步会话），默认仍使用同步路径
+DB_ASYNC_MODE = os.getenv("DB_ASYNC_MODE", "false").lower() in ("1", "true", "yes")
+
+# SQLite 连接需要在多个线程（请求线程池、后台调度器）间共享，且不使用连接池大小配置
+if IS_SQLITE:
+    _engine_options = {"connect_args": {"check_same_thread": False, "timeout": 30}}
+else:
+    _engine_options = {"pool_size": DB_POOL_SIZE, "max_overflow": DB_MAX_OVERFLOW}
+
+engine = create_engine(DATABASE_URL, **_engine_options)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base = declarative_base()
\ No newline at end of file
+Base = declarative_base()
+
+# 异步引擎只在异步模式下创建，这样同步部署不需要安装 asyncpg
+async_engine = None
+AsyncSessionLocal = None
+if DB_ASYNC_MODE:
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+    ASYNC_DATABASE_URL = make_url(DATABASE_URL).set(
+        drivername="sqlite+aiosqlite" if IS_SQLITE else "postgresql+asyncpg"
+    ).render_as_string(hide_password=False)
+    async_engine = create_async_engine(ASYNC_DATABASE_URL, **_engine_options)
+    # expire_on_commit=False：提交后仍可直接读取对象属性，避免在异步上下文中触发隐式IO
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+def dialect_insert(db: Session, model):
+    # 根据当前数据库方言选择支持 ON CONFLICT 的 insert 构造器
+    dialect = sqlite if db.get_bind().dialect.name == "sqlite" else postgresql
+    return dialect.insert(model)
@@ -0,0 +1,47 @@
+# file: server/app/downsample.py
+
+# 时间序列降采样工具，用于把大量历史记录压缩成前端图表需要的点数。
+
+def lttb_indices(xs: list[float], series: list[list[float]], threshold: int) -> list[int]:
+    """
+    Largest-Triangle-Three-Buckets 降采样，返回保留下来的点的下标（升序）。
+
+    xs 为横坐标（例如时间戳秒数），series 为共用横坐标的一条或多条纵坐标序列。
+    多条序列时，每个候选点的三角形面积取各序列面积之和，从而同时保留每条曲线的拐点。
+    首尾两个点总是保留；点数不超过 threshold 时原样返回全部下标。
+    """
+    n = len(xs)
+    if n <= threshold:
+        return list(range(n))
+    if threshold < 3:
+        raise ValueError("threshold 至少为3")
+
+    indices = [0]
+    bucket_size = (n - 2) / (threshold - 2)
+    selected = 0
+    for bucket in range(threshold - 2):
+        start = int(bucket * bucket_size) + 1
+        end = int((bucket + 1) * bucket_size) + 1
+
+        # 下一个桶的平均点，作为三角形的第三个顶点
+        next_start, next_end = end, min(int((bucket + 2) * bucket_size) + 1, n)
+        if next_start >= next_end:
+            next_start, next_end = n - 1, n
+        count = next_end - next_start
+        avg_x = sum(xs[next_start:next_end]) / count
+        avg_ys = [sum(ys[next_start:next_end]) / count for ys in series]
+
+        ax = xs[selected]
+        best, best_area = start, -1.0
+        for i in range(start, end):
+            area = 0.0
+            for ys, avg_y in zip(series, avg_ys):
+                ay = ys[selected]
+                area += abs((ax - avg_x) * (ys[i] - ay) - (ax - xs[i]) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = i, area
+        indices.append(best)
+        selected = best
+
+    indices.append(n - 1)
+    return indices
@@ -0,0 +1,267 @@
+# file: server/app/events.py
+import asyncio
+import json
+import logging
+import select
+import threading
+from datetime import timezone
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from . import models, strategy
+from .database import engine
+from .zone_cache import zone_cache
+from .shared_state import shared_zone_table
+
+logger = logging.getLogger(__name__)
+
+# PostgreSQL LISTEN/NOTIFY 频道名，用于把分区更新广播给所有gunicorn worker
+EVENTS_CHANNEL = "thermasense_events"
+# 投票写入后广播分区快照缓存失效的频道（投票不一定触发推送，但 /snapshot 中的票数已经变化）
+INVALIDATE_CHANNEL = "thermasense_invalidate"
+# 每条失效消息最多携带的分区数（NOTIFY 消息不能超过 8000 字节）
+_ZONES_PER_MESSAGE = 100
+# 每个订阅者最多积压的消息数，慢客户端超过后会丢弃最旧的消息
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+def zone_state(db: Session, zone_id: str):
+    """读取分区当前对外推送的完整状态：温度、投票统计和最新的一条历史记录。"""
+    zone = db.get(models.Zone, zone_id)
+    if zone is None:
+        return None
+    state = {
+        "name": zone.name,
+        "current_temp": float(zone.current_temp),
+        "recommended_temp": float(zone.recommended_temp),
+        "stats": strategy.vote_aggregator.vote_counts(zone_id),
+    }
+    latest = (
+        db.query(models.History.timestamp, models.History.current_temp, models.History.recommended_temp)
+        .filter(models.History.zone_id == zone_id)
+        .order_by(models.History.timestamp.desc())
+        .first()
+    )
+    if latest is not None:
+        state["history_point"] = {
+            "t": int(latest.timestamp.replace(tzinfo=timezone.utc).timestamp() * 1000),
+            "current_temp": latest.current_temp,
+            "recommended_temp": latest.recommended_temp,
+        }
+    return state
+
+
+def _table_fields(changes: dict) -> dict:
+    """推送消息中变化的字段对应的共享分区状态表字段（stats 即表中的 votes，history_point 不在表中）。"""
+    fields = {key: changes[key] for key in ("name", "current_temp", "recommended_temp") if key in changes}
+    if "stats" in changes:
+        fields["votes"] = changes["stats"]
+    return fields
+
+
+class EventBroker:
+    """
+    【性能优化】分区状态推送中心，取代客户端每5秒轮询。
+
+    - publish_zone_update(): 重算完成或票数变化后读取分区状态，写入共享分区状态表，并与上次推送的状态比较，只发送变化的字段；
+    - PostgreSQL 下通过 NOTIFY 发布（随事务提交生效），每个worker的监听线程 LISTEN 后把变化写入本机的共享分区状态表、
+      失效快照缓存并分发给本进程的订阅者，因此无论重算发生在哪个worker（或哪台主机），所有worker上的状态和SSE连接都能更新；
+      其它数据库只在本进程内分发；
+    - invalidate_zones(): 投票写入后失效所有worker上这些分区的快照缓存（PostgreSQL 下经 NOTIFY 广播）；
+    - subscribe(): SSE连接注册一个 asyncio 队列，空闲连接不产生任何数据库查询；
+    - listen(): 其它模块可以在同一条监听连接上订阅自己的频道（例如 sharding 的重算路由）。
+    """
+
+    def __init__(self, bind=engine, channel: str = EVENTS_CHANNEL):
+        self.bind = bind
+        self.channel = channel
+        self.use_notify = bind.dialect.name == "postgresql"
+        self._lock = threading.Lock()
+        self._subscribers: dict = {}      # asyncio.Queue -> (event loop, zone_id 或 None 表示全部分区)
+        self._last_published: dict = {}   # zone_id -> 上次推送的完整状态
+        # 频道 -> 处理函数（在监听线程中调用）
+        self._handlers = {channel: self._dispatch, INVALIDATE_CHANNEL: self._invalidate}
+        self._thread = None
+        self._stopping = threading.Event()
+        self.published_total = 0
+        self.delivered_total = 0
+        self.invalidations_sent = 0
+        self.invalidations_received = 0
+
+    # --- 发布 ---
+    def publish_zone_update(self, db: Session, zone_id: str):
+        state = zone_state(db, zone_id)
+        if state is None:
+            return
+        # 先写入本机的共享分区状态表，本机worker的 /status、/stats、/snapshot 立即读到新状态；
+        # 其它主机上的表由各自的监听线程在 _dispatch 中按消息中的变化更新
+        shared_zone_table.write(zone_id, name=state["name"], current_temp=state["current_temp"],
+                                recommended_temp=state["recommended_temp"], votes=state["stats"])
+        with self._lock:
+            previous = self._last_published.get(zone_id, {})
+            changes = {key: value for key, value in state.items() if previous.get(key) != value}
+            self._last_published[zone_id] = state
+        if not changes:
+            return
+        message = json.dumps({"zone_id": zone_id, "changes": changes}, ensure_ascii=False)
+        if self.use_notify:
+            db.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": self.channel, "payload": message})
+            db.commit()
+        else:
+            self._dispatch(message)
+        with self._lock:
+            self.published_total += 1
+
+    def publish_changes(self, db: Session, updates: dict):
+        """
+        发布不经过重算的字段变化 {zone_id: {字段: 值}}（字段与 zone_state() 相同，例如模拟建筑写回的 current_temp），
+        不再逐个分区读取完整状态。与 publish_zone_update 一样写入本机的共享分区状态表并推送给所有worker。
+        """
+        if not updates:
+            return
+        shared_zone_table.write_many({zone_id: _table_fields(changes) for zone_id, changes in updates.items()})
+        messages = []
+        with self._lock:
+            for zone_id, changes in updates.items():
+                previous = self._last_published.get(zone_id)
+                if previous is not None:
+                    self._last_published[zone_id] = {**previous, **changes}
+                messages.append(json.dumps({"zone_id": zone_id, "changes": changes}, ensure_ascii=False))
+        if self.use_notify:
+            db.execute(text("SELECT pg_notify(:channel, payload) FROM unnest(CAST(:payloads AS text[])) AS payload"),
+                       {"channel": self.channel, "payloads": messages})
+            db.commit()
+        else:
+            for message in messages:
+                self._dispatch(message)
+        with self._lock:
+            self.published_total += len(messages)
+
+    def invalidate_zones(self, zone_ids):
+        """投票写入后调用：立即失效本进程的分区快照，并广播给其它worker；广播失败时由缓存的TTL兜底。"""
+        zone_ids = list(zone_ids)
+        if not zone_ids:
+            return
+        zone_cache.invalidate(*zone_ids)
+        if not self.use_notify:
+            return
+        try:
+            with self.bind.connect() as connection:
+                for start in range(0, len(zone_ids), _ZONES_PER_MESSAGE):
+                    connection.execute(text("SELECT pg_notify(:channel, :payload)"), {
+                        "channel": INVALIDATE_CHANNEL,
+                        "payload": json.dumps(zone_ids[start:start + _ZONES_PER_MESSAGE], ensure_ascii=False),
+                    })
+                connection.commit()
+        except Exception:
+            logger.exception("广播快照缓存失效失败", extra={"zones": len(zone_ids)})
+            return
+        with self._lock:
+            self.invalidations_sent += len(zone_ids)
+
+    def _invalidate(self, payload: str):
+        # 所有worker（包括发送方自己）都会收到，重复失效没有副作用
+        zone_ids = json.loads(payload)
+        zone_cache.invalidate(*zone_ids)
+        with self._lock:
+            self.invalidations_received += len(zone_ids)
+
+    # --- 订阅 ---
+    def subscribe(self, zone_id: str = None) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers[queue] = (asyncio.get_running_loop(), zone_id)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        with self._lock:
+            self._subscribers.pop(queue, None)
+
+    def _dispatch(self, message: str):
+        payload = json.loads(message)
+        zone_id = payload["zone_id"]
+        # 分区状态已变化（可能来自其它worker或其它主机的重算）：把变化的字段写入本机的共享分区状态表，
+        # 并失效本进程的快照缓存和分区列表
+        fields = _table_fields(payload.get("changes", {}))
+        if fields:
+            shared_zone_table.write(zone_id, **fields)
+        zone_cache.invalidate_zone(zone_id)
+        with self._lock:
+            targets = [
+                (queue, loop) for queue, (loop, wanted) in self._subscribers.items()
+                if wanted is None or wanted == zone_id
+            ]
+            self.delivered_total += len(targets)
+        for queue, loop in targets:
+            loop.call_soon_threadsafe(self._offer, queue, message)
+
+    @staticmethod
+    def _offer(queue: asyncio.Queue, message: str):
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(message)
+
+    # --- 跨worker监听 ---
+    def listen(self, channel: str, handler):
+        """在监听连接上订阅另一个频道，需要在 start() 之前调用；handler 接收消息内容（字符串）。"""
+        self._handlers[channel] = handler
+
+    def start(self):
+        if not self.use_notify or self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._listen, name="event-listener", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join()
+        self._thread = None
+
+    def _listen(self):
+        while not self._stopping.is_set():
+            try:
+                connection = self.bind.raw_connection()
+            except Exception as exc:
+                logger.warning("事件监听连接失败，稍后重试", extra={"error": str(exc)})
+                self._stopping.wait(5)
+                continue
+            try:
+                dbapi_connection = connection.dbapi_connection
+                dbapi_connection.autocommit = True
+                cursor = dbapi_connection.cursor()
+                for channel in self._handlers:
+                    cursor.execute(f"LISTEN {channel}")
+                while not self._stopping.is_set():
+                    # 最多阻塞1秒，以便及时响应 stop()
+                    if select.select([dbapi_connection], [], [], 1.0) == ([], [], []):
+                        continue
+                    dbapi_connection.poll()
+                    while dbapi_connection.notifies:
+                        notify = dbapi_connection.notifies.pop(0)
+                        try:
+                            self._handlers[notify.channel](notify.payload)
+                        except Exception:
+                            logger.exception("处理跨worker消息失败", extra={"channel": notify.channel})
+            except Exception as exc:
+                logger.warning("事件监听中断，正在重连", extra={"error": str(exc)})
+            finally:
+                connection.invalidate()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "cross_worker": self.use_notify,
+                "subscribers": len(self._subscribers),
+                "published_total": self.published_total,
+                "delivered_total": self.delivered_total,
+                "invalidations_sent": self.invalidations_sent,
+                "invalidations_received": self.invalidations_received,
+            }
+
+
+# 当前进程使用的推送中心，由 main.py 的 lifespan 启动和停止
+event_broker = EventBroker()
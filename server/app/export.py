@@ -0,0 +1,202 @@
+# file: server/app/export.py
+"""
+【管理功能】votes / history 原始数据的流式批量导出（CSV 或 NDJSON，可选 gzip）。
+
+- 用服务端游标（yield_per）分块读取，每块编码后立即输出，内存占用与导出的总行数无关；
+- 按 (时间, 主键) 排序并以此作为续传游标：中断后用最后收到的一行的时间和ID（或CLI记录的游标）继续，不会重复或遗漏
+  （“最新一票生效”模式下导出期间被改写的投票时间会变化，可能再次出现在后面）；
+- 支持按分区和时间范围过滤，查询走 (zone_id, 时间) / (时间) 索引；
+- 设置 EXPORT_DATABASE_URL（例如只读副本）后导出改从该库读取，不占用主库的连接池。
+
+管理接口：GET /admin/export/{votes|history}；命令行（在 server/ 目录下）:
+    python -m app.export votes --start 2026-07-01 --end 2026-10-01 --format ndjson --gzip -o votes.ndjson.gz
+    python -m app.export history --zone-id zone-a --zone-id zone-b -o history.csv --resume
+"""
+import argparse
+import csv
+import gzip
+import io
+import json
+import os
+import sys
+from datetime import datetime
+from decimal import Decimal
+from typing import Callable, Iterator, Optional
+from uuid import UUID
+
+from sqlalchemy import create_engine, select, tuple_
+from sqlalchemy.orm import Session, sessionmaker
+
+from . import models
+from .database import SessionLocal
+
+# --- 导出配置 ---
+# 服务端游标每次读取的行数，也是每个输出块包含的行数
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "10000"))
+# 导出使用的数据库（例如只读副本），默认与应用相同
+EXPORT_DATABASE_URL = os.getenv("EXPORT_DATABASE_URL")
+
+FORMATS = ("csv", "ndjson")
+
+# 表名 -> (模型, 时间列, 主键列)
+EXPORT_TABLES = {
+    "votes": (models.Vote, models.Vote.created_at, models.Vote.vote_id),
+    "history": (models.History, models.History.timestamp, models.History.id),
+}
+
+_export_sessions = None
+
+
+def export_session() -> Session:
+    """导出专用的会话：配置了 EXPORT_DATABASE_URL 时连接该库，否则使用应用的连接池。"""
+    global _export_sessions
+    if EXPORT_DATABASE_URL is None:
+        return SessionLocal()
+    if _export_sessions is None:
+        _export_sessions = sessionmaker(bind=create_engine(EXPORT_DATABASE_URL, pool_size=2, max_overflow=0))
+    return _export_sessions()
+
+
+def columns(table: str) -> list[str]:
+    model = EXPORT_TABLES[table][0]
+    return [column.name for column in model.__table__.columns]
+
+
+def encode_cursor(timestamp: datetime, row_id: int) -> str:
+    """续传游标 "<时间>,<主键>"：即已收到的最后一行的时间列和主键，客户端可以直接由最后一行拼出。"""
+    return f"{timestamp.isoformat()},{row_id}"
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        timestamp, row_id = cursor.rsplit(",", 1)
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except ValueError as exc:
+        raise ValueError(f"无效的续传游标: {cursor}") from exc
+
+
+def iter_chunks(db: Session, table: str, zone_ids: Optional[list[str]] = None,
+                start: datetime = None, end: datetime = None, cursor: str = None,
+                chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[list]:
+    """按 (时间, 主键) 顺序分块读取 [start, end) 内的原始记录，每块为一个行列表。"""
+    model, ts_column, pk = EXPORT_TABLES[table]
+    query = select(*model.__table__.columns).order_by(ts_column, pk)
+    if zone_ids:
+        query = query.where(model.zone_id.in_(zone_ids))
+    if start is not None:
+        query = query.where(ts_column >= start)
+    if end is not None:
+        query = query.where(ts_column < end)
+    if cursor:
+        after_ts, after_id = decode_cursor(cursor)
+        # 行值比较：同一时刻的多行按主键继续
+        query = query.where(ts_column >= after_ts, tuple_(ts_column, pk) > tuple_(after_ts, after_id))
+    result = db.execute(query, execution_options={"yield_per": chunk_size})
+    yield from result.partitions()
+
+
+def _json_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (Decimal, UUID)):
+        return str(value)
+    return value
+
+
+def encode_chunk(rows: list, names: list[str], fmt: str, header: bool = False) -> bytes:
+    """把一块行编码为 CSV（header 时带表头）或 NDJSON 字节串。"""
+    if fmt == "ndjson":
+        return "".join(
+            json.dumps(dict(zip(names, map(_json_value, row))), ensure_ascii=False) + "\n" for row in rows
+        ).encode()
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(names)
+    writer.writerows(rows)
+    return buffer.getvalue().encode()
+
+
+def stream_export(table: str, fmt: str = "csv", compress: bool = False, zone_ids: Optional[list[str]] = None,
+                  start: datetime = None, end: datetime = None, cursor: str = None,
+                  chunk_size: int = EXPORT_CHUNK_SIZE, on_chunk: Callable[[str], None] = None,
+                  session_factory: Callable[[], Session] = export_session) -> Iterator[bytes]:
+    """
+    逐块输出导出内容；compress 时每块是一个独立的gzip成员，拼接后仍是合法的gzip文件，中断时已收到的块也完整可读。
+    每块输出后用该块最后一行的游标调用 on_chunk，调用方可以记录下来用于续传（续传时 CSV 不再重复表头）。
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"不支持的格式: {fmt}")
+    names = columns(table)
+    ts_index, pk_index = names.index(EXPORT_TABLES[table][1].name), names.index(EXPORT_TABLES[table][2].name)
+    header = fmt == "csv" and cursor is None
+    db = session_factory()
+    try:
+        if header:
+            data = encode_chunk([], names, fmt, header=True)
+            yield gzip.compress(data) if compress else data
+        for rows in iter_chunks(db, table, zone_ids, start, end, cursor, chunk_size):
+            data = encode_chunk(rows, names, fmt, header=False)
+            yield gzip.compress(data, compresslevel=6) if compress else data
+            if on_chunk:
+                on_chunk(encode_cursor(rows[-1][ts_index], rows[-1][pk_index]))
+    finally:
+        db.close()
+
+
+def _load_progress(progress_path: str) -> tuple[Optional[str], int]:
+    # 返回 (续传游标, 游标对应的输出文件长度)
+    if not os.path.exists(progress_path):
+        return None, 0
+    with open(progress_path) as f:
+        progress = json.load(f)
+    return progress["cursor"], progress["offset"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="流式导出 votes / history 原始数据")
+    parser.add_argument("table", choices=sorted(EXPORT_TABLES))
+    parser.add_argument("--format", choices=FORMATS, default="csv")
+    parser.add_argument("--gzip", action="store_true", help="gzip 压缩输出")
+    parser.add_argument("--zone-id", action="append", help="只导出指定分区，可重复指定")
+    parser.add_argument("--start", type=datetime.fromisoformat, help="开始时间（UTC，包含）")
+    parser.add_argument("--end", type=datetime.fromisoformat, help="结束时间（UTC，不包含）")
+    parser.add_argument("--cursor", help="从指定的续传游标继续")
+    parser.add_argument("-o", "--output", help="输出文件，默认写到标准输出")
+    parser.add_argument("--resume", action="store_true",
+                        help="从 <output>.progress 中记录的位置继续，追加写入输出文件（需要 --output）")
+    parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE)
+    args = parser.parse_args()
+    if args.resume and not args.output:
+        parser.error("--resume 需要指定 --output")
+    if args.resume and args.cursor:
+        # 进度文件中的输出偏移只对应其中记录的游标，与另行指定的游标混用会截断或重复输出
+        parser.error("--cursor 与 --resume 不能同时使用")
+
+    progress_path = f"{args.output}.progress" if args.output else None
+    cursor, offset = _load_progress(progress_path) if args.resume else (args.cursor, 0)
+    if args.resume and cursor:
+        # 丢弃上次中断时写了一半的块，从最后一个完整块之后继续追加
+        out = open(args.output, "r+b")
+        out.truncate(offset)
+        out.seek(offset)
+    else:
+        out = open(args.output, "wb") if args.output else sys.stdout.buffer
+
+    def save_progress(value: str):
+        # 先把数据落盘再记录游标，游标之前的行一定已经完整写入输出文件
+        out.flush()
+        os.fsync(out.fileno())
+        with open(progress_path + ".tmp", "w") as f:
+            json.dump({"cursor": value, "offset": out.tell()}, f)
+        os.replace(progress_path + ".tmp", progress_path)
+
+    try:
+        for data in stream_export(args.table, args.format, args.gzip, args.zone_id, args.start, args.end,
+                                  cursor, args.chunk_size, on_chunk=save_progress if progress_path else None):
+            out.write(data)
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
+    if progress_path:
+        print(f"✅ 导出完成: {args.output}（续传进度保存在 {progress_path}）", file=sys.stderr)
@@ -1,16 +1,38 @@
 # file: server/app/hvac_controller.py
+import logging
+import os
+import random
+import time
 from decimal import Decimal
 
+logger = logging.getLogger(__name__)
+
 class AbstractHVACController:
     """
     定义所有HVAC控制器都必须遵守的“标准接口” (抽象基类)。
     它规定，任何一个控制器都必须提供一个名为 set_temperature 的方法。
     """
+    # 支持一次请求写入多个分区的控制器设为 True，下发队列会把指令合并成批再调用 set_temperatures
+    supports_batch = False
+    # 单次调用的超时时间（秒），由下发队列设置；真实控制器应把它传给HTTP/socket客户端，让卡死的调用按时返回
+    timeout = None
+    # 控制器自己维护并写回 zones.current_temp（例如 hvac_simulator 的模拟建筑）时设为 True，
+    # 重算不再模拟物理温度变化，避免两个温度模型同时写同一列
+    reports_room_temperature = False
+
     def set_temperature(self, zone_id: str, temperature: Decimal):
         # 这个 pass 语句意味着基类本身不做任何具体操作。
         # 具体的实现将由它的子类来完成。
         raise NotImplementedError("每个控制器子类都必须实现set_temperature方法!")
 
+    def set_temperatures(self, setpoints: dict):
+        """
+        一次设置多个分区的温度 {zone_id: temperature}，失败时抛出异常。
+        默认逐个调用 set_temperature，支持多分区写入的控制器应重写此方法。
+        """
+        for zone_id, temperature in setpoints.items():
+            self.set_temperature(zone_id, temperature)
+
 class DummyHVACController(AbstractHVACController):
     """
     一个“模拟”的HVAC控制器，用于开发和测试。
@@ -21,10 +43,30 @@ class DummyHVACController(AbstractHVACController):
         """
         模拟设置指定分区的温度。
         """
-        print("======================================================")
-        print(f"**[HVAC模拟器]** 收到指令: 正在尝试将分区 '{zone_id}' 的温度设置为 {temperature}°C")
-        print(">> 在真实世界中，这里的代码将会是调用具体硬件的API。")
-        print("======================================================")
+        # 在真实世界中，这里的代码将会是调用具体硬件的API。
+        logger.info("[HVAC模拟器] 收到设定温度指令", extra={"zone_id": zone_id, "temperature": temperature})
+
+class FakeHVACController(AbstractHVACController):
+    """
+    带可配置延迟和失败率的“假”控制器，用于在本地压测下发队列（重试、超时、死信）。
+    """
+    supports_batch = True
+
+    def __init__(self, latency: float = 0.05, failure_rate: float = 0.0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.applied = {}   # zone_id -> 最近一次成功写入的温度
+        self.calls = 0
+
+    def set_temperature(self, zone_id: str, temperature: Decimal):
+        self.set_temperatures({zone_id: temperature})
+
+    def set_temperatures(self, setpoints: dict):
+        self.calls += 1
+        time.sleep(self.latency)
+        if random.random() < self.failure_rate:
+            raise ConnectionError("模拟的BMS接口错误")
+        self.applied.update(setpoints)
 
 # --- 未来扩展区 ---
 # class EnlightedHVACController(AbstractHVACController):
@@ -34,19 +76,30 @@ class DummyHVACController(AbstractHVACController):
 #         # url = f"https://api.enlightedinc.com/zones/{zone_id}/setpoint"
 #         # headers = {"Authorization": "Bearer YOUR_API_KEY"}
 #         # data = {"temperature": temperature}
-#         # response = requests.post(url, headers=headers, json=data)
+#         # response = requests.post(url, headers=headers, json=data, timeout=self.timeout)
 #         # ... 处理响应 ...
 #         pass
 
 # --- 当前使用的控制器 ---
 # 我们在这里决定当前系统使用哪个“转换插头”。
 # 现在我们使用模拟控制器，未来有了真实接口后，只需将这一行切换即可。
-current_controller = DummyHVACController()
+# 设置 HVAC_CONTROLLER=fake 可改用带延迟和失败率的假控制器（HVAC_FAKE_LATENCY_SECONDS / HVAC_FAKE_FAILURE_RATE）；
+# 设置 HVAC_CONTROLLER=simulator 改用向量化的多分区建筑热模型（见 hvac_simulator.py，参数为 HVAC_SIM_*）。
+if os.getenv("HVAC_CONTROLLER", "dummy") == "simulator":
+    from .hvac_simulator import SimulatedBuildingController, model_from_env, HVAC_SIM_OCCUPANTS_PER_ZONE, HVAC_SIM_SEED
+    current_controller = SimulatedBuildingController(model_from_env(), HVAC_SIM_OCCUPANTS_PER_ZONE, HVAC_SIM_SEED)
+elif os.getenv("HVAC_CONTROLLER", "dummy") == "fake":
+    current_controller = FakeHVACController(
+        latency=float(os.getenv("HVAC_FAKE_LATENCY_SECONDS", "0.05")),
+        failure_rate=float(os.getenv("HVAC_FAKE_FAILURE_RATE", "0"))
+    )
+else:
+    current_controller = DummyHVACController()
 
-# --- 统一的调用入口 ---
+# --- 同步调用入口 ---
 def set_zone_temperature(zone_id: str, temperature: Decimal):
     """
-    这是系统中唯一用来调用温度设置功能的函数。
-    它会自动使用我们当前配置的控制器实例。
+    直接、同步地调用当前控制器。
+    策略代码不应直接调用它，而应通过 hvac_dispatcher.submit() 异步下发，避免慢速的BMS接口阻塞重算。
     """
     current_controller.set_temperature(zone_id, temperature)
@@ -0,0 +1,322 @@
+# file: server/app/hvac_dispatcher.py
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from decimal import Decimal
+from typing import Callable, NamedTuple
+
+from . import models, hvac_controller, metrics
+from .database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# --- HVAC指令下发配置 ---
+# 同时进行中的控制器调用数上限
+HVAC_MAX_CONCURRENCY = int(os.getenv("HVAC_MAX_CONCURRENCY", "4"))
+# 控制器支持多分区写入时，每次调用最多合并的分区数
+HVAC_BATCH_SIZE = int(os.getenv("HVAC_BATCH_SIZE", "50"))
+# 单次控制器调用的超时时间（秒）
+HVAC_TIMEOUT_SECONDS = float(os.getenv("HVAC_TIMEOUT_SECONDS", "5"))
+# 失败后的最大重试次数，超过后写入死信表
+HVAC_MAX_RETRIES = int(os.getenv("HVAC_MAX_RETRIES", "3"))
+# 重试退避的基础时间（秒），第n次重试等待 base * 2^(n-1)，并叠加随机抖动
+HVAC_BACKOFF_SECONDS = float(os.getenv("HVAC_BACKOFF_SECONDS", "0.5"))
+# 关闭服务时等待队列清空的最长时间（秒）
+HVAC_SHUTDOWN_TIMEOUT_SECONDS = float(os.getenv("HVAC_SHUTDOWN_TIMEOUT_SECONDS", "10"))
+
+
+class _Command(NamedTuple):
+    temperature: Decimal
+    attempts: int         # 已失败的次数
+    not_before: float     # 重试退避：此 monotonic 时间之前不下发
+    submitted_at: float   # 首次提交的 monotonic 时间，重试时保持不变，用于统计端到端下发延迟
+
+
+class _Call:
+    """一次进行中的控制器调用。"""
+    __slots__ = ("batch", "started", "deadline", "timed_out")
+
+    def __init__(self, batch: dict, started: float, deadline: float):
+        self.batch = batch
+        self.started = started
+        self.deadline = deadline
+        self.timed_out = False    # 已超时并按失败处理，但控制器尚未返回
+
+
+class DeadLetter(NamedTuple):
+    zone_id: str
+    temperature: Decimal
+    attempts: int
+    last_error: str
+
+
+def store_dead_letters(letters: list[DeadLetter]):
+    """把下发失败的指令写入 hvac_dead_letters 表。"""
+    db = SessionLocal()
+    try:
+        db.add_all(models.HVACDeadLetter(**letter._asdict()) for letter in letters)
+        db.commit()
+    finally:
+        db.close()
+
+
+class HVACDispatcher:
+    """
+    【性能优化】位于策略和 HVAC 控制器之间的异步下发队列。
+
+    - submit() 只把设定值放入队列并立即返回，慢速或卡死的BMS接口不再阻塞重算；
+    - 去重：同一分区在下发前只保留最新的设定值，被覆盖的旧值直接丢弃；
+    - 合并：控制器 supports_batch 时，把多个分区合并成一次 set_temperatures 调用；
+    - 限流：控制器调用在固定的 max_concurrency 个工作线程上执行，同一分区同一时间只有一个调用；
+    - 超时和重试：超时或失败的指令按指数退避重试，期间若有更新的设定值则以新值为准；
+      超过 max_retries 后交给 dead_letter（默认写入 hvac_dead_letters 表）。
+      卡死的调用无法被强制终止：超时后按失败处理，但它仍占用一个并发名额、其分区也不会被再次下发，
+      直到控制器真正返回，因此进行中的控制器调用（包括卡死的）始终不超过 max_concurrency。
+      控制器的 timeout 属性会被设为同一超时时间，真实控制器应在客户端层面使用它，让卡死的调用尽快返回。
+    """
+
+    def __init__(self, controller: hvac_controller.AbstractHVACController,
+                 max_concurrency: int = HVAC_MAX_CONCURRENCY, batch_size: int = HVAC_BATCH_SIZE,
+                 timeout: float = HVAC_TIMEOUT_SECONDS, max_retries: int = HVAC_MAX_RETRIES,
+                 backoff: float = HVAC_BACKOFF_SECONDS,
+                 dead_letter: Callable[[list[DeadLetter]], None] = store_dead_letters):
+        self.controller = controller
+        self.controller.timeout = timeout
+        self.max_concurrency = max(1, max_concurrency)
+        self.batch_size = max(1, batch_size) if controller.supports_batch else 1
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.dead_letter = dead_letter
+        self._cond = threading.Condition()
+        self._pending: dict[str, _Command] = {}
+        self._in_flight: set[str] = set()
+        self._calls: set[_Call] = set()
+        self._active = 0          # 进行中的调用数，包括已超时但控制器尚未返回的
+        self._stuck = 0           # 已超时但控制器尚未返回的调用数
+        self._thread = None
+        self._workers: list[threading.Thread] = []
+        self._queue = None
+        self._stopping = False
+        self._closed = False
+        # 统计指标
+        self.submitted_total = 0
+        self.deduplicated_total = 0
+        self.calls_total = 0
+        self.sent_total = 0
+        self.retries_total = 0
+        self.timeouts_total = 0
+        self.dead_letters_total = 0
+        self._latency_total = 0.0
+        self._max_latency = 0.0
+
+    def submit(self, zone_id: str, temperature):
+        """把分区的新设定值放入下发队列；同一分区尚未下发的旧值会被覆盖。"""
+        with self._cond:
+            if zone_id in self._pending:
+                self.deduplicated_total += 1
+                metrics.HVAC_COMMANDS_TOTAL.labels("deduplicated").inc()
+            self._pending[zone_id] = _Command(temperature, 0, 0.0, time.monotonic())
+            self.submitted_total += 1
+            self._cond.notify()
+
+    # --- 生命周期 ---
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stopping = False
+        self._closed = False
+        self._queue = queue.SimpleQueue()
+        # 卡死的调用无法被强制终止，工作线程使用守护线程，不阻塞进程退出
+        self._workers = [
+            threading.Thread(target=self._work, name=f"hvac-call-{i}", daemon=True)
+            for i in range(self.max_concurrency)
+        ]
+        for worker in self._workers:
+            worker.start()
+        self._thread = threading.Thread(target=self._run, name="hvac-dispatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = HVAC_SHUTDOWN_TIMEOUT_SECONDS):
+        """停止接收重试退避，尽量在 timeout 内把队列中的指令下发完，剩余的写入死信。"""
+        if self._thread is None:
+            return
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+            self._cond.wait_for(self._idle, timeout=timeout)
+            leftover = [
+                DeadLetter(zone_id, command.temperature, command.attempts, "服务关闭时尚未下发")
+                for zone_id, command in self._pending.items()
+            ]
+            self._pending.clear()
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        self._thread = None
+        # 空闲的工作线程收到 None 后退出，仍卡在控制器调用中的线程随进程结束
+        for _ in self._workers:
+            self._queue.put(None)
+        self._workers = []
+        if leftover:
+            self._record_dead_letters(leftover)
+
+    def _idle(self) -> bool:
+        """队列已空，且进行中的调用只剩已超时、等待控制器返回的。"""
+        return not self._pending and self._active == self._stuck
+
+    # --- 调度 ---
+    def _run(self):
+        while True:
+            with self._cond:
+                if self._closed or (self._stopping and self._idle()):
+                    return
+                now = time.monotonic()
+                expired = self._take_expired(now)
+                batches, wait = self._take_ready(now)
+                calls = [_Call(batch, now, now + self.timeout) for batch in batches]
+                self._calls.update(calls)
+                if not calls and not expired:
+                    self._cond.wait(timeout=self._next_wakeup(wait, now))
+                    continue
+            for call in expired:
+                self._finish(call, f"TimeoutError: 控制器调用超过 {self.timeout}s 未返回", time.monotonic())
+            for call in calls:
+                self._queue.put(call)
+
+    def _take_expired(self, now: float) -> list[_Call]:
+        """找出超过 timeout 仍未返回的调用，标记为已超时；它们的并发名额和分区要等控制器返回后才释放。"""
+        expired = [call for call in self._calls if not call.timed_out and call.deadline <= now]
+        for call in expired:
+            call.timed_out = True
+            self._stuck += 1
+            self.timeouts_total += 1
+            metrics.HVAC_CALL_SECONDS.labels("timeout").observe(now - call.started)
+        return expired
+
+    def _next_wakeup(self, wait, now: float):
+        """下一条重试到期和下一个调用超时中较早的一个。"""
+        deadlines = [call.deadline - now for call in self._calls if not call.timed_out]
+        if wait is not None:
+            deadlines.append(wait)
+        return max(0.0, min(deadlines)) if deadlines else None
+
+    def _take_ready(self, now: float):
+        """取出可以下发的指令并按 batch_size 分批，返回 (批次列表, 距离下一条重试到期的等待时间)。"""
+        batches, batch, wait = [], {}, None
+        for zone_id in list(self._pending):
+            if self._active + len(batches) >= self.max_concurrency:
+                break
+            command = self._pending[zone_id]
+            if zone_id in self._in_flight:
+                continue
+            # 关闭过程中不再等待退避，直接尝试最后一次下发
+            if command.not_before > now and not self._stopping:
+                wait = command.not_before - now if wait is None else min(wait, command.not_before - now)
+                continue
+            batch[zone_id] = self._pending.pop(zone_id)
+            self._in_flight.add(zone_id)
+            if len(batch) >= self.batch_size:
+                batches.append(batch)
+                batch = {}
+        if batch:
+            batches.append(batch)
+        self._active += len(batches)
+        return batches, wait
+
+    def _work(self):
+        """工作线程：依次执行调度线程分配的控制器调用。"""
+        while True:
+            call = self._queue.get()
+            if call is None:
+                return
+            error = None
+            try:
+                self.controller.set_temperatures({zone_id: command.temperature for zone_id, command in call.batch.items()})
+            except Exception as exc:
+                error = f"{type(exc).__name__}: {exc}"
+            finished = time.monotonic()
+            with self._cond:
+                self._calls.discard(call)
+                timed_out = call.timed_out
+                if timed_out:
+                    # 超时已按失败处理（重试或死信），这里只归还并发名额和分区
+                    self._stuck -= 1
+                    self._release(call)
+            if not timed_out:
+                metrics.HVAC_CALL_SECONDS.labels("error" if error else "ok").observe(finished - call.started)
+                self._finish(call, error, finished)
+
+    def _release(self, call: _Call):
+        for zone_id in call.batch:
+            self._in_flight.discard(zone_id)
+        self._active -= 1
+        self._cond.notify_all()
+
+    def _finish(self, call: _Call, error, finished: float):
+        """处理一次调用的结果：成功计入统计，失败则重试或写入死信。超时的调用此时仍在进行，不释放名额。"""
+        latency = finished - call.started
+        dead = []
+        with self._cond:
+            self.calls_total += 1
+            self._latency_total += latency
+            self._max_latency = max(self._max_latency, latency)
+            for zone_id, command in call.batch.items():
+                if error is None:
+                    self.sent_total += 1
+                    metrics.HVAC_COMMANDS_TOTAL.labels("sent").inc()
+                    metrics.HVAC_DISPATCH_LATENCY_SECONDS.observe(finished - command.submitted_at)
+                elif zone_id in self._pending:
+                    # 失败期间已有更新的设定值，旧值不再重试
+                    metrics.HVAC_COMMANDS_TOTAL.labels("superseded").inc()
+                elif command.attempts + 1 > self.max_retries or self._stopping:
+                    dead.append(DeadLetter(zone_id, command.temperature, command.attempts + 1, error))
+                else:
+                    delay = self.backoff * 2 ** command.attempts * random.uniform(0.8, 1.2)
+                    self._pending[zone_id] = command._replace(attempts=command.attempts + 1, not_before=finished + delay)
+                    self.retries_total += 1
+                    metrics.HVAC_COMMANDS_TOTAL.labels("retried").inc()
+            if not call.timed_out:
+                self._release(call)
+            else:
+                self._cond.notify_all()
+        if dead:
+            self._record_dead_letters(dead)
+
+    def _record_dead_letters(self, letters: list[DeadLetter]):
+        with self._cond:
+            self.dead_letters_total += len(letters)
+        metrics.HVAC_COMMANDS_TOTAL.labels("dead_letter").inc(len(letters))
+        for letter in letters:
+            logger.error("温度指令多次尝试后仍失败，已写入死信", extra=letter._asdict())
+        try:
+            self.dead_letter(letters)
+        except Exception:
+            logger.exception("写入HVAC死信失败")
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "controller": type(self.controller).__name__,
+                "max_concurrency": self.max_concurrency,
+                "batch_size": self.batch_size,
+                "pending": len(self._pending),
+                "in_flight": len(self._in_flight),
+                "stuck_calls": self._stuck,
+                "submitted_total": self.submitted_total,
+                "deduplicated_total": self.deduplicated_total,
+                "calls_total": self.calls_total,
+                "sent_total": self.sent_total,
+                "retries_total": self.retries_total,
+                "timeouts_total": self.timeouts_total,
+                "dead_letters_total": self.dead_letters_total,
+                "avg_call_latency_seconds": round(self._latency_total / self.calls_total, 4) if self.calls_total else 0,
+                "max_call_latency_seconds": round(self._max_latency, 4),
+            }
+
+
+# 当前进程使用的HVAC下发队列，由 main.py 的 lifespan 启动和停止
+hvac_dispatcher = HVACDispatcher(hvac_controller.current_controller)
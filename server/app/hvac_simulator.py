@@ -0,0 +1,415 @@
+# file: server/app/hvac_simulator.py
+"""
+【模拟物理世界】向量化的多分区建筑热模型，作为 HVAC 控制器的替身，用于大规模浸泡测试（soak test）。
+
+全部分区的室温、设定值、室外温度和用户偏好都保存在 NumPy 数组中，每个 tick 一次性推进所有分区：
+- 一阶热模型：室温以时间常数 envelope_minutes 向室外温度漂移，同时HVAC以时间常数 hvac_minutes
+  （且不超过 max_hvac_rate 每分钟）把室温拉向设定值，再叠加随机扰动；室外温度按24小时正弦变化；
+- 用户投票：每个分区有若干固定的使用者（各自的偏好温度和用户ID），室温偏离偏好超过 tolerance 时
+  以 vote_rate_per_minute 的频率投 +1（偏冷，希望升温）或 -1（偏热），舒适时以 comfortable_vote_rate_per_minute 投 0。
+
+控制器通过 set_temperatures 接收下发的设定值；step() 返回本次 tick 产生的投票。设置 HVAC_CONTROLLER=simulator 后
+hvac_controller.current_controller 即为该控制器，启动时加载数据库中的全部分区，simulation_runner 按固定 tick
+推进模拟，并把投票经与 /api/votes/batch 相同的限流和写入路径送回系统，形成“投票 → 重算 → 下发 → 室温变化”的闭环。
+多个worker中只有持有 PostgreSQL 咨询锁的一个进程推进模拟（只有一栋建筑）：每个tick先从 zones 表同步新建的分区和推荐温度
+（其它worker的下发队列只把设定值写入了它们自己进程中的控制器），推进后把室温写回 zones.current_temp。
+浸泡测试脚本见 benchmarks/soak_simulator.py。
+"""
+import logging
+import math
+import os
+import threading
+import time
+import uuid
+from decimal import Decimal
+from typing import Callable, NamedTuple
+
+import numpy as np
+
+from . import hvac_controller
+from .hvac_controller import AbstractHVACController
+
+logger = logging.getLogger(__name__)
+
+# --- 模拟配置（HVAC_CONTROLLER=simulator 时生效） ---
+# 每个tick的真实间隔（秒），设为0表示不自动推进（由调用方调用 simulation_runner.tick()）
+HVAC_SIM_TICK_SECONDS = float(os.getenv("HVAC_SIM_TICK_SECONDS", "5"))
+# 模拟时间相对真实时间的倍速：每个tick推进 tick × time_scale 秒的室温变化（投票频率仍按真实时间计算）
+HVAC_SIM_TIME_SCALE = float(os.getenv("HVAC_SIM_TIME_SCALE", "1"))
+# 每个分区的使用者名额，实际使用者数服从均值为名额70%的泊松分布
+HVAC_SIM_OCCUPANTS_PER_ZONE = int(os.getenv("HVAC_SIM_OCCUPANTS_PER_ZONE", "10"))
+# 随机数种子，未设置时每次运行不同
+HVAC_SIM_SEED = int(os.environ["HVAC_SIM_SEED"]) if os.getenv("HVAC_SIM_SEED") else None
+# 每个tick是否与数据库同步（加入新分区、读取推荐温度作为设定值、把室温写回 zones.current_temp）
+HVAC_SIM_PERSIST = os.getenv("HVAC_SIM_PERSIST", "true").lower() in ("1", "true", "yes")
+
+# PostgreSQL 咨询锁的键，持有者即为推进模拟的进程
+SIMULATOR_LOCK_KEY = 0x7468_6573   # "thes"
+
+
+class ThermalModel(NamedTuple):
+    """热模型和使用者行为参数（时间单位均为模拟时间）。"""
+    envelope_minutes: float = 180.0           # 围护结构时间常数：不开HVAC时室温向室外温度漂移的快慢
+    hvac_minutes: float = 15.0                # HVAC时间常数：室温向设定值收敛的快慢
+    max_hvac_rate: float = 0.2                # HVAC每分钟最多改变的室温（°C）
+    outdoor_mean: float = 28.0                # 室外日均温度（°C）
+    outdoor_amplitude: float = 5.0            # 室外温度的日变化幅度（°C）
+    outdoor_zone_sd: float = 2.0              # 各分区受室外影响的差异（朝向、楼层），以等效室外温度的标准差表示
+    noise_sd: float = 0.02                    # 每分钟的室温随机扰动（°C）
+    preference_mean: float = 24.0             # 使用者偏好温度的均值（°C）
+    preference_sd: float = 1.0                # 使用者偏好温度的标准差（°C）
+    tolerance: float = 0.5                    # 偏离偏好超过该值才会投冷/热票（°C）
+    vote_rate_per_minute: float = 0.1         # 不舒适的使用者每分钟投票的概率
+    comfortable_vote_rate_per_minute: float = 0.01  # 舒适的使用者每分钟投 0 票的概率
+
+
+def model_from_env() -> "ThermalModel":
+    """热模型参数可以用 HVAC_SIM_<参数名大写> 覆盖，例如 HVAC_SIM_OUTDOOR_MEAN=32。"""
+    return ThermalModel(**{
+        name: float(os.getenv(f"HVAC_SIM_{name.upper()}", default))
+        for name, default in ThermalModel._field_defaults.items()
+    })
+
+
+class SimulatedBuildingController(AbstractHVACController):
+    """用 NumPy 数组保存全部分区状态的模拟建筑，同时也是 HVAC 控制器（支持批量写入设定值）。"""
+    supports_batch = True
+    # 室温由模拟建筑每个tick写回 zones.current_temp（见 SimulationRunner）
+    reports_room_temperature = True
+
+    def __init__(self, model: ThermalModel = ThermalModel(), occupants_per_zone: int = 10, seed: int = None):
+        self.model = model
+        self.occupants_per_zone = occupants_per_zone
+        self._rng = np.random.default_rng(seed)
+        self._lock = threading.Lock()
+        self.zone_ids: list[str] = []
+        self._index: dict[str, int] = {}
+        self.temp = np.empty(0)
+        self.setpoint = np.empty(0)
+        self._outdoor_offset = np.empty(0)
+        self._preference = np.empty((0, occupants_per_zone))
+        self._occupied = np.empty((0, occupants_per_zone), dtype=bool)
+        self._user_ids = np.empty((0, occupants_per_zone, 2), dtype=np.uint64)   # 每个使用者的UUID（高/低64位）
+        self.sim_seconds = 0.0
+        # 统计指标
+        self.ticks = 0
+        self.votes_generated = 0
+        self.setpoints_applied = 0
+        self.unknown_zone_setpoints = 0
+
+    # --- 建筑配置 ---
+    def add_zones(self, zone_ids: list[str], temps=None, setpoints=None):
+        """加入分区（已存在的跳过）；temps / setpoints 默认为 preference_mean。每个分区的使用者数服从泊松分布。"""
+        with self._lock:
+            # 每个分区在输入中第一次出现的位置，一次遍历建好，避免逐个 list.index 的 O(n²)
+            first = {}
+            for i, zone_id in enumerate(zone_ids):
+                first.setdefault(zone_id, i)
+            new = [zone_id for zone_id in first if zone_id not in self._index]
+            if not new:
+                return
+            positions = [first[zone_id] for zone_id in new]
+            count, slots, model = len(new), self.occupants_per_zone, self.model
+            default = np.full(count, model.preference_mean)
+            temps = default if temps is None else np.asarray(temps, dtype=float)[positions]
+            setpoints = temps if setpoints is None else np.asarray(setpoints, dtype=float)[positions]
+            occupants = np.minimum(self._rng.poisson(slots * 0.7, count), slots)
+
+            self._index.update((zone_id, len(self.zone_ids) + i) for i, zone_id in enumerate(new))
+            self.zone_ids.extend(new)
+            self.temp = np.concatenate([self.temp, temps])
+            self.setpoint = np.concatenate([self.setpoint, setpoints])
+            self._outdoor_offset = np.concatenate([self._outdoor_offset, self._rng.normal(0, model.outdoor_zone_sd, count)])
+            self._preference = np.vstack([
+                self._preference, self._rng.normal(model.preference_mean, model.preference_sd, (count, slots))
+            ])
+            self._occupied = np.vstack([self._occupied, np.arange(slots) < occupants[:, None]])
+            self._user_ids = np.concatenate([
+                self._user_ids, self._rng.integers(0, 2 ** 64, (count, slots, 2), dtype=np.uint64)
+            ])
+
+    def load_zones(self, db):
+        """从数据库加载全部分区，以当前温度为初始室温、推荐温度为初始设定值。"""
+        self.sync_zones(_zone_rows(db))
+
+    def sync_zones(self, rows: list, reload_temps: bool = False):
+        """
+        按数据库中的分区行 (zone_id, current_temp, recommended_temp) 同步：加入新建的分区，已有分区的设定值改为推荐温度；
+        reload_temps 时已有分区的室温也改为 current_temp（接管模拟时从上一个进程写回的室温继续）。
+        """
+        zone_ids = [row[0] for row in rows]
+        temps = np.array([float(row[1]) for row in rows])
+        setpoints = np.array([float(row[2]) for row in rows])
+        self.add_zones(zone_ids, temps, setpoints)
+        with self._lock:
+            index = np.fromiter((self._index[zone_id] for zone_id in zone_ids), dtype=np.intp, count=len(zone_ids))
+            self.setpoint[index] = setpoints
+            if reload_temps:
+                self.temp[index] = temps
+
+    def temperatures(self, zone_ids: list) -> np.ndarray:
+        with self._lock:
+            return self.temp[np.fromiter((self._index[zone_id] for zone_id in zone_ids), dtype=np.intp,
+                                         count=len(zone_ids))]
+
+    # --- HVAC控制器接口 ---
+    def set_temperature(self, zone_id: str, temperature):
+        self.set_temperatures({zone_id: temperature})
+
+    def set_temperatures(self, setpoints: dict):
+        with self._lock:
+            indices, values = [], []
+            for zone_id, temperature in setpoints.items():
+                index = self._index.get(zone_id)
+                if index is None:
+                    self.unknown_zone_setpoints += 1
+                    continue
+                indices.append(index)
+                values.append(float(temperature))
+            self.setpoint[indices] = values
+            self.setpoints_applied += len(indices)
+
+    # --- 模拟 ---
+    def outdoor_temp(self) -> float:
+        model = self.model
+        return model.outdoor_mean + model.outdoor_amplitude * math.sin(2 * math.pi * (self.sim_seconds / 86400 - 0.25))
+
+    def step(self, dt_seconds: float, vote_dt_seconds: float = None) -> list[tuple]:
+        """
+        把全部分区推进 dt_seconds 模拟时间，返回本次产生的投票 [(zone_id, user_id, vote_value), ...]。
+        投票频率按 vote_dt_seconds 计算（默认同 dt_seconds），模拟时间加速时可以让投票仍按真实时间的频率产生。
+        """
+        model = self.model
+        minutes = dt_seconds / 60
+        vote_minutes = (dt_seconds if vote_dt_seconds is None else vote_dt_seconds) / 60
+        with self._lock:
+            if not self.zone_ids:
+                return []
+            outdoor = self.outdoor_temp() + self._outdoor_offset
+            drift = (outdoor - self.temp) * (1 - math.exp(-minutes / model.envelope_minutes))
+            hvac = np.clip((self.setpoint - self.temp) * (1 - math.exp(-minutes / model.hvac_minutes)),
+                           -model.max_hvac_rate * minutes, model.max_hvac_rate * minutes)
+            noise = self._rng.normal(0, model.noise_sd * math.sqrt(minutes), len(self.temp))
+            self.temp += drift + hvac + noise
+            self.sim_seconds += dt_seconds
+            self.ticks += 1
+
+            # 每个使用者与偏好的偏差：正数表示偏冷（希望升温，投 +1）
+            discomfort = self._preference - self.temp[:, None]
+            cold, hot = discomfort > model.tolerance, discomfort < -model.tolerance
+            rate = np.where(cold | hot, model.vote_rate_per_minute, model.comfortable_vote_rate_per_minute)
+            voting = self._occupied & (self._rng.random(discomfort.shape) < 1 - np.exp(-rate * vote_minutes))
+            zones, slots = np.nonzero(voting)
+            values = cold[zones, slots].astype(int) - hot[zones, slots].astype(int)
+            user_bits = self._user_ids[zones, slots]
+            self.votes_generated += len(zones)
+        return [
+            (self.zone_ids[zone], uuid.UUID(int=(int(high) << 64) | int(low), version=4), int(value))
+            for zone, (high, low), value in zip(zones, user_bits, values)
+        ]
+
+    def comfort(self) -> dict:
+        """使用者层面的舒适度：与偏好的平均偏差，以及偏差在 tolerance 以内的比例。"""
+        with self._lock:
+            if not self.zone_ids:
+                return {}
+            error = np.abs(self._preference - self.temp[:, None])[self._occupied]
+            return {
+                "mean_abs_error_c": round(float(error.mean()), 3),
+                "comfortable_ratio": round(float((error <= self.model.tolerance).mean()), 4),
+                "mean_temp_c": round(float(self.temp.mean()), 3),
+                "mean_setpoint_c": round(float(self.setpoint.mean()), 3),
+            }
+
+    def stats(self) -> dict:
+        return {
+            "zones": len(self.zone_ids),
+            "occupants": int(self._occupied.sum()),
+            "sim_hours": round(self.sim_seconds / 3600, 3),
+            "ticks": self.ticks,
+            "votes_generated": self.votes_generated,
+            "setpoints_applied": self.setpoints_applied,
+            "unknown_zone_setpoints": self.unknown_zone_setpoints,
+            "outdoor_temp_c": round(self.outdoor_temp(), 2),
+            **self.comfort(),
+        }
+
+
+def _zone_rows(db) -> list:
+    from . import models
+
+    return db.query(models.Zone.zone_id, models.Zone.current_temp, models.Zone.recommended_temp).all()
+
+
+def _submit_votes(votes: list) -> tuple[int, int]:
+    # 与 /api/votes/batch 相同：按 (用户, 分区) 限流，再进入写后缓冲或直接批量写库
+    from . import schemas, vote_policy
+    from .database import SessionLocal
+    from .ingest import persist_votes, vote_write_buffer
+
+    batch = [schemas.VoteCreate(zone_id=zone_id, user_id=user_id, vote_value=value) for zone_id, user_id, value in votes]
+    accepted, throttled = vote_policy.vote_limiter.admit(batch)
+    if vote_write_buffer.enabled:
+        # 缓冲区已满时丢弃本轮的投票（计入被限流的票数），与接口返回 503 后客户端放弃重试的效果相同
+        if not vote_write_buffer.add(accepted):
+            return 0, throttled + len(accepted)
+        return len(accepted), throttled
+    db = SessionLocal()
+    try:
+        persist_votes(db, accepted)
+    finally:
+        db.close()
+    return len(accepted), throttled
+
+
+class SimulationRunner:
+    """
+    按固定 tick 推进模拟建筑的后台线程，由 main.py 的 lifespan 启动和停止。
+    只有 hvac_controller.current_controller 是 SimulatedBuildingController 时才启用。
+
+    每个worker都会启动本线程，但只有持有 PostgreSQL 咨询锁的进程推进模拟，该进程退出后其它worker在下一个tick接管，
+    并从 zones.current_temp 读回室温继续；非 PostgreSQL 数据库（本地开发）只有单进程，直接推进。
+    """
+
+    def __init__(self, tick_seconds: float = HVAC_SIM_TICK_SECONDS, time_scale: float = HVAC_SIM_TIME_SCALE,
+                 sink: Callable[[list], tuple[int, int]] = _submit_votes, persist: bool = HVAC_SIM_PERSIST):
+        self.tick_seconds = tick_seconds
+        self.time_scale = time_scale
+        self.sink = sink
+        self.persist = persist
+        self._stopping = threading.Event()
+        self._thread = None
+        self._leader = None
+        self._reload_temps = False
+        # 统计指标
+        self.is_leader = False
+        self.votes_submitted = 0
+        self.votes_throttled = 0
+        self.temps_persisted = 0
+        self.errors_total = 0
+        self.last_tick_seconds = 0.0
+        self._max_tick_seconds = 0.0
+
+    @property
+    def building(self):
+        controller = hvac_controller.current_controller
+        return controller if isinstance(controller, SimulatedBuildingController) else None
+
+    def load_zones(self, db):
+        if self.building is not None:
+            self.building.load_zones(db)
+
+    def start(self):
+        if self.building is None or self.tick_seconds <= 0 or self._thread is not None:
+            return
+        # 延迟导入：periodic 经 hvac_dispatcher 间接导入 hvac_controller，而后者在导入时就会导入本模块
+        from .database import engine
+        from .periodic import AdvisoryLockLeader
+
+        self._leader = AdvisoryLockLeader(engine, SIMULATOR_LOCK_KEY, "模拟建筑")
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="hvac-simulator", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stopping.set()
+            self._thread.join()
+            self._thread = None
+            self._leader.release()
+            self.is_leader = False
+
+    def tick(self, sink: Callable[[list], tuple[int, int]] = None) -> int:
+        """推进一个tick并提交产生的投票，返回投票数。sink 接收 [(zone_id, user_id, vote_value), ...]，返回 (写入数, 限流数)。"""
+        from .database import SessionLocal
+
+        started = time.perf_counter()
+        db = SessionLocal() if self.persist else None
+        try:
+            if db is not None:
+                rows = _zone_rows(db)
+                self.building.sync_zones(rows, reload_temps=self._reload_temps)
+                self._reload_temps = False
+            votes = self.building.step(self.tick_seconds * self.time_scale, vote_dt_seconds=self.tick_seconds)
+            if votes:
+                accepted, throttled = (sink or self.sink)(votes)
+                self.votes_submitted += accepted
+                self.votes_throttled += throttled
+            if db is not None:
+                self._persist_temps(db, rows)
+        finally:
+            if db is not None:
+                db.close()
+        self.last_tick_seconds = time.perf_counter() - started
+        self._max_tick_seconds = max(self._max_tick_seconds, self.last_tick_seconds)
+        return len(votes)
+
+    def _persist_temps(self, db, rows: list):
+        """
+        把室温（保留1位小数）与数据库中不同的分区写回 zones.current_temp，并经推送中心通知所有worker
+        （包括其它主机上的）更新共享状态表、失效快照缓存。
+        """
+        from sqlalchemy import update
+
+        from . import models
+        from .events import event_broker
+
+        zone_ids = [row[0] for row in rows]
+        stored = np.array([float(row[1]) for row in rows])
+        simulated = np.round(self.building.temperatures(zone_ids), 1)
+        changed = np.nonzero(np.round(stored * 10) != np.round(simulated * 10))[0]
+        if not len(changed):
+            return
+        temps = {zone_ids[i]: Decimal(f"{simulated[i]:.1f}") for i in changed}
+        db.execute(update(models.Zone), [{"zone_id": zone_id, "current_temp": temp} for zone_id, temp in temps.items()])
+        db.commit()
+        event_broker.publish_changes(db, {zone_id: {"current_temp": float(temp)} for zone_id, temp in temps.items()})
+        self.temps_persisted += len(temps)
+
+    def stats(self) -> dict:
+        building = self.building
+        if building is None:
+            return {"enabled": False}
+        return {
+            "enabled": True,
+            "running": self._thread is not None,
+            "is_leader": self.is_leader,
+            "persist": self.persist,
+            "tick_seconds": self.tick_seconds,
+            "time_scale": self.time_scale,
+            "votes_submitted": self.votes_submitted,
+            "votes_throttled": self.votes_throttled,
+            "temps_persisted": self.temps_persisted,
+            "errors_total": self.errors_total,
+            "last_tick_ms": round(self.last_tick_seconds * 1000, 2),
+            "max_tick_ms": round(self._max_tick_seconds * 1000, 2),
+            **building.stats(),
+        }
+
+    def _run(self):
+        next_tick = time.monotonic()
+        while True:
+            next_tick += self.tick_seconds
+            if self._stopping.wait(max(0.0, next_tick - time.monotonic())):
+                return
+            try:
+                leader = self._leader.acquire()
+            except Exception:
+                leader = False
+                logger.exception("模拟建筑选主失败")
+            if leader and not self.is_leader:
+                # 刚成为推进模拟的进程：室温从上一个进程写回数据库的值继续
+                self._reload_temps = True
+            self.is_leader = leader
+            if leader:
+                try:
+                    self.tick()
+                except Exception:
+                    self.errors_total += 1
+                    logger.exception("模拟建筑tick失败")
+            # 落后超过一个tick时不追赶，从当前时间重新计时
+            next_tick = max(next_tick, time.monotonic() - self.tick_seconds)
+
+
+# 当前进程使用的模拟推进线程，由 main.py 的 lifespan 启动和停止
+simulation_runner = SimulationRunner()
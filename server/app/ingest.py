@@ -0,0 +1,225 @@
+# file: server/app/ingest.py
+import glob
+import json
+import logging
+import math
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+from typing import Callable
+
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+
+from . import crud, schemas, strategy
+from .database import SessionLocal
+from .events import event_broker
+from .sharding import zone_sharding
+
+logger = logging.getLogger(__name__)
+
+# 是否启用写后缓冲：启用后投票先进入内存缓冲区，再批量写库
+VOTE_WRITE_BEHIND = os.getenv("VOTE_WRITE_BEHIND", "false").lower() in ("1", "true", "yes")
+# 缓冲区达到该票数时立即落库
+VOTE_BUFFER_MAX_SIZE = int(os.getenv("VOTE_BUFFER_MAX_SIZE", "500"))
+# 缓冲区最长停留时间（秒），到期即使未满也会落库
+VOTE_BUFFER_FLUSH_SECONDS = float(os.getenv("VOTE_BUFFER_FLUSH_SECONDS", "1.0"))
+# 缓冲区最多容纳的票数（数据库写入跟不上或不可用时的上限），超出后新投票返回 503
+VOTE_BUFFER_CAPACITY = int(os.getenv("VOTE_BUFFER_CAPACITY", str(VOTE_BUFFER_MAX_SIZE * 20)))
+# 关闭时仍无法落库的投票写入该目录，下次启动时重新放回缓冲区
+VOTE_BUFFER_SPILL_DIR = os.getenv("VOTE_BUFFER_SPILL_DIR", os.path.join(tempfile.gettempdir(), "thermasense-vote-spill"))
+
+
+def persist_votes(db: Session, votes: list[schemas.VoteCreate]):
+    """
+    批量写入投票，并通知滑动窗口聚合器和重算调度器。
+    /api/votes/batch 和写后缓冲共用这一条写入路径。
+    """
+    rows = crud.bulk_create_votes(db, votes)
+    notify_votes_written(rows)
+    return rows
+
+
+def notify_votes_written(rows):
+    """把已落库的投票推入滑动窗口聚合器，失效所有worker上的分区快照缓存，并把分区交给其归属进程的重算调度器。"""
+    for row in rows:
+        strategy.vote_aggregator.record(row)
+    counts = Counter(row.zone_id for row in rows)
+    event_broker.invalidate_zones(counts)
+    zone_sharding.route(counts)
+
+
+class VoteWriteBuffer:
+    """
+    【性能优化】投票写后缓冲区。
+
+    投票先追加到内存列表，后台线程在缓冲区达到 max_size 或停留超过 flush_interval 时，
+    用一次用户upsert和一条多行INSERT把整批投票写入数据库，取代逐条提交。
+
+    - 写库失败的投票会放回缓冲区等待下次重试；
+    - 缓冲区最多容纳 capacity 张投票，数据库长时间不可用时 add() 拒绝新投票（接口返回 503），内存占用有上限；
+    - stop() 会在关闭前把剩余投票全部落库，仍然失败的投票写入 spill_dir 下的文件，
+      下次启动时由 start() 放回缓冲区（恢复的投票按实际写库的时间计入时间窗）。
+    """
+
+    def __init__(self, session_factory: Callable[[], Session] = SessionLocal,
+                 max_size: int = VOTE_BUFFER_MAX_SIZE,
+                 flush_interval: float = VOTE_BUFFER_FLUSH_SECONDS,
+                 enabled: bool = VOTE_WRITE_BEHIND,
+                 capacity: int = VOTE_BUFFER_CAPACITY,
+                 spill_dir: str = VOTE_BUFFER_SPILL_DIR):
+        self.session_factory = session_factory
+        self.max_size = max_size
+        self.flush_interval = flush_interval
+        self.enabled = enabled
+        self.capacity = max(capacity, max_size)
+        self.spill_dir = spill_dir
+        self._cond = threading.Condition()
+        self._buffer: list[schemas.VoteCreate] = []
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._stopping = False
+        # 统计指标
+        self._flushes_total = 0
+        self._votes_flushed_total = 0
+        self._errors_total = 0
+        self._rejected_total = 0
+        self._spilled_total = 0
+        self._restored_total = 0
+
+    def add(self, votes: list[schemas.VoteCreate]) -> bool:
+        """把一批投票追加到缓冲区；放不下整批时全部拒绝并返回 False。"""
+        with self._cond:
+            if len(self._buffer) + len(votes) > self.capacity:
+                self._rejected_total += len(votes)
+                return False
+            self._buffer.extend(votes)
+            if len(self._buffer) >= self.max_size:
+                self._cond.notify()
+            return True
+
+    def start(self):
+        if not self.enabled or self._thread is not None:
+            return
+        self._restore_spilled()
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="vote-write-buffer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止后台线程，并把缓冲区中剩余的投票全部写入数据库；仍然写不进去的保存到 spill_dir。"""
+        if self._thread is not None:
+            with self._cond:
+                self._stopping = True
+                self._cond.notify()
+            self._thread.join()
+            self._thread = None
+        while self.flush():
+            pass
+        if self._buffer:
+            self._spill()
+
+    def flush(self) -> int:
+        """把当前缓冲区中的投票（最多 max_size 张）写入数据库，返回写入的票数。"""
+        with self._flush_lock:
+            with self._cond:
+                batch = self._buffer[:self.max_size]
+                del self._buffer[:self.max_size]
+            if not batch:
+                return 0
+            db = self.session_factory()
+            try:
+                persist_votes(db, batch)
+            except Exception:
+                db.rollback()
+                with self._cond:
+                    # 放回队头，保证投票不丢失且顺序不变
+                    self._buffer[:0] = batch
+                    self._errors_total += 1
+                logger.exception("批量写入投票失败，将在下次重试", extra={"votes": len(batch)})
+                return 0
+            finally:
+                db.close()
+            with self._cond:
+                self._flushes_total += 1
+                self._votes_flushed_total += len(batch)
+            return len(batch)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "enabled": self.enabled,
+                "buffered": len(self._buffer),
+                "max_size": self.max_size,
+                "capacity": self.capacity,
+                "flush_interval_seconds": self.flush_interval,
+                "flushes_total": self._flushes_total,
+                "votes_flushed_total": self._votes_flushed_total,
+                "errors_total": self._errors_total,
+                "rejected_total": self._rejected_total,
+                "spilled_total": self._spilled_total,
+                "restored_total": self._restored_total,
+            }
+
+    # --- 关闭时无法落库的投票 ---
+    def _spill(self):
+        with self._cond:
+            votes, self._buffer = self._buffer, []
+        path = os.path.join(self.spill_dir, f"votes-{os.getpid()}-{time.time_ns()}.ndjson")
+        try:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            with open(path + ".tmp", "w") as f:
+                for vote in votes:
+                    f.write(vote.model_dump_json() + "\n")
+            # 写完整后再改名，启动时不会读到写了一半的文件
+            os.replace(path + ".tmp", path)
+        except OSError:
+            logger.exception("关闭时投票未能写入数据库，也未能保存到本地文件，这些投票已丢失", extra={"votes": len(votes)})
+            return
+        with self._cond:
+            self._spilled_total += len(votes)
+        logger.error("关闭时投票未能写入数据库，已保存到本地文件，下次启动时重新写入",
+                     extra={"votes": len(votes), "path": path})
+
+    def _restore_spilled(self):
+        for path in sorted(glob.glob(os.path.join(self.spill_dir, "votes-*.ndjson"))):
+            # 先改名认领文件，多个worker同时启动时每个文件只被一个worker读取
+            claimed = f"{path}.{os.getpid()}"
+            try:
+                os.rename(path, claimed)
+            except OSError:
+                continue
+            with open(claimed) as f:
+                votes = [schemas.VoteCreate(**json.loads(line)) for line in f if line.strip()]
+            with self._cond:
+                # 恢复的投票不受 capacity 限制，避免再次丢失
+                self._buffer.extend(votes)
+                self._restored_total += len(votes)
+            os.remove(claimed)
+            logger.info("已恢复上次关闭时未落库的投票", extra={"votes": len(votes), "path": path})
+
+    def _run(self):
+        failed = False
+        while True:
+            with self._cond:
+                if self._stopping:
+                    return
+                # 缓冲区未满或上一次写库失败时，等待一个刷新周期再落库
+                if failed or len(self._buffer) < self.max_size:
+                    self._cond.wait(timeout=self.flush_interval)
+                if self._stopping:
+                    return
+            failed = self.flush() == 0 and bool(self._buffer)
+
+
+# 当前进程使用的写后缓冲区，由 main.py 的 lifespan 启动和停止
+vote_write_buffer = VoteWriteBuffer()
+
+
+def buffer_votes(votes: list[schemas.VoteCreate]):
+    """把投票放入写后缓冲区；缓冲区已满（数据库写入跟不上或不可用）时返回 503，客户端按 Retry-After 重试。"""
+    if not vote_write_buffer.add(votes):
+        raise HTTPException(status_code=503, detail="Vote buffer is full",
+                            headers={"Retry-After": str(math.ceil(vote_write_buffer.flush_interval))})
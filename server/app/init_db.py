@@ -1,7 +1,18 @@
 # file: server/app/init_db.py
-from .database import SessionLocal, engine
+import argparse
+import csv
+import json
+import os
+import time
+
+from sqlalchemy.orm import Session
+
+from .database import SessionLocal, dialect_insert
 from . import models
 
+# 每次 execute 传入的分区数（SQLAlchemy 会再把它们分页成多行 INSERT），所有批次仍在同一个事务中提交
+PROVISION_BATCH_SIZE = int(os.getenv("PROVISION_BATCH_SIZE", "10000"))
+
 # ✅ 定义期望存在的所有分区（英文ID + 中文名 + 初始温度）
 DESIRED_ZONES = [
     {
@@ -26,53 +37,62 @@ DESIRED_ZONES = [
     }
 ]
 
-def init_db():
-    # 创建所有表（如果尚未存在）
-    models.Base.metadata.create_all(bind=engine)
-    db = SessionLocal()
-
-    try:
-        # 获取所有已存在的 zone_id
-        existing_zone_ids = {
-            zone.zone_id: zone
-            for zone in db.query(models.Zone).all()
-        }
+def load_zones(path: str) -> list[dict]:
+    """
+    从文件读取分区定义，格式与 DESIRED_ZONES 相同（id / name / temp）：
+    .csv 需要表头 id,name,temp；.json 为对象列表；其它扩展名按每行一个JSON对象（NDJSON）读取。
+    """
+    with open(path, encoding="utf-8") as f:
+        if path.endswith(".csv"):
+            return [{"id": row["id"], "name": row["name"], "temp": float(row["temp"])} for row in csv.DictReader(f)]
+        if path.endswith(".json"):
+            return json.load(f)
+        return [json.loads(line) for line in f if line.strip()]
 
-        updated = 0
-        created = 0
 
-        for zone_data in DESIRED_ZONES:
-            zone_id = zone_data['id']
-            name = zone_data['name']
-            temp = zone_data['temp']
+def provision_zones(db: Session, zones: list[dict], batch_size: int = PROVISION_BATCH_SIZE) -> int:
+    """
+    【性能优化】用一条 INSERT ... ON CONFLICT 语句批量写入分区，返回新增或改名的分区数。
 
-            if zone_id in existing_zone_ids:
-                zone = existing_zone_ids[zone_id]
-                # 若中文名不同，则更新
-                if zone.name != name:
-                    print(f"📝 更新 zone {zone_id}: 名称由 '{zone.name}' → '{name}'")
-                    zone.name = name
-                    updated += 1
-            else:
-                # 插入新分区
-                new_zone = models.Zone(
-                    zone_id=zone_id,
-                    name=name,
-                    current_temp=temp,
-                    recommended_temp=temp
-                )
-                db.add(new_zone)
-                print(f"➕ 添加新分区: {zone_id} - {name}")
-                created += 1
+    新分区以给定温度插入；已有分区只在名称变化时更新名称，不改动运行中的温度。
+    语句以 executemany 方式执行，由 SQLAlchemy 合并成多行 INSERT，只编译一次；全部分区在同一个事务中提交。
+    """
+    # 同一条语句中不能两次更新同一行，文件中重复的 id 以最后一条为准
+    rows = list({
+        zone["id"]: {"zone_id": zone["id"], "name": zone["name"],
+                     "current_temp": zone["temp"], "recommended_temp": zone["temp"]}
+        for zone in zones
+    }.values())
+    stmt = dialect_insert(db, models.Zone)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[models.Zone.zone_id],
+        set_={"name": stmt.excluded.name},
+        where=models.Zone.name != stmt.excluded.name,
+    ).returning(models.Zone.zone_id)
+    changed = 0
+    for start in range(0, len(rows), batch_size):
+        changed += len(db.execute(stmt, rows[start:start + batch_size]).all())
+    db.commit()
+    return changed
 
-        if created or updated:
-            db.commit()
-            print(f"✅ 已更新数据库: 新增 {created} 个分区，修改 {updated} 个名称")
-        else:
-            print("ℹ️ 数据库已是最新，无需更改")
 
+def init_db(path: str = None):
+    """写入 DESIRED_ZONES 或 path 文件中的分区。表结构需要先用 `python -m app.migrate` 创建。"""
+    zones = load_zones(path) if path else DESIRED_ZONES
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        changed = provision_zones(db, zones)
+        elapsed = time.perf_counter() - started
     finally:
         db.close()
+    if changed:
+        print(f"✅ 已更新数据库: {changed} 个分区新增或修改了名称（共 {len(zones)} 个，耗时 {elapsed:.2f}s）")
+    else:
+        print("ℹ️ 数据库已是最新，无需更改")
 
 if __name__ == "__main__":
-    init_db()
+    parser = argparse.ArgumentParser(description="批量写入分区（已有分区只更新名称）")
+    parser.add_argument("--file", help="分区定义文件（.csv / .json / NDJSON），不指定时写入内置的示例分区")
+    args = parser.parse_args()
+    init_db(args.file)
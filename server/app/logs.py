@@ -0,0 +1,58 @@
+# file: server/app/logs.py
+import json
+import logging
+import os
+import sys
+from datetime import datetime, timezone
+
+# --- 日志配置 ---
+# 日志级别，例如 DEBUG / INFO / WARNING
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# 日志格式：text（人类可读，附带 key=value 字段）或 json（每行一个JSON对象，便于日志系统检索）
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+
+# LogRecord 自带的属性，其余属性都是通过 extra= 传入的结构化字段
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+def _fields(record: logging.LogRecord) -> dict:
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            **_fields(record),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class KeyValueFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s: %(message)s")
+
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        # 结构化字段紧跟在消息之后，异常堆栈（由 format() 追加）仍在最后
+        line = super().formatMessage(record)
+        fields = _fields(record)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+
+def configure_logging():
+    """为 app.* 日志配置输出格式和级别，由 main.py 在启动时调用一次。"""
+    logger = logging.getLogger("app")
+    if logger.handlers:
+        return
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else KeyValueFormatter())
+    logger.addHandler(handler)
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False
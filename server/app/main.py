@@ -1,27 +1,107 @@
 # file: server/app/main.py
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.templating import Jinja2Templates
-from .database import engine
-from . import models
+from .database import engine, SessionLocal, DB_ASYNC_MODE, async_engine
+from . import models, strategy, logs, metrics, migrate, vote_policy
+from .scheduler import recompute_scheduler
+from .ingest import vote_write_buffer
+from .events import event_broker
+from .periodic import periodic_scheduler
+from .hvac_dispatcher import hvac_dispatcher
+from .zone_cache import zone_cache, known_zone_ids
+from .hvac_simulator import simulation_runner
+from .shared_state import shared_zone_table, zone_fields
+from .sharding import zone_sharding
+from .vote_counts import vote_count_publisher
+
+logs.configure_logging()
+# 统计每条SQL的次数和耗时，用于 /metrics 中的“每个请求的数据库开销”
+metrics.instrument_engine(engine)
+if async_engine is not None:
+    metrics.instrument_engine(async_engine.sync_engine)
+metrics.register_stats("hvac", hvac_dispatcher.stats)
+metrics.register_stats("recompute_scheduler", recompute_scheduler.stats)
+metrics.register_stats("vote_buffer", vote_write_buffer.stats)
+metrics.register_stats("zone_cache", zone_cache.stats)
+metrics.register_stats("known_zone_ids", known_zone_ids.stats)
+metrics.register_stats("vote_policy", vote_policy.vote_limiter.stats)
+metrics.register_stats("periodic", periodic_scheduler.stats)
+metrics.register_stats("push", event_broker.stats)
+metrics.register_stats("hvac_simulator", simulation_runner.stats)
+metrics.register_stats("shared_zone_state", shared_zone_table.stats)
+metrics.register_stats("sharding", zone_sharding.stats)
+metrics.register_stats("vote_counts", vote_count_publisher.stats)
 
 # 这句必须放在api导入之前，因为它依赖main.py中的templates
 templates = Jinja2Templates(directory="app/templates")
 
 from . import api # 现在可以安全地导入api了
 
-# 在应用启动时，根据models.py中的定义，自动在数据库中创建所有表
-models.Base.metadata.create_all(bind=engine)
+# 【性能优化】表结构由部署时执行一次的 `python -m app.migrate` 管理，worker 启动时不再 create_all
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：启动时初始化进程内状态，关闭时做清理。"""
+    migrate.check_schema(engine)
+    # 从数据库加载时间窗内的投票，初始化滑动窗口聚合器；加载全部分区ID，投票时不再逐票查询分区
+    db = SessionLocal()
+    try:
+        strategy.vote_aggregator.seed(db)
+        zones = db.query(models.Zone).all()
+        known_zone_ids.add(zone.zone_id for zone in zones)
+        # 映射跨worker共享的分区状态表，并用数据库中的最新状态补全（先启动的worker写入的内容会被覆盖为相同的值）
+        shared_zone_table.open()
+        shared_zone_table.write_many({
+            zone.zone_id: zone_fields(zone, strategy.vote_aggregator.vote_counts(zone.zone_id)) for zone in zones
+        })
+        # HVAC_CONTROLLER=simulator 时把全部分区加入模拟建筑（只有持有咨询锁的一个worker推进模拟）
+        simulation_runner.load_zones(db)
+    finally:
+        db.close()
+    # 先登记分片租约，之后的投票和周期性重算按分区归属分配到各worker
+    zone_sharding.start()
+    hvac_dispatcher.start()
+    recompute_scheduler.start()
+    vote_write_buffer.start()
+    event_broker.start()
+    periodic_scheduler.start()
+    vote_count_publisher.start()
+    simulation_runner.start()
+    yield
+    simulation_runner.stop()
+    # 先退出分片，其它worker接管本进程的分区；之后缓冲区落库触发的重算都在本进程执行
+    zone_sharding.stop()
+    periodic_scheduler.stop()
+    vote_count_publisher.stop()
+    event_broker.stop()
+    # 关闭前先把缓冲区中的投票落库，再把尚未执行的分区重算跑完，最后下发剩余的HVAC指令
+    vote_write_buffer.stop()
+    recompute_scheduler.stop()
+    hvac_dispatcher.stop()
+    shared_zone_table.close()
+    if async_engine is not None:
+        await async_engine.dispose()
 
 # 初始化FastAPI应用实例
 app = FastAPI(
+    lifespan=lifespan,
     title="ThermaSense API",
     description="智能热舒适度调节系统的后端API服务",
     version="1.0.0"
 )
+app.add_middleware(metrics.MetricsMiddleware)
 
-# 将定义在api.py中的两个路由组（用户端和管理端）包含到主应用中
-app.include_router(api.user_router)
+# 将用户端和管理端两个路由组包含到主应用中
+# 用户端路由根据 DB_ASYNC_MODE 选择异步版(async_api.py)或同步版(api.py)，两者的接口完全相同
+if DB_ASYNC_MODE:
+    from . import async_api
+    app.include_router(async_api.user_router)
+else:
+    app.include_router(api.user_router)
 app.include_router(api.admin_router)
+app.include_router(api.push_router)
+app.include_router(api.metrics_router)
 
 # 定义一个根路径，用于快速检查服务是否正常运行
 @app.get("/", tags=["Root"])
@@ -0,0 +1,166 @@
+# file: server/app/metrics.py
+import contextvars
+import os
+import time
+from typing import Callable
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+)
+from prometheus_client.core import GaugeMetricFamily
+from sqlalchemy import event
+
+# gunicorn 多进程部署时设置该目录，/metrics 会汇总所有worker的数据（见 prometheus_client 的 multiprocess 模式）
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+# --- HTTP ---
+HTTP_REQUEST_SECONDS = Histogram(
+    "thermasense_http_request_duration_seconds", "HTTP请求耗时（不含SSE长连接）", ["method", "route", "status"]
+)
+DB_QUERIES_PER_REQUEST = Histogram(
+    "thermasense_db_queries_per_request", "单个HTTP请求执行的SQL语句数", ["route"],
+    buckets=(0, 1, 2, 3, 4, 6, 8, 12, 16, 24, 32, 64, 128)
+)
+DB_SECONDS_PER_REQUEST = Histogram(
+    "thermasense_db_seconds_per_request", "单个HTTP请求中SQL执行的总耗时", ["route"]
+)
+
+# --- 数据库（包括后台线程） ---
+DB_QUERIES_TOTAL = Counter("thermasense_db_queries_total", "执行的SQL语句总数")
+DB_QUERY_SECONDS_TOTAL = Counter("thermasense_db_query_seconds_total", "SQL执行的总耗时")
+
+# --- 投票写入 ---
+VOTES_TOTAL = Counter(
+    "thermasense_votes_total",
+    "投票的处理结果：inserted / replaced（最新一票生效模式下更新已有的一票）/ throttled", ["result"]
+)
+
+# --- 推荐温度计算 ---
+RECOMPUTE_STEP_SECONDS = Histogram(
+    "thermasense_recompute_step_seconds",
+    "calculate_recommended_temperature 各步骤耗时（vote_fetch 包含其中的 activity_load）", ["step"]
+)
+RECOMPUTE_TOTAL = Counter(
+    "thermasense_recompute_total",
+    "推荐温度计算次数，outcome 为 updated / unchanged / skipped_min_votes / zone_missing", ["mode", "outcome"]
+)
+
+# --- HVAC下发 ---
+HVAC_CALL_SECONDS = Histogram("thermasense_hvac_call_seconds", "单次HVAC控制器调用耗时", ["outcome"])
+HVAC_DISPATCH_LATENCY_SECONDS = Histogram(
+    "thermasense_hvac_dispatch_latency_seconds", "设定值从提交到控制器成功写入的耗时（含排队和重试）"
+)
+HVAC_COMMANDS_TOTAL = Counter(
+    "thermasense_hvac_commands_total",
+    "HVAC指令的处理结果：sent / deduplicated / superseded / retried / dead_letter", ["result"]
+)
+
+# 当前请求的SQL计数器 [语句数, 耗时]，由 MetricsMiddleware 设置；
+# 同步接口在线程池中执行时会复制上下文，因此也能累加到同一个计数器上
+_request_db_usage = contextvars.ContextVar("request_db_usage", default=None)
+
+
+def instrument_engine(engine):
+    """在引擎上注册SQL执行的计时钩子（每条语句只增加两次计时和一次计数的开销）。"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info["query_started_at"] = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info.pop("query_started_at", time.perf_counter())
+        DB_QUERIES_TOTAL.inc()
+        DB_QUERY_SECONDS_TOTAL.inc(elapsed)
+        usage = _request_db_usage.get()
+        if usage is not None:
+            usage[0] += 1
+            usage[1] += elapsed
+
+
+class MetricsMiddleware:
+    """
+    纯ASGI中间件：记录每个路由的延迟，以及请求期间执行的SQL语句数和耗时。
+    路由按路径模板（例如 /api/zones/{zone_id}/status）聚合，避免标签数量随分区数增长；SSE长连接不计入延迟。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] == "/metrics":
+            await self.app(scope, receive, send)
+            return
+        usage = [0, 0.0]
+        token = _request_db_usage.set(usage)
+        response = {"status": 500, "streaming": False}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["streaming"] = any(
+                    name == b"content-type" and value.startswith(b"text/event-stream")
+                    for name, value in message.get("headers", [])
+                )
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_db_usage.reset(token)
+            if not response["streaming"]:
+                matched = scope.get("route")
+                route = getattr(matched, "path", "unmatched")
+                HTTP_REQUEST_SECONDS.labels(scope["method"], route, response["status"]).observe(
+                    time.perf_counter() - started
+                )
+                DB_QUERIES_PER_REQUEST.labels(route).observe(usage[0])
+                DB_SECONDS_PER_REQUEST.labels(route).observe(usage[1])
+
+
+class _StatsCollector:
+    """把各后台组件 stats() 中的数值字段导出为 gauge，只在抓取 /metrics 时读取。"""
+
+    def __init__(self):
+        self._sources: dict[str, Callable[[], dict]] = {}
+
+    def add(self, component: str, stats: Callable[[], dict]):
+        self._sources[component] = stats
+
+    def collect(self):
+        for component, stats in self._sources.items():
+            for key, value in _numeric_fields(stats()):
+                yield GaugeMetricFamily(f"thermasense_{component}_{key}", f"{component}.stats() 中的 {key}",
+                                        value=float(value))
+
+
+# 需要展开的子字典（结构固定）；其余子字典按分区等动态键组织，标签数量不可控，不导出
+_EXPANDED_FIELDS = {"last_tick"}
+
+
+def _numeric_fields(stats: dict):
+    for key, value in stats.items():
+        if isinstance(value, dict) and key in _EXPANDED_FIELDS:
+            yield from ((f"{key}_{name}", item) for name, item in value.items() if isinstance(item, (int, float)))
+        elif isinstance(value, (int, float)):
+            yield key, value
+
+
+_stats_collector = _StatsCollector()
+if PROMETHEUS_MULTIPROC_DIR is None:
+    # 多进程模式下各worker的组件状态无法合并，只导出单进程时的组件状态
+    REGISTRY.register(_stats_collector)
+
+
+def register_stats(component: str, stats: Callable[[], dict]):
+    _stats_collector.add(component, stats)
+
+
+def render() -> tuple[bytes, str]:
+    """生成 Prometheus 文本格式的指标，返回 (内容, Content-Type)。"""
+    if PROMETHEUS_MULTIPROC_DIR is not None:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,62 @@
+# file: server/app/migrate.py
+"""
+数据库结构的版本化迁移入口（Alembic，迁移脚本位于 server/migrations/）。
+
+迁移只在部署时执行一次（docker-compose 中的 migrate 服务，或手动运行 `python -m app.migrate`），
+gunicorn worker 启动时不再建表，只用一条查询确认数据库已经升级到最新版本。
+"""
+import logging
+import os
+
+from alembic import command
+from alembic.config import Config
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from sqlalchemy.engine import Engine
+
+from . import partitions
+
+logger = logging.getLogger(__name__)
+
+ALEMBIC_INI = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "alembic.ini")
+
+
+def alembic_config() -> Config:
+    return Config(ALEMBIC_INI)
+
+
+def head_revision() -> str:
+    return ScriptDirectory.from_config(alembic_config()).get_current_head()
+
+
+def current_revision(bind: Engine):
+    with bind.connect() as connection:
+        return MigrationContext.configure(connection).get_current_revision()
+
+
+def check_schema(bind: Engine) -> bool:
+    """
+    启动时调用：数据库从未迁移过时直接报错；版本落后时只记录警告（滚动部署期间新旧版本短暂共存），
+    返回是否为最新版本。不会自动迁移。
+    """
+    current, head = current_revision(bind), head_revision()
+    if current is None:
+        raise RuntimeError("数据库尚未初始化，请先运行 python -m app.migrate")
+    if current != head:
+        logger.warning("数据库结构不是最新版本，请先运行 python -m app.migrate",
+                       extra={"current_revision": current, "head_revision": head})
+    return current == head
+
+
+def upgrade(bind: Engine, revision: str = "head"):
+    """把数据库升级到 revision，并为已分区的表创建未来几个月的分区。"""
+    command.upgrade(alembic_config(), revision)
+    with bind.begin() as connection:
+        partitions.ensure_partitions(connection)
+
+
+if __name__ == "__main__":
+    from .database import engine
+
+    upgrade(engine)
+    print(f"✅ 数据库已升级到版本 {current_revision(engine)}")
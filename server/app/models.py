@@ -3,20 +3,33 @@ import uuid
 from datetime import datetime
 from sqlalchemy import (
     Column, String, Numeric, SmallInteger, DateTime, ForeignKey,
-    Integer, Float, text
+    Integer, Float, Index, func
 )
 from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, declared_attr
 from .database import Base
 
 class User(Base):
     __tablename__ = "users"
 
     user_id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    first_seen_at = Column(DateTime, server_default=text('now()'))
-    last_seen_at = Column(DateTime, server_default=text('now()'), onupdate=text('now()'))
+    first_seen_at = Column(DateTime, server_default=func.now())
+    last_seen_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
 
     votes = relationship("Vote", back_populates="user")
+    activity = relationship("UserActivity", back_populates="user", uselist=False)
+
+
+class UserActivity(Base):
+    # 按用户增量维护的活跃度计数，在写入投票时更新，避免每次重算都统计全部历史投票
+    __tablename__ = "user_activity"
+
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.user_id"), primary_key=True)
+    total_votes = Column(Integer, nullable=False, default=0)
+    # 用户成为固定用户的时间点（首次出现满N天且票数达标），尚未达标时为空
+    frequent_since = Column(DateTime, nullable=True)
+
+    user = relationship("User", back_populates="activity")
 
 
 class Zone(Base):
@@ -38,11 +51,24 @@ class Vote(Base):
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.user_id"))
     zone_id = Column(String, ForeignKey("zones.zone_id"))
     vote_value = Column(SmallInteger, nullable=False)
-    created_at = Column(DateTime, server_default=text('now()'), nullable=False)
+    created_at = Column(DateTime, server_default=func.now(), nullable=False)
 
     user = relationship("User", back_populates="votes")
     zone = relationship("Zone", back_populates="votes")
 
+    # 【性能优化】热点查询使用的索引（由 migrations/ 中的迁移创建）。PostgreSQL 上通过 INCLUDE 附带查询用到的其它列，
+    # 使投票统计（GROUP BY vote_value）和批量重算可以只扫描索引、不回表
+    __table_args__ = (
+        # 单个分区 + 时间窗：投票统计、快照接口、逐分区重算、周期性重算的分片
+        Index("ix_votes_zone_id_created_at", "zone_id", "created_at",
+              postgresql_include=["vote_value", "user_id"]),
+        # 全部分区 + 时间窗：批量重算、滑动窗口初始化、数据保留
+        Index("ix_votes_created_at", "created_at",
+              postgresql_include=["zone_id", "vote_value", "user_id"]),
+        # 按用户统计活跃度（重建 user_activity 时按用户、时间排序）
+        Index("ix_votes_user_id_created_at", "user_id", "created_at"),
+    )
+
 
 class History(Base):
     __tablename__ = "history"
@@ -53,4 +79,61 @@ class History(Base):
     recommended_temp = Column(Float, nullable=False)
     timestamp = Column(DateTime, default=datetime.utcnow)
 
-    zone = relationship("Zone", back_populates="history")
\ No newline at end of file
+    zone = relationship("Zone", back_populates="history")
+
+    __table_args__ = (
+        # 单个分区的最新历史点（实时推送的快照）
+        Index("ix_history_zone_id_timestamp", "zone_id", "timestamp"),
+        # 监控面板按时间范围读取原始历史，以及数据保留
+        Index("ix_history_timestamp", "timestamp"),
+    )
+
+
+class _ZoneRollupColumns:
+    # 分区按时间桶汇总的公共字段：温度的 min/max/sum（平均值 = sum / temp_count）以及各投票值的票数
+    @declared_attr
+    def zone_id(cls):
+        return Column(String, ForeignKey("zones.zone_id"), primary_key=True)
+
+    bucket = Column(DateTime, primary_key=True)
+    temp_count = Column(Integer, nullable=False, default=0)
+    current_temp_min = Column(Float)
+    current_temp_max = Column(Float)
+    current_temp_sum = Column(Float, nullable=False, default=0)
+    recommended_temp_min = Column(Float)
+    recommended_temp_max = Column(Float)
+    recommended_temp_sum = Column(Float, nullable=False, default=0)
+    votes_minus_one = Column(Integer, nullable=False, default=0)
+    votes_zero = Column(Integer, nullable=False, default=0)
+    votes_plus_one = Column(Integer, nullable=False, default=0)
+
+
+class ZoneMinuteRollup(_ZoneRollupColumns, Base):
+    __tablename__ = "zone_rollups_minute"
+
+
+class ZoneHourRollup(_ZoneRollupColumns, Base):
+    __tablename__ = "zone_rollups_hour"
+
+
+class HVACDeadLetter(Base):
+    # 多次重试后仍未能下发到HVAC控制器的温度指令，供人工排查或重新下发
+    __tablename__ = "hvac_dead_letters"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    zone_id = Column(String, ForeignKey("zones.zone_id"), nullable=False)
+    temperature = Column(Numeric(4, 1), nullable=False)
+    attempts = Column(Integer, nullable=False)
+    last_error = Column(String)
+    created_at = Column(DateTime, server_default=func.now(), nullable=False)
+
+
+class ShardMember(Base):
+    # 分区分片的成员租约：每个worker一行，定期续约；续约超时的成员不再参与一致性哈希环
+    __tablename__ = "shard_members"
+
+    member_id = Column(String, primary_key=True)
+    hostname = Column(String, nullable=False)
+    pid = Column(Integer, nullable=False)
+    started_at = Column(DateTime, nullable=False)
+    heartbeat_at = Column(DateTime, nullable=False, index=True)
@@ -0,0 +1,163 @@
+# file: server/app/partitions.py
+"""
+【性能优化】PostgreSQL 上 votes / history 表按月的时间范围分区（可选）。
+
+分区后，按时间窗的查询只扫描最近一两个月的分区，数据保留可以直接删除整个旧分区，不再逐行 DELETE。
+分区表的主键包含分区列（例如 votes 为 (vote_id, created_at)），ORM 仍只用 vote_id 标识对象，应用代码不需要改动。
+
+启用方式：设置 DB_PARTITIONING=true 后运行 `alembic upgrade head`（迁移 0003 会转换已有的表），
+或对已经迁移过的数据库手动运行 `python -m app.partitions --convert`。
+之后需要定期（例如每天，随数据保留任务一起）运行 `python -m app.partitions` 提前创建未来几个月的分区；
+没有对应分区的数据会落入 default 分区，不会写入失败。
+"""
+import argparse
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from . import models
+
+# 是否在迁移时把 votes / history 转换为分区表（仅 PostgreSQL）
+DB_PARTITIONING = os.getenv("DB_PARTITIONING", "false").lower() in ("1", "true", "yes")
+# 提前创建的未来分区数（月）
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "2"))
+
+# 表名 -> 分区列
+PARTITIONED_TABLES = {"votes": "created_at", "history": "timestamp"}
+
+
+def _month_start(value: datetime) -> datetime:
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _next_month(month: datetime) -> datetime:
+    return (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def partition_name(table: str, month: datetime) -> str:
+    return f"{table}_p{month:%Y%m}"
+
+
+def is_partitioned(connection: Connection, table: str) -> bool:
+    if connection.dialect.name != "postgresql":
+        return False
+    return connection.execute(
+        text("SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:table))"),
+        {"table": table}
+    ).scalar()
+
+
+def create_partition(connection: Connection, table: str, month: datetime):
+    """创建 table 在 month 所在月份的分区（已存在时跳过）。"""
+    month = _month_start(month)
+    connection.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {partition_name(table, month)} PARTITION OF {table} "
+        f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{_next_month(month):%Y-%m-%d}')"
+    ))
+
+
+def ensure_partitions(connection: Connection, now: datetime = None,
+                      months_ahead: int = PARTITION_MONTHS_AHEAD) -> list[str]:
+    """为所有已分区的表创建当月及未来 months_ahead 个月的分区，返回涉及的分区名。"""
+    month = _month_start(now or datetime.utcnow())
+    created = []
+    for table in PARTITIONED_TABLES:
+        if not is_partitioned(connection, table):
+            continue
+        current = month
+        for _ in range(months_ahead + 1):
+            create_partition(connection, table, current)
+            created.append(partition_name(table, current))
+            current = _next_month(current)
+    return created
+
+
+def drop_partitions_before(connection: Connection, table: str, cutoff: datetime) -> int:
+    """删除整月都早于 cutoff 的分区，返回删除的行数。未分区的表返回 0。"""
+    if not is_partitioned(connection, table):
+        return 0
+    rows = connection.execute(text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE pg_inherits.inhparent = to_regclass(:table)"
+    ), {"table": table}).scalars().all()
+    deleted = 0
+    for name in rows:
+        try:
+            month = datetime.strptime(name, f"{table}_p%Y%m")
+        except ValueError:
+            continue  # default 分区
+        if _next_month(month) <= cutoff:
+            deleted += connection.execute(text(f"SELECT count(*) FROM {name}")).scalar()
+            connection.execute(text(f"DROP TABLE {name}"))
+    return deleted
+
+
+def convert_to_partitioned(connection: Connection, table: str, now: datetime = None,
+                           months_ahead: int = PARTITION_MONTHS_AHEAD):
+    """
+    【管理功能】把已有的普通表转换为按月分区的表：新建分区表，复制全部数据，再删除旧表。
+    复制期间会锁住旧表，大表请在维护窗口内执行。
+    """
+    # 列名加引号：history.timestamp 与类型名同名
+    column = PARTITIONED_TABLES[table]
+    model_table = models.Base.metadata.tables[table]
+    pk = model_table.primary_key.columns.keys()[0]
+    old = f"{table}_unpartitioned"
+    if connection.execute(text(f'SELECT EXISTS (SELECT 1 FROM {table} WHERE "{column}" IS NULL)')).scalar():
+        raise RuntimeError(f"{table}.{column} 存在空值，无法作为分区键，请先处理这些记录")
+    sequence = connection.execute(text("SELECT pg_get_serial_sequence(:table, :column)"),
+                                  {"table": table, "column": pk}).scalar()
+
+    connection.execute(text(f"ALTER TABLE {table} RENAME TO {old}"))
+    connection.execute(text(
+        f'CREATE TABLE {table} (LIKE {old} INCLUDING DEFAULTS) PARTITION BY RANGE ("{column}")'
+    ))
+    connection.execute(text(f'ALTER TABLE {table} ALTER COLUMN "{column}" SET NOT NULL'))
+
+    first = connection.execute(text(f'SELECT min("{column}") FROM {old}')).scalar()
+    month = _month_start(first or now or datetime.utcnow())
+    last = _month_start(now or datetime.utcnow())
+    for _ in range(months_ahead):
+        last = _next_month(last)
+    while month <= last:
+        create_partition(connection, table, month)
+        month = _next_month(month)
+    connection.execute(text(f"CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT"))
+
+    connection.execute(text(f"INSERT INTO {table} SELECT * FROM {old}"))
+    if sequence:
+        # 自增序列原本属于旧表的列，删除旧表前先转交给新表
+        connection.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY {table}.{pk}"))
+    connection.execute(text(f"DROP TABLE {old}"))
+
+    # 主键、外键和索引在旧表删除后再创建（避免与旧表的约束、索引重名），先导入数据再建索引也更快；
+    # 分区表的主键必须包含分区列，分区表上的索引会自动在每个分区上创建
+    connection.execute(text(f'ALTER TABLE {table} ADD PRIMARY KEY ("{pk}", "{column}")'))
+    for foreign_key in model_table.foreign_keys:
+        connection.execute(text(
+            f"ALTER TABLE {table} ADD FOREIGN KEY ({foreign_key.parent.name}) "
+            f"REFERENCES {foreign_key.column.table.name} ({foreign_key.column.name})"
+        ))
+    for index in model_table.indexes:
+        index.create(connection)
+    connection.execute(text(f"ANALYZE {table}"))
+
+
+if __name__ == "__main__":
+    from .database import engine
+
+    parser = argparse.ArgumentParser(description="维护 votes / history 的按月分区（仅 PostgreSQL）")
+    parser.add_argument("--convert", action="store_true", help="把尚未分区的表转换为分区表")
+    args = parser.parse_args()
+    if engine.dialect.name != "postgresql":
+        raise SystemExit("按时间分区只支持 PostgreSQL")
+    with engine.begin() as connection:
+        if args.convert:
+            for table in PARTITIONED_TABLES:
+                if not is_partitioned(connection, table):
+                    convert_to_partitioned(connection, table)
+                    print(f"✅ 已把 {table} 转换为按月分区的表")
+        print(f"✅ 已确认分区存在: {', '.join(ensure_partitions(connection)) or '无分区表'}")
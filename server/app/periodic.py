@@ -0,0 +1,275 @@
+# file: server/app/periodic.py
+import logging
+import os
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, text
+
+from . import models, batch_strategy
+from .database import engine, SessionLocal
+from .events import event_broker
+from .scheduler import recompute_scheduler
+from .sharding import zone_sharding
+
+logger = logging.getLogger(__name__)
+
+# --- 周期性重算配置 ---
+# 两次周期性重算之间的间隔（秒），默认为0即不启用。
+# 每次重算都会按时间窗内的全部投票再调整一次推荐温度，因此每轮只重算上一轮之后收到过投票的分区，
+# 作为投票触发的重算的补充（例如发给已退出的分片成员的重算请求），不会每轮重复叠加同一批投票的调整
+PERIODIC_RECOMPUTE_SECONDS = float(os.getenv("PERIODIC_RECOMPUTE_SECONDS", "0"))
+# 每轮把分区按哈希分成多少个分片，每个分片用一个独立的会话和事务批量计算
+PERIODIC_SHARDS = int(os.getenv("PERIODIC_SHARDS", "8"))
+# 同时计算的分片数上限（也是占用的数据库连接数上限）
+PERIODIC_MAX_WORKERS = int(os.getenv("PERIODIC_MAX_WORKERS", "2"))
+# 每轮的时间预算（秒），超出预算后尚未开始的分片顺延到下一轮优先执行；默认为间隔的80%
+PERIODIC_TICK_BUDGET_SECONDS = float(os.getenv("PERIODIC_TICK_BUDGET_SECONDS", str(PERIODIC_RECOMPUTE_SECONDS * 0.8)))
+
+# PostgreSQL 咨询锁的键，所有worker竞争同一把锁，持有者即为执行周期性重算的leader
+LEADER_LOCK_KEY = 0x7468_6572   # "ther"
+
+
+def _shard_of(zone_id: str, shards: int) -> int:
+    # 稳定哈希：新增分区不会改变已有分区所属的分片
+    return zlib.crc32(zone_id.encode()) % shards
+
+
+class AdvisoryLockLeader:
+    """
+    用 PostgreSQL 会话级咨询锁在多个worker中选出一个leader。
+
+    锁绑定在一条专用连接上，leader进程退出或连接断开时锁自动释放，其余worker下一次调用 acquire() 时接管；
+    非 PostgreSQL 数据库（本地开发）只有单进程，总是视为leader。
+    """
+
+    def __init__(self, bind, key: int, role: str):
+        self.bind = bind
+        self.key = key
+        self.role = role
+        self.use_advisory_lock = bind.dialect.name == "postgresql"
+        self._connection = None
+
+    def acquire(self) -> bool:
+        """已是leader或抢到锁时返回 True。"""
+        if not self.use_advisory_lock:
+            return True
+        if self._connection is not None:
+            try:
+                # 确认持锁连接仍然有效，否则锁可能已被数据库释放
+                self._connection.execute(text("SELECT 1"))
+                return True
+            except Exception as exc:
+                logger.warning("leader连接已断开，放弃leader身份", extra={"role": self.role, "error": str(exc)})
+                self.release()
+        connection = self.bind.connect().execution_options(isolation_level="AUTOCOMMIT")
+        try:
+            acquired = connection.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": self.key}).scalar()
+        except Exception:
+            connection.invalidate()
+            connection.close()
+            raise
+        if not acquired:
+            connection.close()
+            return False
+        self._connection = connection
+        logger.info("当前worker成为leader", extra={"role": self.role, "pid": os.getpid()})
+        return True
+
+    def release(self):
+        if self._connection is None:
+            return
+        # 直接丢弃物理连接：会话结束时数据库自动释放咨询锁，避免带锁的连接回到连接池
+        self._connection.invalidate()
+        self._connection.close()
+        self._connection = None
+
+
+class PeriodicRecomputeScheduler:
+    """
+    【性能优化】多worker安全的周期性全量重算（替代手动调用 calculate_all_zones）。
+
+    - 选主：gunicorn 的每个worker都会启动本调度器，但只有拿到 PostgreSQL 会话级咨询锁的worker执行重算
+      （见 AdvisoryLockLeader），leader退出后其余worker在下一轮抢到锁后接管；启用分区分片（sharding.py）时不再选主，
+      每个worker只计算自己拥有的分区，同一分区的周期性重算与投票触发的重算在同一个进程中执行，
+      并通过 recompute_scheduler.exclusive() 互斥，同一分区不会被两者同时重算；
+    - 只重算有新投票的分区：每轮只计算上一轮开始之后收到过投票的分区（第一轮为最近一个间隔内），
+      没有新投票的分区不会被每轮重复调整；
+    - 分片：分区按哈希分成 shards 个分片，由最多 max_workers 个线程并行批量计算，每个分片独立提交；
+    - 时间预算：超出每轮预算后不再启动新的分片，未执行的分片在下一轮最先执行；
+    - 指标：每轮耗时、相对计划时间的延迟（lag）、顺延的分片数等，见 stats()。
+    """
+
+    def __init__(self, interval: float = PERIODIC_RECOMPUTE_SECONDS, shards: int = PERIODIC_SHARDS,
+                 max_workers: int = PERIODIC_MAX_WORKERS, budget: float = PERIODIC_TICK_BUDGET_SECONDS,
+                 bind=engine, session_factory=SessionLocal):
+        self.interval = interval
+        self.shards = max(1, shards)
+        self.max_workers = max(1, max_workers)
+        self.budget = budget
+        self.bind = bind
+        self.session_factory = session_factory
+        self._leader = AdvisoryLockLeader(bind, LEADER_LOCK_KEY, "周期性重算")
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._deferred: dict[int, list] = {}   # 上一轮因超出预算而未执行的分片 -> 其中的分区
+        self._voted_since = None               # 上一轮开始的时间（UTC），本轮只重算此后收到过投票的分区
+        # 统计指标
+        self.is_leader = False
+        self.ticks_total = 0
+        self.zones_updated_total = 0
+        self.shards_deferred_total = 0
+        self.errors_total = 0
+        self.last_tick: dict = {}
+        self._max_duration = 0.0
+        self._max_lag = 0.0
+        self._duration_total = 0.0
+
+    # --- 生命周期 ---
+    def start(self):
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="periodic-recompute", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join()
+        self._thread = None
+        self._release_leadership()
+
+    # --- 选主 ---
+    def _acquire_leadership(self) -> bool:
+        if zone_sharding.enabled:
+            return True
+        return self._leader.acquire()
+
+    def _release_leadership(self):
+        self._leader.release()
+
+    # --- 调度循环 ---
+    def _run(self):
+        scheduled = time.monotonic()
+        while not self._stopping.wait(max(0.0, scheduled - time.monotonic())):
+            started = time.monotonic()
+            lag = started - scheduled
+            try:
+                leader = self._acquire_leadership()
+            except Exception:
+                leader = False
+                logger.exception("周期性重算选主失败")
+            with self._lock:
+                self.is_leader = leader
+            if leader:
+                try:
+                    self._tick(started, lag)
+                except Exception:
+                    with self._lock:
+                        self.errors_total += 1
+                    logger.exception("周期性重算执行失败")
+            # 按固定节奏排期；若本轮超时，则从当前时间重新排期，不连续补跑
+            scheduled = max(scheduled + self.interval, time.monotonic())
+
+    def _tick(self, started: float, lag: float):
+        deadline = started + self.budget
+        now = datetime.utcnow()
+        since = self._voted_since or now - timedelta(seconds=self.interval)
+        db = self.session_factory()
+        try:
+            voted = db.execute(
+                select(models.Vote.zone_id).where(models.Vote.created_at >= since).distinct()
+            ).scalars()
+            fresh = {zone_id for zone_id in voted if zone_sharding.owns(zone_id)}
+        finally:
+            db.close()
+        self._voted_since = now
+        # 上一轮顺延的分片中的分区没有被计算过，本轮照常计算并且优先执行
+        shards: dict[int, list] = {shard: list(zone_ids) for shard, zone_ids in self._deferred.items()}
+        for zone_id in sorted(fresh - {zone_id for zone_ids in shards.values() for zone_id in zone_ids}):
+            shards.setdefault(_shard_of(zone_id, self.shards), []).append(zone_id)
+        zone_ids = [zone_id for zone_ids in shards.values() for zone_id in zone_ids]
+        order = [shard for shard in self._deferred if shard in shards]
+        order += [shard for shard in sorted(shards) if shard not in order]
+
+        # 第一个分片总是执行，保证预算过小时每轮仍有进展
+        deadlines = [None] + [deadline] * (len(order) - 1)
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="periodic-shard") as pool:
+            results = list(pool.map(
+                lambda shard, shard_deadline: self._run_shard(shard, shards[shard], shard_deadline),
+                order, deadlines
+            ))
+
+        deferred = [shard for shard, updated in zip(order, results) if updated is None]
+        updated = sum(len(result) for result in results if result)
+        duration = time.monotonic() - started
+        self._deferred = {shard: shards[shard] for shard in deferred}
+        with self._lock:
+            self.ticks_total += 1
+            self.zones_updated_total += updated
+            self.shards_deferred_total += len(deferred)
+            self._duration_total += duration
+            self._max_duration = max(self._max_duration, duration)
+            self._max_lag = max(self._max_lag, lag)
+            self.last_tick = {
+                "zones": len(zone_ids),
+                "shards": len(shards),
+                "zones_updated": updated,
+                "shards_deferred": len(deferred),
+                "duration_seconds": round(duration, 3),
+                "lag_seconds": round(lag, 3),
+                "over_budget": duration > self.budget,
+            }
+        if deferred:
+            logger.warning("周期性重算超出时间预算，部分分片顺延到下一轮",
+                           extra={"budget_seconds": self.budget, "shards_deferred": len(deferred)})
+
+    def _run_shard(self, shard: int, zone_ids: list, deadline: float = None):
+        """计算一个分片，返回更新的分区列表；已超出时间预算时不执行并返回 None。"""
+        if (deadline is not None and time.monotonic() >= deadline) or self._stopping.is_set():
+            return None
+        db = self.session_factory()
+        try:
+            # 与重算调度器对同一分区的重算互斥：等待其正在执行的重算结束，期间到期的重算推迟到本分片提交之后
+            with recompute_scheduler.exclusive(zone_ids):
+                result = batch_strategy.calculate_zones_batch(db, zone_ids=zone_ids)
+                for zone_id in result.updated:
+                    event_broker.publish_zone_update(db, zone_id)
+            return result.updated
+        except Exception:
+            db.rollback()
+            with self._lock:
+                self.errors_total += 1
+            logger.exception("分片的周期性重算失败", extra={"shard": shard})
+            return []
+        finally:
+            db.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.interval > 0,
+                "interval_seconds": self.interval,
+                "budget_seconds": self.budget,
+                "shards": self.shards,
+                "max_workers": self.max_workers,
+                "is_leader": self.is_leader,
+                "ticks_total": self.ticks_total,
+                "zones_updated_total": self.zones_updated_total,
+                "shards_deferred_total": self.shards_deferred_total,
+                "errors_total": self.errors_total,
+                "avg_duration_seconds": round(self._duration_total / self.ticks_total, 3) if self.ticks_total else 0,
+                "max_duration_seconds": round(self._max_duration, 3),
+                "max_lag_seconds": round(self._max_lag, 3),
+                "last_tick": dict(self.last_tick),
+            }
+
+
+# 当前进程使用的周期性重算调度器，由 main.py 的 lifespan 启动和停止
+periodic_scheduler = PeriodicRecomputeScheduler()
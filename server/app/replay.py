@@ -0,0 +1,353 @@
+# file: server/app/replay.py
+"""
+【管理功能】离线回放 / 回测：把历史投票按时间顺序重新喂给推荐温度策略，评估不同参数组合的效果。
+
+- 投票和历史记录用服务端游标按时间分块读取（yield_per），内存占用只与时间窗内的投票数和分区数有关，与回放的时间跨度无关；
+- 时间窗使用与线上相同的 VoteWindowAggregator，固定用户按 user_activity.frequent_since 在回放时刻判断；
+- 重算时机与线上一致：分区的投票按 RecomputeScheduler 的最小间隔合并触发，启用 PERIODIC_RECOMPUTE_SECONDS 时另有周期性重算（只重算上一轮之后收到过投票的分区）；
+- 每个参数组合的决策与 calculate_recommended_temperature 相同，但只写入回放自己的轨迹文件，不修改任何线上表；
+- 参数网格按进程池分组执行，每个进程只扫描一遍历史数据，同时评估分到它的全部参数组合。
+
+舒适度指标是反事实的近似：把每张投票理解为“期望温度 = 当时线上的推荐温度 + 投票值 × REPLAY_VOTE_STEP_CELSIUS”，
+再与该参数组合在同一时刻的推荐温度比较。
+
+用法（在 server/ 目录下）:
+    python -m app.replay --start 2026-07-01 --end 2026-10-01 \\
+        --grid adjustment_factor=0.3,0.5,0.7 --grid max_change=0.5,0.8 --grid weight_frequent=1.0,1.5,2.0 \\
+        --workers 4 --output-dir replay-results
+"""
+import argparse
+import csv
+import gzip
+import heapq
+import itertools
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Callable, Iterator
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from . import models, strategy, activity, vote_window
+from .database import SessionLocal
+from .periodic import PERIODIC_RECOMPUTE_SECONDS
+from .scheduler import RECOMPUTE_MIN_INTERVAL_SECONDS
+
+# --- 回放配置 ---
+# 服务端游标每次读取的行数
+REPLAY_CHUNK_SIZE = int(os.getenv("REPLAY_CHUNK_SIZE", "5000"))
+# 推算期望温度时一票对应的温差（°C）：+1 表示希望比当时的推荐温度高这么多
+REPLAY_VOTE_STEP_CELSIUS = float(os.getenv("REPLAY_VOTE_STEP_CELSIUS", "1.0"))
+
+_TENTH = Decimal("0.1")
+# 事件类型，同一时刻先处理历史记录（线上设定值），再处理投票
+_HISTORY, _VOTE = 0, 1
+
+
+def stream_votes(db: Session, start: datetime, end: datetime,
+                 chunk_size: int = REPLAY_CHUNK_SIZE) -> Iterator[tuple]:
+    """按时间顺序流式读取 [start, end) 内的投票：(created_at, vote_id, user_id, zone_id, vote_value)。"""
+    result = db.execute(
+        select(models.Vote.created_at, models.Vote.vote_id, models.Vote.user_id,
+               models.Vote.zone_id, models.Vote.vote_value)
+        .where(models.Vote.created_at >= start, models.Vote.created_at < end)
+        .order_by(models.Vote.created_at, models.Vote.vote_id),
+        execution_options={"yield_per": chunk_size}
+    )
+    for partition in result.partitions():
+        yield from partition
+
+
+def stream_history(db: Session, start: datetime, end: datetime,
+                   chunk_size: int = REPLAY_CHUNK_SIZE) -> Iterator[tuple]:
+    """按时间顺序流式读取 [start, end) 内线上的推荐温度变化：(timestamp, zone_id, recommended_temp)。"""
+    result = db.execute(
+        select(models.History.timestamp, models.History.zone_id, models.History.recommended_temp)
+        .where(models.History.timestamp >= start, models.History.timestamp < end)
+        .order_by(models.History.timestamp, models.History.id),
+        execution_options={"yield_per": chunk_size}
+    )
+    for partition in result.partitions():
+        yield from partition
+
+
+def initial_state(db: Session, start: datetime) -> dict:
+    """
+    回放开始时各分区的 (推荐温度, 当前温度)：取 start 之前最后一条历史记录；
+    start 之前没有历史记录的分区使用 zones 表中的当前值。
+    """
+    state = {
+        zone_id: (Decimal(str(recommended)), Decimal(str(current)))
+        for zone_id, recommended, current in db.execute(
+            select(models.Zone.zone_id, models.Zone.recommended_temp, models.Zone.current_temp)
+        )
+    }
+    latest = (
+        select(models.History.zone_id, func.max(models.History.timestamp).label("timestamp"))
+        .where(models.History.timestamp < start)
+        .group_by(models.History.zone_id)
+        .subquery()
+    )
+    rows = db.execute(
+        select(models.History.zone_id, models.History.recommended_temp, models.History.current_temp)
+        .join(latest, (latest.c.zone_id == models.History.zone_id) & (latest.c.timestamp == models.History.timestamp))
+    )
+    for zone_id, recommended, current in rows:
+        state[zone_id] = (Decimal(str(recommended)), Decimal(str(current)))
+    return state
+
+
+def _simulate_physical_temperature_change(recommended: Decimal, current: Decimal) -> Decimal:
+    # 与 strategy._simulate_physical_temperature_change 相同
+    if current == recommended:
+        return current
+    change = (recommended - current) * Decimal("0.1")
+    if abs(change) > 0.2:
+        change = Decimal("0.2") if change > 0 else Decimal("-0.2")
+    return current + change
+
+
+class _ConfigRun:
+    """一个参数组合的回放状态：各分区的推荐温度、舒适度累加值，以及推荐温度轨迹文件。"""
+
+    def __init__(self, name: str, params: strategy.StrategyParams, initial: dict, trace_path: str = None):
+        self.name = name
+        self.params = params
+        self.zones = {zone_id: list(temps) for zone_id, temps in initial.items()}
+        self.trace_path = trace_path
+        self._trace_file = gzip.open(trace_path, "wt", newline="") if trace_path else None
+        self._trace = csv.writer(self._trace_file) if self._trace_file else None
+        if self._trace:
+            self._trace.writerow(["timestamp", "zone_id", "recommended_temp", "current_temp", "votes", "avg_score"])
+        self.decisions = 0
+        self.setpoint_changes = 0
+        self.total_adjustment = Decimal(0)
+        self.votes = 0
+        self.comfort_error_sum = 0.0
+        self.comfort_within = 0
+
+    def recompute(self, zone_id: str, now: datetime, stats: vote_window.WindowStats):
+        """与 calculate_recommended_temperature 相同的决策，只更新回放状态。"""
+        zone = self.zones.get(zone_id)
+        if zone is None or stats.count < self.params.min_votes:
+            return
+        avg_score = strategy._weighted_average(stats, self.params)
+        if avg_score is None:
+            return
+        self.decisions += 1
+        recommended, current = zone
+        new_temp = strategy._compute_new_temp(recommended, avg_score, self.params)
+        if not strategy._setpoint_changed(recommended, new_temp):
+            return
+        # 线上只在推荐温度变化时提交，物理温度的模拟值也只在此时以 Numeric(4,1) 的精度写入
+        zone[1] = _simulate_physical_temperature_change(recommended, current).quantize(_TENTH, ROUND_HALF_UP)
+        zone[0] = Decimal(repr(round(new_temp, 1)))
+        self.setpoint_changes += 1
+        self.total_adjustment += abs(zone[0] - recommended)
+        if self._trace:
+            self._trace.writerow([now.isoformat(), zone_id, zone[0], zone[1], stats.count, round(avg_score, 4)])
+
+    def observe_vote(self, zone_id: str, preferred: float):
+        zone = self.zones.get(zone_id)
+        if zone is None:
+            return
+        error = abs(float(zone[0]) - preferred)
+        self.votes += 1
+        self.comfort_error_sum += error
+        self.comfort_within += error <= 0.5
+
+    def summary(self) -> dict:
+        return {
+            "params": self.params._asdict(),
+            "votes": self.votes,
+            "decisions": self.decisions,
+            "setpoint_changes": self.setpoint_changes,
+            "total_adjustment_c": round(float(self.total_adjustment), 1),
+            "comfort_mae_c": round(self.comfort_error_sum / self.votes, 4) if self.votes else None,
+            "comfort_within_0_5c": round(self.comfort_within / self.votes, 4) if self.votes else None,
+            "trace": self.trace_path,
+        }
+
+    def close(self):
+        if self._trace_file:
+            self._trace_file.close()
+
+
+def replay(configs: dict, start: datetime, end: datetime, output_dir: str = None,
+           min_interval: float = RECOMPUTE_MIN_INTERVAL_SECONDS,
+           periodic_seconds: float = PERIODIC_RECOMPUTE_SECONDS,
+           vote_step: float = REPLAY_VOTE_STEP_CELSIUS, chunk_size: int = REPLAY_CHUNK_SIZE,
+           session_factory: Callable[[], Session] = SessionLocal) -> dict:
+    """
+    在一次扫描中回放 [start, end) 内的投票，评估 configs（名称 -> StrategyParams）中的全部参数组合。
+    返回 {名称: 指标}；指定 output_dir 时每个组合的推荐温度轨迹写入 <output_dir>/<名称>.csv.gz。
+    """
+    votes_db, history_db, lookup_db = session_factory(), session_factory(), session_factory()
+    runs = []
+    try:
+        initial = initial_state(lookup_db, start)
+        live_setpoints = {zone_id: float(temps[0]) for zone_id, temps in initial.items()}
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        runs = [
+            _ConfigRun(name, params, initial, os.path.join(output_dir, f"{name}.csv.gz") if output_dir else None)
+            for name, params in configs.items()
+        ]
+
+        # 固定用户身份按回放时刻判断（frequent_since 早于当前回放时间）
+        clock = [start]
+        aggregator = vote_window.VoteWindowAggregator(
+            strategy.VOTE_VALID_DURATION_MINUTES,
+            lambda db, user_ids: activity.load_user_activity(db, user_ids, now=clock[0])
+        )
+        buffered = []          # 已读取、尚未计入时间窗的投票
+        due: list = []         # 小顶堆: (重算时间, zone_id)
+        scheduled = set()      # 已排期重算的分区
+        last_run: dict = {}    # zone_id -> 上次按投票触发重算的时间
+        voted = set()          # 上一次周期性重算之后收到过投票的分区
+        interval = timedelta(seconds=min_interval)
+        period = timedelta(seconds=periodic_seconds) if periodic_seconds > 0 else None
+        next_tick = start + period if period else None
+
+        def run_until(moment: datetime):
+            # 依次执行 moment 之前到期的按分区重算和全量重算
+            nonlocal next_tick
+            while True:
+                zone_due = due[0][0] if due else None
+                if next_tick is not None and next_tick < moment and (zone_due is None or next_tick <= zone_due):
+                    # 与 PeriodicRecomputeScheduler 相同：只重算上一轮之后收到过投票的分区
+                    when, zone_ids = next_tick, sorted(voted)
+                    voted.clear()
+                    next_tick += period
+                elif zone_due is not None and zone_due < moment:
+                    when, zone_id = heapq.heappop(due)
+                    scheduled.discard(zone_id)
+                    last_run[zone_id] = when
+                    zone_ids = [zone_id]
+                else:
+                    return
+                recompute(when, zone_ids)
+
+        def recompute(when: datetime, zone_ids):
+            clock[0] = when
+            aggregator.advance(lookup_db, list(buffered), when)
+            buffered.clear()
+            for zone_id in zone_ids:
+                stats = aggregator.zone_stats(zone_id)
+                for run in runs:
+                    run.recompute(zone_id, when, stats)
+
+        events = heapq.merge(
+            ((row[0], _HISTORY, row) for row in stream_history(history_db, start, end, chunk_size)),
+            ((row[0], _VOTE, row) for row in stream_votes(votes_db, start, end, chunk_size)),
+            key=lambda event: event[:2],
+        )
+        for moment, kind, row in events:
+            run_until(moment)
+            if kind == _HISTORY:
+                live_setpoints[row.zone_id] = float(row.recommended_temp)
+                continue
+            created_at, vote_id, user_id, zone_id, vote_value = row
+            if zone_id in live_setpoints:
+                preferred = live_setpoints[zone_id] + vote_value * vote_step
+                for run in runs:
+                    run.observe_vote(zone_id, preferred)
+            buffered.append((vote_id, user_id, zone_id, vote_value, created_at))
+            voted.add(zone_id)
+            # 与 RecomputeScheduler 相同：空闲分区立即重算，最小间隔内的投票合并到下一次重算
+            if zone_id in scheduled:
+                continue
+            when = max(created_at, last_run[zone_id] + interval) if zone_id in last_run else created_at
+            if when == created_at:
+                last_run[zone_id] = created_at
+                recompute(created_at, [zone_id])
+            else:
+                heapq.heappush(due, (when, zone_id))
+                scheduled.add(zone_id)
+        run_until(end)
+        return {run.name: run.summary() for run in runs}
+    finally:
+        for run in runs:
+            run.close()
+        for db in (votes_db, history_db, lookup_db):
+            db.close()
+
+
+def parse_grid(specs: list[str]) -> dict:
+    """把 ["adjustment_factor=0.3,0.5", ...] 解析为 {参数名: [取值, ...]}。"""
+    grid = {}
+    for spec in specs:
+        name, _, values = spec.partition("=")
+        if name not in strategy.StrategyParams._fields:
+            raise ValueError(f"未知的策略参数: {name}（可选: {', '.join(strategy.StrategyParams._fields)}）")
+        cast = int if name == "min_votes" else float
+        grid[name] = [cast(value) for value in values.split(",") if value]
+    return grid
+
+
+def expand_grid(grid: dict) -> dict:
+    """展开参数网格，未指定的参数取当前配置；返回 {名称: StrategyParams}。"""
+    base = strategy.current_params()
+    names = list(grid)
+    configs = {}
+    for values in itertools.product(*(grid[name] for name in names)):
+        overrides = dict(zip(names, values))
+        name = "-".join(f"{key}={value}" for key, value in overrides.items()) or "current"
+        configs[name] = base._replace(**overrides)
+    return configs
+
+
+def _replay_group(configs: dict, kwargs: dict) -> dict:
+    # 进程池的入口：每个进程创建自己的数据库连接
+    return replay(configs, **kwargs)
+
+
+def run_grid(configs: dict, start: datetime, end: datetime, workers: int = 1, **kwargs) -> dict:
+    """把参数组合平均分给 workers 个进程，每个进程扫描一遍历史数据，返回合并后的 {名称: 指标}。"""
+    kwargs.update(start=start, end=end)
+    items = list(configs.items())
+    groups = [dict(items[i::workers]) for i in range(min(workers, len(items)))]
+    if len(groups) <= 1:
+        return replay(configs, **kwargs)
+    results = {}
+    # spawn：子进程重新导入 app，不继承父进程的数据库连接
+    with ProcessPoolExecutor(max_workers=len(groups), mp_context=multiprocessing.get_context("spawn")) as pool:
+        for result in pool.map(_replay_group, groups, [kwargs] * len(groups)):
+            results.update(result)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="用历史投票回放推荐温度策略，评估参数组合")
+    parser.add_argument("--start", type=datetime.fromisoformat, help="回放开始时间（UTC），默认为30天前")
+    parser.add_argument("--end", type=datetime.fromisoformat, help="回放结束时间（UTC），默认为现在")
+    parser.add_argument("--grid", action="append", default=[],
+                        help="参数网格，例如 adjustment_factor=0.3,0.5,0.7；可重复指定，未指定的参数取当前配置")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="进程数")
+    parser.add_argument("--output-dir", help="推荐温度轨迹和汇总结果的输出目录")
+    parser.add_argument("--min-interval", type=float, default=RECOMPUTE_MIN_INTERVAL_SECONDS,
+                        help="同一分区两次按投票触发的重算之间的最小间隔（秒）")
+    parser.add_argument("--periodic-seconds", type=float, default=PERIODIC_RECOMPUTE_SECONDS,
+                        help="全量重算的间隔（秒），0表示不模拟")
+    parser.add_argument("--vote-step", type=float, default=REPLAY_VOTE_STEP_CELSIUS)
+    args = parser.parse_args()
+
+    end = args.end or datetime.utcnow()
+    start = args.start or end - timedelta(days=30)
+    configs = expand_grid(parse_grid(args.grid))
+    results = run_grid(configs, start, end, workers=args.workers, output_dir=args.output_dir,
+                       min_interval=args.min_interval, periodic_seconds=args.periodic_seconds,
+                       vote_step=args.vote_step)
+    if args.output_dir:
+        with open(os.path.join(args.output_dir, "summary.json"), "w") as f:
+            json.dump({"start": start.isoformat(), "end": end.isoformat(), "results": results}, f,
+                      indent=2, ensure_ascii=False)
+
+    print(f"{'config':<60}{'comfort MAE':>12}{'≤0.5°C':>9}{'changes':>9}{'adjust °C':>11}")
+    for name, result in sorted(results.items(), key=lambda item: item[1]["comfort_mae_c"] or 0):
+        print(f"{name:<60}{result['comfort_mae_c']!s:>12}{result['comfort_within_0_5c']!s:>9}"
+              f"{result['setpoint_changes']:>9}{result['total_adjustment_c']:>11}")
@@ -0,0 +1,96 @@
+# file: server/app/retention.py
+import argparse
+import csv
+import gzip
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy.orm import Session
+
+from . import models, partitions
+from .database import SessionLocal
+
+# --- 数据保留策略 ---
+# 原始 votes / history 记录的保留天数，更早的数据只保留在汇总表中
+RAW_RETENTION_DAYS = int(os.getenv("RAW_RETENTION_DAYS", "90"))
+# 分钟级汇总的保留天数（小时级汇总永久保留）
+MINUTE_ROLLUP_RETENTION_DAYS = int(os.getenv("MINUTE_ROLLUP_RETENTION_DAYS", "30"))
+# 若配置了归档目录，删除前先把原始记录写入 gzip 压缩的CSV文件
+RETENTION_ARCHIVE_DIR = os.getenv("RETENTION_ARCHIVE_DIR")
+# 每批删除的行数，避免长事务和大量锁
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "10000"))
+
+# 表名 -> (模型, 主键列, 时间列)
+RAW_TABLES = {
+    "votes": (models.Vote, models.Vote.vote_id, models.Vote.created_at),
+    "history": (models.History, models.History.id, models.History.timestamp),
+}
+
+
+def _archive(archive_dir: str, table: str, model, rows: list):
+    # 每批追加一个独立的gzip成员，文件整体仍可被 zcat / gzip.open 连续读取
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f"{table}-{datetime.utcnow():%Y%m%d}.csv.gz")
+    columns = [column.name for column in model.__table__.columns]
+    is_new = not os.path.exists(path)
+    with gzip.open(path, "at", newline="") as f:
+        writer = csv.writer(f)
+        if is_new:
+            writer.writerow(columns)
+        for row in rows:
+            writer.writerow([getattr(row, column) for column in columns])
+
+
+def purge_raw_table(db: Session, table: str, cutoff: datetime,
+                    archive_dir: str = None, batch_size: int = RETENTION_BATCH_SIZE) -> int:
+    """按主键分批删除（可选先归档）早于 cutoff 的原始记录，每批单独提交，返回删除的行数。"""
+    model, pk, ts_column = RAW_TABLES[table]
+    deleted = 0
+    while True:
+        batch = db.query(model).filter(ts_column < cutoff).order_by(pk).limit(batch_size).all()
+        if not batch:
+            return deleted
+        if archive_dir:
+            _archive(archive_dir, table, model, batch)
+        ids = [getattr(row, pk.key) for row in batch]
+        db.query(model).filter(pk.in_(ids)).delete(synchronize_session=False)
+        db.commit()
+        db.expunge_all()
+        deleted += len(ids)
+
+
+def run_retention(db: Session, now: datetime = None, archive_dir: str = RETENTION_ARCHIVE_DIR) -> dict:
+    """
+    【管理功能】执行一次数据保留策略，返回各表删除的行数。
+    原始数据在删除前已经累加进汇总表，因此长时间范围的统计不受影响。
+    注意：user_activity 计数是累计值，不会因此减少；但清理后不应再运行 `app.activity --rebuild`。
+    """
+    now = now or datetime.utcnow()
+    raw_cutoff = now - timedelta(days=RAW_RETENTION_DAYS)
+    result = {}
+    for table in RAW_TABLES:
+        # 按月分区的表直接删除整月过期的分区；需要归档时仍逐行读取
+        dropped = 0 if archive_dir else partitions.drop_partitions_before(db.connection(), table, raw_cutoff)
+        db.commit()
+        result[table] = dropped + purge_raw_table(db, table, raw_cutoff, archive_dir)
+
+    minute_cutoff = now - timedelta(days=MINUTE_ROLLUP_RETENTION_DAYS)
+    result["zone_rollups_minute"] = (
+        db.query(models.ZoneMinuteRollup)
+        .filter(models.ZoneMinuteRollup.bucket < minute_cutoff)
+        .delete(synchronize_session=False)
+    )
+    db.commit()
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="清理超过保留期限的原始数据（可配合cron定时运行）")
+    parser.add_argument("--archive-dir", default=RETENTION_ARCHIVE_DIR, help="删除前归档为CSV的目录")
+    args = parser.parse_args()
+    db = SessionLocal()
+    try:
+        result = run_retention(db, archive_dir=args.archive_dir)
+        print("✅ 数据保留策略执行完成: " + ", ".join(f"{table} 删除 {count} 行" for table, count in result.items()))
+    finally:
+        db.close()
@@ -0,0 +1,150 @@
+# file: server/app/rollups.py
+import argparse
+from datetime import datetime
+
+from sqlalchemy import case, or_, select
+from sqlalchemy.orm import Session
+
+from . import models
+from .database import SessionLocal, dialect_insert
+
+# 按分钟/小时汇总的分区数据表，在写入投票和历史记录时增量维护。
+# 长时间范围的仪表盘和统计查询读取汇总表，而不是扫描原始的 votes / history 表。
+GRANULARITIES = {
+    "minute": models.ZoneMinuteRollup,
+    "hour": models.ZoneHourRollup,
+}
+
+# 投票值 -> 汇总表中的计数字段
+VOTE_COLUMNS = {-1: "votes_minus_one", 0: "votes_zero", 1: "votes_plus_one"}
+
+
+def truncate(timestamp: datetime, granularity: str) -> datetime:
+    """把时间截断到所属时间桶的起点。"""
+    if granularity == "hour":
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(second=0, microsecond=0)
+
+
+def _least(column, value):
+    # 可移植的 least()：兼容 PostgreSQL 和 SQLite，且忽略尚未写入温度时的 NULL
+    return case((or_(column.is_(None), column > value), value), else_=column)
+
+
+def _greatest(column, value):
+    return case((or_(column.is_(None), column < value), value), else_=column)
+
+
+def _upsert(db: Session, model, rows: list[dict], set_builder):
+    # 按主键排序后一条多行 upsert 写入，避免并发写入时因加锁顺序不同而死锁
+    rows.sort(key=lambda row: (row["zone_id"], row["bucket"]))
+    stmt = dialect_insert(db, model).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[model.zone_id, model.bucket],
+        set_=set_builder(model, stmt.excluded)
+    )
+    db.execute(stmt)
+
+
+def record_votes(db: Session, votes: list[tuple], removed: list[tuple] = ()):
+    """
+    把一批投票累加到分钟/小时汇总表（不提交）。
+    votes 为 (zone_id, vote_value, created_at) 列表；removed 格式相同，为被改写的旧投票，从对应时间桶中扣减。
+    """
+    for granularity, model in GRANULARITIES.items():
+        buckets: dict = {}
+        for entries, sign in ((votes, 1), (removed, -1)):
+            for zone_id, vote_value, created_at in entries:
+                column = VOTE_COLUMNS.get(vote_value)
+                if column is None:
+                    continue
+                key = (zone_id, truncate(created_at, granularity))
+                row = buckets.setdefault(key, {
+                    "zone_id": key[0], "bucket": key[1],
+                    "votes_minus_one": 0, "votes_zero": 0, "votes_plus_one": 0,
+                })
+                row[column] += sign
+        if buckets:
+            _upsert(db, model, list(buckets.values()), lambda m, ex: {
+                column: getattr(m, column) + getattr(ex, column) for column in VOTE_COLUMNS.values()
+            })
+
+
+def record_history(db: Session, entries: list[tuple]):
+    """
+    把一批历史温度记录累加到分钟/小时汇总表（不提交）。
+    entries 为 (zone_id, timestamp, current_temp, recommended_temp) 列表。
+    """
+    for granularity, model in GRANULARITIES.items():
+        buckets: dict = {}
+        for zone_id, timestamp, current_temp, recommended_temp in entries:
+            current_temp, recommended_temp = float(current_temp), float(recommended_temp)
+            key = (zone_id, truncate(timestamp, granularity))
+            row = buckets.get(key)
+            if row is None:
+                row = buckets[key] = {
+                    "zone_id": key[0], "bucket": key[1], "temp_count": 0,
+                    "current_temp_min": current_temp, "current_temp_max": current_temp, "current_temp_sum": 0.0,
+                    "recommended_temp_min": recommended_temp, "recommended_temp_max": recommended_temp,
+                    "recommended_temp_sum": 0.0,
+                }
+            row["temp_count"] += 1
+            row["current_temp_sum"] += current_temp
+            row["current_temp_min"] = min(row["current_temp_min"], current_temp)
+            row["current_temp_max"] = max(row["current_temp_max"], current_temp)
+            row["recommended_temp_sum"] += recommended_temp
+            row["recommended_temp_min"] = min(row["recommended_temp_min"], recommended_temp)
+            row["recommended_temp_max"] = max(row["recommended_temp_max"], recommended_temp)
+        if buckets:
+            _upsert(db, model, list(buckets.values()), lambda m, ex: {
+                "temp_count": m.temp_count + ex.temp_count,
+                "current_temp_sum": m.current_temp_sum + ex.current_temp_sum,
+                "current_temp_min": _least(m.current_temp_min, ex.current_temp_min),
+                "current_temp_max": _greatest(m.current_temp_max, ex.current_temp_max),
+                "recommended_temp_sum": m.recommended_temp_sum + ex.recommended_temp_sum,
+                "recommended_temp_min": _least(m.recommended_temp_min, ex.recommended_temp_min),
+                "recommended_temp_max": _greatest(m.recommended_temp_max, ex.recommended_temp_max),
+            })
+
+
+def rebuild_rollups(db: Session, chunk_size: int = 5000) -> dict:
+    """
+    【管理功能】清空汇总表并根据原始 votes / history 表重新计算。
+    首次部署汇总表时需要运行一次；开启数据保留策略后原始数据会被清理，不应再重建。
+    """
+    for model in GRANULARITIES.values():
+        db.query(model).delete()
+
+    counts = {"votes": 0, "history": 0}
+    votes = db.execute(
+        select(models.Vote.zone_id, models.Vote.vote_value, models.Vote.created_at),
+        execution_options={"yield_per": chunk_size}
+    )
+    for chunk in votes.partitions():
+        record_votes(db, [tuple(row) for row in chunk])
+        counts["votes"] += len(chunk)
+    history = db.execute(
+        select(models.History.zone_id, models.History.timestamp,
+               models.History.current_temp, models.History.recommended_temp),
+        execution_options={"yield_per": chunk_size}
+    )
+    for chunk in history.partitions():
+        record_history(db, [tuple(row) for row in chunk])
+        counts["history"] += len(chunk)
+    db.commit()
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="分区汇总表维护工具")
+    parser.add_argument("--rebuild", action="store_true", help="根据原始投票和历史表重建汇总表")
+    args = parser.parse_args()
+    if not args.rebuild:
+        parser.print_help()
+    else:
+        db = SessionLocal()
+        try:
+            counts = rebuild_rollups(db)
+            print(f"✅ 已根据 {counts['votes']} 张投票和 {counts['history']} 条历史记录重建汇总表")
+        finally:
+            db.close()
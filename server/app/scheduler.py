@@ -0,0 +1,175 @@
+# file: server/app/scheduler.py
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable
+
+from sqlalchemy.orm import Session
+
+from . import strategy
+from .database import SessionLocal
+from .events import event_broker
+
+logger = logging.getLogger(__name__)
+
+# 同一个分区两次重算之间的最小间隔（秒），在此期间到达的投票会被合并到下一次重算中
+RECOMPUTE_MIN_INTERVAL_SECONDS = float(os.getenv("RECOMPUTE_MIN_INTERVAL_SECONDS", "5"))
+
+
+class RecomputeScheduler:
+    """
+    【性能优化】按分区合并的重算调度器。
+
+    投票接口只负责把分区标记为“脏”，后台线程保证每个分区在 min_interval 内最多重算一次：
+    空闲分区的第一张票会立即触发重算，之后同一间隔内的投票全部合并到下一次重算中。
+    每次重算都使用独立的数据库会话，不再复用已被关闭的请求级会话。
+    on_complete 在重算之后、同一个会话中调用（例如推送分区的最新状态）。
+    周期性批量重算通过 exclusive() 独占它计算的分区，与本调度器对同一分区的重算互斥。
+    """
+
+    def __init__(self, recompute: Callable[[Session, str], None],
+                 session_factory: Callable[[], Session] = SessionLocal,
+                 min_interval: float = RECOMPUTE_MIN_INTERVAL_SECONDS,
+                 on_complete: Callable[[Session, str], None] = None):
+        self.recompute = recompute
+        self.on_complete = on_complete
+        self.session_factory = session_factory
+        self.min_interval = min_interval
+        self._cond = threading.Condition()
+        self._dirty: dict[str, int] = {}        # zone_id -> 自上次重算以来合并的投票数
+        self._last_run: dict[str, float] = {}   # zone_id -> 上次重算开始的 monotonic 时间
+        self._busy: set[str] = set()            # 本调度器正在重算的分区
+        self._held: set[str] = set()            # 被 exclusive() 独占的分区，到期的重算推迟到释放之后
+        self._thread = None
+        self._stopping = False
+        # 统计指标
+        self._votes_total = 0
+        self._merged_total = 0
+        self._runs_total = 0
+        self._errors_total = 0
+        self._max_merged = 0
+        self._last_merged: dict[str, int] = {}
+
+    def mark_dirty(self, zone_id: str, votes: int = 1):
+        """记录分区有新投票，等待调度器在允许的时间点重算。"""
+        with self._cond:
+            self._dirty[zone_id] = self._dirty.get(zone_id, 0) + votes
+            self._votes_total += votes
+            # exclusive() 的调用方也在这个条件变量上等待，必须全部唤醒，否则可能只唤醒了它们而漏掉调度线程
+            self._cond.notify_all()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="recompute-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止后台线程，并把尚未执行的重算立即跑完。"""
+        if self._thread is None:
+            return
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        self._thread.join()
+        self._thread = None
+        with self._cond:
+            pending = list(self._dirty.items())
+            self._dirty.clear()
+            # 正常关闭时周期性重算已先停止；仍被独占的分区等释放后再执行
+            zone_ids = {zone_id for zone_id, _ in pending}
+            self._cond.wait_for(lambda: not self._held & zone_ids)
+            self._busy |= zone_ids
+        for zone_id, merged in pending:
+            self._execute(zone_id, merged)
+
+    @contextmanager
+    def exclusive(self, zone_ids):
+        """
+        在 with 块内独占这些分区：先等待本调度器正在执行的这些分区的重算结束，块内到期的重算推迟到块结束后再执行。
+        同时独占的调用方之间分区不能重叠（周期性重算的各分片互不相交）。
+        """
+        zone_ids = set(zone_ids)
+        with self._cond:
+            self._held |= zone_ids
+            self._cond.wait_for(lambda: not self._busy & zone_ids)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._held -= zone_ids
+                self._cond.notify_all()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "min_interval_seconds": self.min_interval,
+                "pending_zones": len(self._dirty),
+                "held_zones": len(self._held),
+                "votes_total": self._votes_total,
+                "runs_total": self._runs_total,
+                "errors_total": self._errors_total,
+                "avg_votes_per_run": round(self._merged_total / self._runs_total, 2) if self._runs_total else 0,
+                "max_votes_per_run": self._max_merged,
+                "last_votes_per_run": dict(self._last_merged),
+            }
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if self._stopping:
+                    return
+                due, wait = self._pop_due(time.monotonic())
+                if not due:
+                    self._cond.wait(timeout=wait)
+                    continue
+            for zone_id, merged in due:
+                self._execute(zone_id, merged)
+
+    def _pop_due(self, now: float):
+        """取出所有已到重算时间的脏分区，并返回距离下一个分区到期的等待时间。"""
+        due, wait = [], None
+        for zone_id in list(self._dirty):
+            if zone_id in self._held:
+                # 释放时会唤醒调度线程，不需要计入等待时间
+                continue
+            next_run = self._last_run.get(zone_id, float("-inf")) + self.min_interval
+            if next_run <= now:
+                due.append((zone_id, self._dirty.pop(zone_id)))
+                self._busy.add(zone_id)
+                self._last_run[zone_id] = now
+            else:
+                wait = next_run - now if wait is None else min(wait, next_run - now)
+        return due, wait
+
+    def _execute(self, zone_id: str, merged: int):
+        db = self.session_factory()
+        try:
+            self.recompute(db, zone_id)
+            if self.on_complete is not None:
+                self.on_complete(db, zone_id)
+        except Exception:
+            db.rollback()
+            with self._cond:
+                self._errors_total += 1
+            logger.exception("分区重算失败", extra={"zone_id": zone_id})
+        finally:
+            db.close()
+        with self._cond:
+            self._busy.discard(zone_id)
+            self._cond.notify_all()
+            self._runs_total += 1
+            self._merged_total += merged
+            self._max_merged = max(self._max_merged, merged)
+            self._last_merged[zone_id] = merged
+
+
+# 当前进程使用的重算调度器，由 main.py 的 lifespan 启动和停止
+# 每次重算完成后把分区的变化推送给订阅的客户端
+recompute_scheduler = RecomputeScheduler(
+    strategy.calculate_recommended_temperature,
+    on_complete=event_broker.publish_zone_update
+)
@@ -2,6 +2,7 @@
 from pydantic import BaseModel, UUID4, Field
 from datetime import datetime
 from decimal import Decimal
+from typing import Optional
 
 class OrmConfig(BaseModel):
     class Config:
@@ -20,6 +21,19 @@ class VoteCreate(BaseModel):
     zone_id: str
     vote_value: int
 
+class VoteBatch(BaseModel):
+    votes: list[VoteCreate] = Field(..., min_length=1, max_length=1000)
+
+class VoteBatchResult(BaseModel):
+    accepted: int
+    queued: bool
+    rejected_zone_ids: list[str] = []
+    throttled: int = 0   # 超出 (用户, 分区) 限流而被丢弃的投票数
+
+class VoteAccepted(VoteCreate):
+    # 写后缓冲模式下的返回值：投票已进入缓冲区，尚未分配 vote_id
+    queued: bool = True
+
 class Vote(OrmConfig):
     vote_id: int
     user_id: UUID4
@@ -32,6 +46,9 @@ class VoteStats(BaseModel):
     zero: int = Field(alias='0')
     plus_one: int = Field(alias='1')
 
+class ZoneSnapshot(ZoneStatus):
+    stats: VoteStats
+
 class User(OrmConfig):
     user_id: UUID4
     first_seen_at: datetime
@@ -41,3 +58,22 @@ class HistoryRecord(OrmConfig):
     timestamp: datetime
     current_temp: float
     recommended_temp: float
+
+class ZoneRollup(BaseModel):
+    bucket: datetime
+    temp_count: int
+    current_temp_min: Optional[float] = None
+    current_temp_max: Optional[float] = None
+    current_temp_avg: Optional[float] = None
+    recommended_temp_min: Optional[float] = None
+    recommended_temp_max: Optional[float] = None
+    recommended_temp_avg: Optional[float] = None
+    votes: VoteStats
+
+class HVACDeadLetter(OrmConfig):
+    id: int
+    zone_id: str
+    temperature: float
+    attempts: int
+    last_error: Optional[str] = None
+    created_at: datetime
@@ -0,0 +1,252 @@
+# file: server/app/sharding.py
+"""
+【性能优化】按分区分片的重算归属：每个分区的重算只在一个worker（进程）中执行。
+
+原来收到投票的worker会直接在本进程重算该分区，同一分区可能在多个worker上同时重算，
+互相覆盖 zone.recommended_temp 并写入重复的历史记录。现在：
+
+- 成员租约：每个worker在 shard_members 表中登记一行，每 SHARD_HEARTBEAT_SECONDS 秒续约一次，
+  超过 SHARD_LEASE_TTL_SECONDS 未续约的成员视为已退出；正常关闭时删除自己的租约；
+- 一致性哈希：全部存活成员（每个成员 SHARD_VIRTUAL_NODES 个虚拟节点）组成哈希环，分区归属于环上顺时针的第一个成员。
+  成员增减时只有约 1/N 的分区改变归属；
+- 投票路由：写入投票后，属于本进程的分区直接交给本进程的重算调度器，其余分区按归属成员合并成消息，
+  经 PostgreSQL NOTIFY 发给归属成员的重算队列（各worker复用推送中心的监听连接）。投票触发的同一分区的重算
+  总在归属进程的调度线程中串行执行，不需要行锁，重算吞吐量随worker数增加；
+- 周期性重算也只计算本进程拥有的分区（每个worker各算自己的部分，不再选主）；
+- 成员可以在不同主机上：重算结果经推送中心的 NOTIFY 广播，每台主机上的worker在 EventBroker._dispatch 中
+  更新本机的共享分区状态表和快照缓存，不依赖同一台机器上的共享内存。
+
+非 PostgreSQL 数据库（本地开发）只有单进程，不启用分片，全部分区都在本进程重算。
+成员变化后的一个续约周期内，各worker看到的哈希环可能不同，期间同一分区偶尔会在新旧两个归属者上各重算一次；
+发给已退出成员的消息会丢失，启用周期性重算（PERIODIC_RECOMPUTE_SECONDS）时这些分区由下一轮补上。
+"""
+import bisect
+import hashlib
+import json
+import logging
+import os
+import socket
+import threading
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, select, text, update
+
+from . import models
+from .database import engine, SessionLocal, dialect_insert
+from .events import event_broker
+from .scheduler import recompute_scheduler
+
+logger = logging.getLogger(__name__)
+
+# --- 分片配置 ---
+# 是否启用分片（仅 PostgreSQL 生效）
+ZONE_SHARDING = os.getenv("ZONE_SHARDING", "true").lower() in ("1", "true", "yes")
+# 续约间隔（秒）
+SHARD_HEARTBEAT_SECONDS = float(os.getenv("SHARD_HEARTBEAT_SECONDS", "5"))
+# 租约有效期（秒），超过后成员被移出哈希环
+SHARD_LEASE_TTL_SECONDS = float(os.getenv("SHARD_LEASE_TTL_SECONDS", "15"))
+# 每个成员在哈希环上的虚拟节点数，越多分区分布越均匀
+SHARD_VIRTUAL_NODES = int(os.getenv("SHARD_VIRTUAL_NODES", "128"))
+
+# 路由重算请求的 NOTIFY 频道
+RECOMPUTE_CHANNEL = "thermasense_recompute"
+# 每条消息最多携带的分区数（NOTIFY 消息不能超过 8000 字节）
+_ZONES_PER_MESSAGE = 100
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """一致性哈希环：分区归属于哈希值顺时针方向的第一个虚拟节点所属的成员。"""
+
+    def __init__(self, members, virtual_nodes: int = SHARD_VIRTUAL_NODES):
+        self.members = tuple(sorted(members))
+        points = sorted((_hash(f"{member}#{i}"), member) for member in self.members for i in range(virtual_nodes))
+        self._keys = [key for key, _ in points]
+        self._owners = [member for _, member in points]
+
+    def owner(self, zone_id: str):
+        if not self._owners:
+            return None
+        index = bisect.bisect(self._keys, _hash(zone_id)) % len(self._keys)
+        return self._owners[index]
+
+
+class ZoneSharding:
+    """本进程在分片中的成员身份：续约租约、维护哈希环，并把投票触发的重算路由到归属成员。"""
+
+    def __init__(self, bind=engine, session_factory=SessionLocal, enabled: bool = ZONE_SHARDING,
+                 heartbeat: float = SHARD_HEARTBEAT_SECONDS, ttl: float = SHARD_LEASE_TTL_SECONDS,
+                 virtual_nodes: int = SHARD_VIRTUAL_NODES):
+        self.bind = bind
+        self.session_factory = session_factory
+        self.enabled = enabled and bind.dialect.name == "postgresql"
+        self.heartbeat = heartbeat
+        self.ttl = ttl
+        self.virtual_nodes = virtual_nodes
+        self.member_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._lock = threading.Lock()
+        self._ring = HashRing([self.member_id], virtual_nodes)
+        self._active = False
+        self._thread = None
+        self._stopping = threading.Event()
+        # 统计指标
+        self.routed_local = 0
+        self.routed_remote = 0
+        self.received = 0
+        self.rebalances = 0
+        self.heartbeat_errors = 0
+        if self.enabled:
+            event_broker.listen(RECOMPUTE_CHANNEL, self._receive)
+
+    # --- 生命周期 ---
+    def start(self):
+        if not self.enabled or self._thread is not None:
+            return
+        self._stopping.clear()
+        try:
+            self._renew()
+        except Exception:
+            # 数据库暂时不可用时先按单成员运行，由续约线程重试
+            self.heartbeat_errors += 1
+            logger.exception("分片租约登记失败，稍后重试")
+        self._active = True
+        self._thread = threading.Thread(target=self._run, name="zone-sharding", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止续约并删除自己的租约，其它成员在下一次续约时接管本进程的分区；之后的投票在本进程重算。"""
+        if self._thread is None:
+            return
+        self._active = False
+        self._stopping.set()
+        self._thread.join()
+        self._thread = None
+        db = self.session_factory()
+        try:
+            db.execute(delete(models.ShardMember).where(models.ShardMember.member_id == self.member_id))
+            db.commit()
+        except Exception:
+            logger.exception("删除分片租约失败，将在租约过期后自动移出")
+        finally:
+            db.close()
+
+    # --- 归属与路由 ---
+    def owner(self, zone_id: str) -> str:
+        if not self._active:
+            return self.member_id
+        return self._ring.owner(zone_id)
+
+    def owns(self, zone_id: str) -> bool:
+        return self.owner(zone_id) == self.member_id
+
+    def route(self, zone_counts: dict):
+        """把 {zone_id: 新投票数} 交给各分区的归属成员：本进程的直接标记为待重算，其余按成员合并后 NOTIFY。"""
+        remote = defaultdict(dict)
+        local = 0
+        for zone_id, count in zone_counts.items():
+            owner = self.owner(zone_id)
+            if owner == self.member_id:
+                recompute_scheduler.mark_dirty(zone_id, votes=count)
+                local += 1
+            else:
+                remote[owner][zone_id] = count
+        if remote:
+            try:
+                self._send(remote)
+            except Exception:
+                # 发送失败时退回本进程重算，宁可重复也不丢失
+                logger.exception("路由重算请求失败，改为在本进程重算", extra={"zones": sum(map(len, remote.values()))})
+                for zones in remote.values():
+                    for zone_id, count in zones.items():
+                        recompute_scheduler.mark_dirty(zone_id, votes=count)
+        with self._lock:
+            self.routed_local += local
+            self.routed_remote += sum(map(len, remote.values()))
+
+    def _send(self, remote: dict):
+        messages = []
+        for owner, zones in remote.items():
+            items = list(zones.items())
+            for start in range(0, len(items), _ZONES_PER_MESSAGE):
+                messages.append(json.dumps({"owner": owner, "zones": dict(items[start:start + _ZONES_PER_MESSAGE])}))
+        with self.bind.connect() as connection:
+            for message in messages:
+                connection.execute(text("SELECT pg_notify(:channel, :payload)"),
+                                   {"channel": RECOMPUTE_CHANNEL, "payload": message})
+            connection.commit()
+
+    def _receive(self, payload: str):
+        # 在推送中心的监听线程中调用；所有worker都会收到，只处理发给自己的消息
+        message = json.loads(payload)
+        if message["owner"] != self.member_id:
+            return
+        for zone_id, count in message["zones"].items():
+            recompute_scheduler.mark_dirty(zone_id, votes=count)
+        with self._lock:
+            self.received += len(message["zones"])
+
+    # --- 租约 ---
+    def _run(self):
+        while not self._stopping.wait(self.heartbeat):
+            try:
+                self._renew()
+            except Exception:
+                with self._lock:
+                    self.heartbeat_errors += 1
+                logger.exception("分片租约续约失败")
+
+    def _renew(self):
+        """续约自己的租约（被当作过期删除后重新登记），清理过期租约，并按存活成员重建哈希环。"""
+        now = datetime.utcnow()
+        expired_before = now - timedelta(seconds=self.ttl)
+        db = self.session_factory()
+        try:
+            renewed = db.execute(
+                update(models.ShardMember).where(models.ShardMember.member_id == self.member_id)
+                .values(heartbeat_at=now)
+            ).rowcount
+            if not renewed:
+                db.execute(dialect_insert(db, models.ShardMember).values(
+                    member_id=self.member_id, hostname=socket.gethostname(), pid=os.getpid(),
+                    started_at=now, heartbeat_at=now,
+                ).on_conflict_do_nothing())
+            # 过期很久的租约（进程异常退出）直接删除，保持表很小
+            db.execute(delete(models.ShardMember).where(
+                models.ShardMember.heartbeat_at < now - timedelta(seconds=self.ttl * 4)))
+            members = db.execute(
+                select(models.ShardMember.member_id).where(models.ShardMember.heartbeat_at >= expired_before)
+            ).scalars().all()
+            db.commit()
+        finally:
+            db.close()
+        members = set(members) | {self.member_id}
+        if set(self._ring.members) != members:
+            ring = HashRing(members, self.virtual_nodes)
+            with self._lock:
+                previous, self._ring = self._ring, ring
+                self.rebalances += 1
+            logger.info("分片成员变化，已重建哈希环",
+                        extra={"members": len(members), "previous_members": len(previous.members)})
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "active": self._active,
+                "member_id": self.member_id,
+                "members": len(self._ring.members),
+                "rebalances": self.rebalances,
+                "routed_local": self.routed_local,
+                "routed_remote": self.routed_remote,
+                "received": self.received,
+                "heartbeat_errors": self.heartbeat_errors,
+            }
+
+
+# 当前进程的分片成员身份，由 main.py 的 lifespan 启动和停止
+zone_sharding = ZoneSharding()
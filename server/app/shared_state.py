@@ -0,0 +1,325 @@
+# file: server/app/shared_state.py
+"""
+【性能优化】跨worker共享的分区状态表（内存映射文件 + 顺序锁）。
+
+gunicorn 的每个 UvicornWorker 是独立进程，进程内缓存的分区状态各有一份且会互相漂移。本模块把分区状态放在同一台机器上
+所有worker共同映射的一个定长文件中（默认位于 /dev/shm），每个分区占一个固定大小的槽位，保存名称、当前温度、推荐温度、
+时间窗内各投票值的票数和版本号：
+
+- 写入：重算完成后（按投票触发的重算和周期性重算）和票数变化后（vote_counts.py）由负责该分区的worker写入，
+  其它worker（包括其它主机上的）收到推送消息后把变化写入各自机器上的表（events.EventBroker._dispatch），
+  worker启动时用数据库中的数据补全全部分区；
+  每次写入（包括一次 write_many 的整批）用 fcntl 锁住整个文件，同一时间只有一个进程在写；
+- 读取：顺序锁（seqlock）——写入前后各把槽位的序号加一（写入期间为奇数），读取方在序号为偶数且读取前后不变时接受结果，
+  否则重试，读取不加锁、不访问数据库，也不在进程间复制数据；
+- 分区ID到槽位的映射由各进程根据文件头中的槽位数增量扫描得到，槽位一经分配不再改变；
+- 文件只会变大：配置了更大的容量时扩大文件并更新文件头，其它进程扫描到超出自己映射范围的槽位时重新映射；
+  布局不兼容的旧文件被换成新文件（改名替换），仍映射旧文件的进程不受影响，不会因为文件被截断而访问越界。
+
+/status、/stats 和 /snapshot 优先读取本表，表未启用、分区不在表中或多次重试仍读不到一致的数据时回退到数据库查询。
+表中的票数由 vote_counts.py 在新投票和投票过期时更新，最多滞后一个发布周期。
+字段读写依赖 x86 等平台对普通读写的顺序保证（Python 无法插入内存屏障）。
+"""
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from typing import NamedTuple, Optional
+
+try:
+    import fcntl
+except ImportError:   # Windows 等没有 fcntl 的平台不启用共享状态表
+    fcntl = None
+
+from .database import DATABASE_URL
+from .zone_cache import known_zone_ids
+
+logger = logging.getLogger(__name__)
+
+# --- 共享状态表配置 ---
+# 是否启用共享状态表
+SHARED_ZONE_STATE = os.getenv("SHARED_ZONE_STATE", "true").lower() in ("1", "true", "yes") and fcntl is not None
+# 表文件路径；默认在 /dev/shm（没有时为临时目录）下按数据库URL命名，连接同一数据库的worker共用一个文件
+SHARED_ZONE_STATE_PATH = os.getenv("SHARED_ZONE_STATE_PATH") or os.path.join(
+    "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(),
+    f"thermasense-zones-{hashlib.blake2b(DATABASE_URL.encode(), digest_size=8).hexdigest()}.tbl",
+)
+# 最多容纳的分区数（槽位数），文件大小约为 容量 × 256 字节
+SHARED_ZONE_STATE_CAPACITY = int(os.getenv("SHARED_ZONE_STATE_CAPACITY", "65536"))
+
+_MAGIC = b"TSZS"
+_LAYOUT_VERSION = 1
+# 文件头：魔数、布局版本、容量、已分配的槽位数
+_HEADER = struct.Struct("<4sIII")
+_HEADER_SIZE = 64
+_CAPACITY_OFFSET = 8
+_COUNT_OFFSET = 12
+# 槽位：序号、版本号、更新时间、当前温度、推荐温度、-1/0/1 的票数、标志位、分区ID、名称
+_RECORD = struct.Struct("<QQdddIIII64s128s")
+_SEQ = struct.Struct("<Q")
+_SLOT_SIZE = 256
+_FLAG_VALID = 1
+# 读取时遇到写入中或被改写的槽位最多重试的次数
+_READ_RETRIES = 100
+
+
+class ZoneState(NamedTuple):
+    zone_id: str
+    name: str
+    current_temp: float
+    recommended_temp: float
+    votes: dict         # {"-1": 票数, "0": 票数, "1": 票数}，格式与 /stats 接口一致
+    version: int        # 每次写入加一
+    updated_at: float   # 最近一次写入的 Unix 时间
+
+    def status(self) -> dict:
+        return {"zone_id": self.zone_id, "name": self.name,
+                "current_temp": self.current_temp, "recommended_temp": self.recommended_temp}
+
+
+class SharedZoneTable:
+    """内存映射的定长分区状态表，多进程共享，写入加锁、读取用顺序锁。"""
+
+    def __init__(self, path: str = SHARED_ZONE_STATE_PATH, capacity: int = SHARED_ZONE_STATE_CAPACITY,
+                 enabled: bool = SHARED_ZONE_STATE):
+        self.path = path
+        self.capacity = capacity
+        self.enabled = enabled
+        self._fd = None
+        self._map = None
+        self._mapped = 0                    # 当前映射覆盖的槽位数
+        self._index: dict[str, int] = {}   # zone_id -> 槽位，由文件中已分配的槽位增量扫描得到
+        self._scanned = 0
+        self._lock = threading.Lock()       # fcntl 锁只在进程间互斥，同一进程内的线程还需要这把锁
+        self._stats_lock = threading.Lock()
+        self._full_logged = False
+        # 统计指标（本进程）
+        self.reads = 0
+        self.read_retries = 0
+        self.read_misses = 0
+        self.writes = 0
+
+    # --- 生命周期 ---
+    def open(self):
+        """映射表文件：不存在时创建，容量小于配置时扩大，布局不兼容时换成新文件；从不截断其它进程正在映射的文件。"""
+        if not self.enabled or self._map is not None:
+            return
+        while True:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            fcntl.lockf(fd, fcntl.LOCK_EX, _HEADER_SIZE, 0)
+            try:
+                # 等锁期间文件可能已被其它进程换掉，此时重新打开路径上的新文件
+                capacity = self._prepare(fd) if _same_file(fd, self.path) else None
+            finally:
+                fcntl.lockf(fd, fcntl.LOCK_UN, _HEADER_SIZE, 0)
+            if capacity is not None:
+                break
+            os.close(fd)
+        self._fd = fd
+        self.capacity = capacity
+        self._map = mmap.mmap(fd, _HEADER_SIZE + capacity * _SLOT_SIZE)
+        self._mapped = capacity
+
+    def _prepare(self, fd: int) -> Optional[int]:
+        # 调用方持有文件头的锁。返回文件的容量；换成了新文件时返回 None
+        header = os.pread(fd, _HEADER.size, 0)
+        if len(header) == _HEADER.size and _HEADER.unpack(header)[:2] == (_MAGIC, _LAYOUT_VERSION):
+            capacity = _HEADER.unpack(header)[2]
+            if capacity < self.capacity:
+                # 先扩大文件再更新文件头，其它进程看到新容量时文件一定已经足够大
+                os.ftruncate(fd, _HEADER_SIZE + self.capacity * _SLOT_SIZE)
+                os.pwrite(fd, struct.pack("<I", self.capacity), _CAPACITY_OFFSET)
+                logger.info("已扩大共享分区状态表", extra={"path": self.path, "from": capacity, "to": self.capacity})
+                capacity = self.capacity
+            elif os.fstat(fd).st_size < _HEADER_SIZE + capacity * _SLOT_SIZE:
+                os.ftruncate(fd, _HEADER_SIZE + capacity * _SLOT_SIZE)
+            return capacity
+        if os.fstat(fd).st_size == 0:
+            # 刚创建的空文件
+            _initialize(fd, self.capacity)
+            logger.info("已创建共享分区状态表", extra={"path": self.path, "capacity": self.capacity})
+            return self.capacity
+        # 布局不兼容的旧文件：在临时文件中建好新表后改名替换
+        temporary = f"{self.path}.{os.getpid()}.tmp"
+        new_fd = os.open(temporary, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            _initialize(new_fd, self.capacity)
+        finally:
+            os.close(new_fd)
+        os.replace(temporary, self.path)
+        logger.info("共享分区状态表布局已变化，已换成新文件", extra={"path": self.path, "capacity": self.capacity})
+        return None
+
+    def _remap(self):
+        # 其它进程扩大了文件：按文件头中的容量重新映射。旧的映射不主动关闭，正在读取它的线程不受影响
+        capacity = struct.unpack_from("<I", self._map, _CAPACITY_OFFSET)[0]
+        self._map = mmap.mmap(self._fd, _HEADER_SIZE + capacity * _SLOT_SIZE)
+        self._mapped = self.capacity = capacity
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            os.close(self._fd)
+            self._map, self._fd, self._mapped = None, None, 0
+            self._index, self._scanned = {}, 0
+
+    # --- 读取 ---
+    def read(self, zone_id: str) -> Optional[ZoneState]:
+        """读取分区的一致快照；表未启用、分区不在表中或无法读到一致的数据时返回 None。"""
+        if self._map is None or not known_zone_ids.contains(zone_id):
+            return None
+        slot = self._slot(zone_id)
+        if slot is None:
+            self._count(misses=1)
+            return None
+        offset = _HEADER_SIZE + slot * _SLOT_SIZE
+        for attempt in range(_READ_RETRIES):
+            before = _SEQ.unpack_from(self._map, offset)[0]
+            if before % 2 == 0:
+                record = _RECORD.unpack_from(self._map, offset)
+                if _SEQ.unpack_from(self._map, offset)[0] == before:
+                    if not record[8] & _FLAG_VALID:
+                        self._count(misses=1, retries=attempt)
+                        return None
+                    self._count(reads=1, retries=attempt)
+                    return ZoneState(
+                        zone_id, record[10].rstrip(b"\0").decode(), record[3], record[4],
+                        {"-1": record[5], "0": record[6], "1": record[7]}, record[1], record[2],
+                    )
+            time.sleep(0)
+        logger.warning("共享分区状态表读取重试次数过多", extra={"zone_id": zone_id})
+        self._count(misses=1, retries=_READ_RETRIES)
+        return None
+
+    # --- 写入 ---
+    def write(self, zone_id: str, **fields):
+        self.write_many({zone_id: fields})
+
+    def write_many(self, updates: dict):
+        """
+        批量写入 {zone_id: {字段: 值}}，字段为 name / current_temp / recommended_temp / votes（/stats 格式的票数），
+        未给出的字段保持不变。新分区需要一次给出全部字段才会被标记为有效。
+        """
+        if self._map is None or not updates:
+            return
+        with self._lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX)
+            try:
+                now = time.time()
+                for zone_id, fields in updates.items():
+                    slot = self._slot(zone_id, allocate=True)
+                    if slot is not None:
+                        self._write_slot(slot, zone_id, fields, now)
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN)
+        with self._stats_lock:
+            self.writes += len(updates)
+
+    def _write_slot(self, slot: int, zone_id: str, fields: dict, now: float):
+        # 调用方持有写锁。序号先变为奇数，写完字段后再变为偶数；上次写入中途退出留下的奇数序号也能正确推进
+        offset = _HEADER_SIZE + slot * _SLOT_SIZE
+        (seq, version, _, current, recommended, down, neutral, up, flags, encoded_id, name) = \
+            _RECORD.unpack_from(self._map, offset)
+        if "name" in fields:
+            name = fields["name"].encode()
+            if len(name) > 128:
+                # 名称放不下：标记为无效，读取方回退到数据库
+                flags, name = flags & ~_FLAG_VALID, b""
+        if "current_temp" in fields:
+            current = float(fields["current_temp"])
+        if "recommended_temp" in fields:
+            recommended = float(fields["recommended_temp"])
+        if "votes" in fields:
+            votes = fields["votes"]
+            down, neutral, up = votes["-1"], votes["0"], votes["1"]
+        if {"name", "current_temp", "recommended_temp", "votes"} <= fields.keys() and name:
+            flags |= _FLAG_VALID
+        writing = (seq + 1) | 1
+        _SEQ.pack_into(self._map, offset, writing)
+        _RECORD.pack_into(self._map, offset, writing, version + 1, now, current, recommended,
+                          down, neutral, up, flags, encoded_id, name)
+        _SEQ.pack_into(self._map, offset, writing + 1)
+
+    # --- 槽位映射 ---
+    def _slot(self, zone_id: str, allocate: bool = False) -> Optional[int]:
+        slot = self._index.get(zone_id)
+        if slot is None:
+            self._scan()
+            slot = self._index.get(zone_id)
+        if slot is None and allocate:
+            slot = self._allocate(zone_id)
+        return slot
+
+    def _scan(self):
+        # 把其它进程新分配的槽位加入本进程的映射；槽位先写入分区ID再增加计数，计数以内的槽位都是完整的
+        count = struct.unpack_from("<I", self._map, _COUNT_OFFSET)[0]
+        if count > self._mapped:
+            self._remap()
+        index = dict(self._index)
+        for slot in range(self._scanned, count):
+            encoded_id = _RECORD.unpack_from(self._map, _HEADER_SIZE + slot * _SLOT_SIZE)[9]
+            index[encoded_id.rstrip(b"\0").decode()] = slot
+        self._index, self._scanned = index, max(self._scanned, count)
+
+    def _allocate(self, zone_id: str) -> Optional[int]:
+        # 调用方持有写锁（整个文件）
+        encoded_id = zone_id.encode()
+        count = struct.unpack_from("<I", self._map, _COUNT_OFFSET)[0]
+        if struct.unpack_from("<I", self._map, _CAPACITY_OFFSET)[0] > self._mapped:
+            self._remap()
+        if len(encoded_id) > 64 or count >= self.capacity:
+            if count >= self.capacity and not self._full_logged:
+                self._full_logged = True
+                logger.warning("共享分区状态表已满，新分区改为查询数据库", extra={"capacity": self.capacity})
+            return None
+        _RECORD.pack_into(self._map, _HEADER_SIZE + count * _SLOT_SIZE, 0, 0, 0.0, 0.0, 0.0, 0, 0, 0, 0, encoded_id, b"")
+        struct.pack_into("<I", self._map, _COUNT_OFFSET, count + 1)
+        self._scan()
+        return self._index[zone_id]
+
+    def _count(self, reads: int = 0, retries: int = 0, misses: int = 0):
+        with self._stats_lock:
+            self.reads += reads
+            self.read_retries += retries
+            self.read_misses += misses
+
+    def stats(self) -> dict:
+        if self._map is None:
+            return {"enabled": False}
+        return {
+            "enabled": True,
+            "path": self.path,
+            "capacity": self.capacity,
+            "zones": struct.unpack_from("<I", self._map, _COUNT_OFFSET)[0],
+            "reads": self.reads,
+            "read_retries": self.read_retries,
+            "read_misses": self.read_misses,
+            "writes": self.writes,
+        }
+
+
+def _same_file(fd: int, path: str) -> bool:
+    try:
+        stat, current = os.fstat(fd), os.stat(path)
+        return (stat.st_dev, stat.st_ino) == (current.st_dev, current.st_ino)
+    except FileNotFoundError:
+        return False
+
+
+def _initialize(fd: int, capacity: int):
+    os.ftruncate(fd, _HEADER_SIZE + capacity * _SLOT_SIZE)
+    os.pwrite(fd, _HEADER.pack(_MAGIC, _LAYOUT_VERSION, capacity, 0), 0)
+
+
+def zone_fields(zone, votes: dict) -> dict:
+    """由 Zone 对象（或同名属性的行）和票数得到 write_many 需要的完整字段。"""
+    return {"name": zone.name, "current_temp": zone.current_temp,
+            "recommended_temp": zone.recommended_temp, "votes": votes}
+
+
+# 当前进程映射的共享状态表，由 main.py 的 lifespan 打开并用数据库中的分区补全
+shared_zone_table = SharedZoneTable()
@@ -1,10 +1,14 @@
 # file: server/app/strategy.py
 from sqlalchemy.orm import Session
-from sqlalchemy import func
 from datetime import datetime, timedelta
 from uuid import UUID
 from decimal import Decimal
-from . import models, crud, hvac_controller
+from typing import NamedTuple
+import logging
+from . import models, crud, vote_window, activity, rollups, batch_strategy, metrics, hvac_controller
+from .hvac_dispatcher import hvac_dispatcher
+
+logger = logging.getLogger(__name__)
 
 # --- 可配置的策略参数 ---
 # 您可以在这里修改这些值，来调整算法的行为
@@ -28,31 +32,88 @@ MAX_TEMP_CHANGE_PER_CYCLE = 0.8 # 为防止温度剧烈波动，限制单次最
 
 # -------------------------
 
+class StrategyParams(NamedTuple):
+    """可调的策略参数；离线回放（replay.py）用它评估不同的参数组合，在线计算使用 current_params()。"""
+    adjustment_factor: float
+    max_change: float
+    weight_frequent: float
+    weight_normal: float
+    min_votes: int
+
+def current_params() -> StrategyParams:
+    return StrategyParams(TEMPERATURE_ADJUSTMENT_FACTOR, MAX_TEMP_CHANGE_PER_CYCLE,
+                          WEIGHT_FREQUENT_USER, WEIGHT_NORMAL_USER, MIN_VALID_VOTES_TO_CALCULATE)
+
 def _load_user_activity(db: Session, user_ids: list[UUID]) -> dict:
     """
-    【性能优化】通过一次数据库查询，批量加载所有相关用户的活跃度信息。
-    这避免了在循环中频繁查询数据库，是提升性能的关键。
+    【性能优化】批量加载所有相关用户的活跃度信息。
+    固定用户的判定来自写入投票时增量维护的 user_activity 表（按主键查询，已达标用户命中进程内缓存），
+    不再在每次重算时统计用户的全部历史投票。
     """
-    # 1. 一次性获取所有相关的用户信息
-    users = {u.user_id: u for u in db.query(models.User).filter(models.User.user_id.in_(user_ids)).all()}
-    
-    # 2. 一次性统计所有相关用户的总投票数
-    vote_counts = dict(
-        db.query(models.Vote.user_id, func.count(models.Vote.vote_id))
-        .filter(models.Vote.user_id.in_(user_ids))
-        .group_by(models.Vote.user_id)
-        .all()
-    )
-
-    # 3. 在内存中进行逻辑判断，组装最终结果
-    threshold_time = datetime.utcnow() - timedelta(days=FREQUENT_USER_DAYS_THRESHOLD)
-    activity_map = {}
-    for user_id, user in users.items():
-        count = vote_counts.get(user_id, 0)
-        is_frequent = (user.first_seen_at < threshold_time) and (count >= FREQUENT_USER_VOTES_THRESHOLD)
-        activity_map[user_id] = {'is_frequent': is_frequent}
-        
-    return activity_map
+    with metrics.RECOMPUTE_STEP_SECONDS.labels("activity_load").time():
+        return activity.load_user_activity(db, user_ids)
+
+# 每个进程一个的滑动窗口聚合器，由 main.py 在启动时 seed，由 submit_vote 在写库后 record
+vote_aggregator = vote_window.VoteWindowAggregator(VOTE_VALID_DURATION_MINUTES, _load_user_activity)
+
+def _weighted_average(stats: vote_window.WindowStats, params: StrategyParams = None):
+    """根据窗口汇总计算加权平均分 (S_zone)，没有有效权重时返回 None。"""
+    params = params or current_params()
+    normal_count = stats.count - stats.frequent_count
+    normal_value_sum = stats.value_sum - stats.frequent_value_sum
+    total_weight = normal_count * params.weight_normal + stats.frequent_count * params.weight_frequent
+    if total_weight == 0:
+        return None
+    weighted_vote_sum = normal_value_sum * params.weight_normal + stats.frequent_value_sum * params.weight_frequent
+    return weighted_vote_sum / total_weight
+
+def _window_vote_score(db: Session, zone_id: str):
+    """从滑动窗口聚合器获取 (有效票数, 加权平均分)。"""
+    if not vote_aggregator.seeded:
+        vote_aggregator.seed(db)
+    vote_aggregator.refresh(db)
+    stats = vote_aggregator.zone_stats(zone_id)
+    return stats.count, _weighted_average(stats)
+
+def _sql_vote_score(db: Session, zone_id: str):
+    """
+    原始的SQL实现：重新加载时间窗内的全部投票并逐票加权。
+    保留它作为滑动窗口聚合器的对照基准（见 verify_vote_window）。
+    """
+    time_threshold = datetime.utcnow() - timedelta(minutes=VOTE_VALID_DURATION_MINUTES)
+    recent_votes = db.query(models.Vote).filter(
+        models.Vote.zone_id == zone_id,
+        models.Vote.created_at >= time_threshold
+    ).all()
+    if not recent_votes:
+        return 0, None
+
+    user_ids = list({v.user_id for v in recent_votes})
+    user_activity = _load_user_activity(db, user_ids)
+
+    total_weight, weighted_vote_sum = 0, 0
+    for vote in recent_votes:
+        is_frequent = user_activity.get(vote.user_id, {}).get('is_frequent', False)
+        weight = WEIGHT_FREQUENT_USER if is_frequent else WEIGHT_NORMAL_USER
+        weighted_vote_sum += vote.vote_value * weight
+        total_weight += weight
+
+    if total_weight == 0:
+        return len(recent_votes), None
+    return len(recent_votes), weighted_vote_sum / total_weight
+
+def verify_vote_window(db: Session) -> dict:
+    """
+    【校验工具】逐个分区比较滑动窗口聚合器与原始SQL实现得到的票数和 avg_score。
+    返回不一致的分区 {zone_id: (窗口结果, SQL结果)}，为空表示两者完全一致。
+    """
+    mismatches = {}
+    for (zone_id,) in db.query(models.Zone.zone_id).all():
+        window_result = _window_vote_score(db, zone_id)
+        sql_result = _sql_vote_score(db, zone_id)
+        if window_result != sql_result:
+            mismatches[zone_id] = (window_result, sql_result)
+    return mismatches
 
 def _simulate_physical_temperature_change(zone: models.Zone):
     """
@@ -74,89 +135,108 @@ def _simulate_physical_temperature_change(zone: models.Zone):
     zone.current_temp += change
 
 
+def simulates_room_temperature() -> bool:
+    """
+    当前控制器不报告室温时，由 _simulate_physical_temperature_change 在重算中模拟 current_temp；
+    控制器报告室温时（HVAC_CONTROLLER=simulator），current_temp 只由控制器一侧写入，重算保持它不变。
+    """
+    return not hvac_controller.current_controller.reports_room_temperature
+
+
+def _compute_new_temp(recommended_temp: Decimal, avg_score: float, params: StrategyParams = None) -> float:
+    params = params or current_params()
+    # 步骤 7: 根据平均分，动态调整温度系数alpha，使系统在偏冷时响应更快
+    alpha = 0.7 if avg_score < -0.5 else params.adjustment_factor
+
+    # 步骤 8: 计算温度变化量，并限制单次最大调整幅度
+    change = alpha * avg_score
+    if abs(change) > params.max_change:
+        change = params.max_change if change > 0 else -params.max_change
+
+    # 步骤 9: 计算新的推荐温度
+    # 核心逻辑：新的推荐温度是在“上一次的推荐温度”基础上进行微调，而不是基于物理温度。
+    # 这能保证系统的调节是平滑、渐进的，避免因物理温度的短期波动而产生剧烈震荡。
+    return float(recommended_temp) + change
+
+def _setpoint_changed(recommended_temp: Decimal, new_temp: float) -> bool:
+    # 变化超过0.05°C才视为推荐温度发生了变化
+    return abs(recommended_temp - Decimal(new_temp)) > 0.05
+
+
 def calculate_recommended_temperature(db: Session, zone_id: str):
     """
     【核心算法】
     这是系统的大脑。它负责分析一个分区的数据，并计算出新的推荐温度。
+    每次计算的总耗时、各步骤耗时和结果（更新/未变化/票数不足）记录到 /metrics。
     """
+    with metrics.RECOMPUTE_STEP_SECONDS.labels("total").time():
+        outcome = _recalculate(db, zone_id)
+    metrics.RECOMPUTE_TOTAL.labels("zone", outcome).inc()
+
+def _recalculate(db: Session, zone_id: str) -> str:
     # 步骤 1: 获取分区对象
     zone = db.query(models.Zone).filter(models.Zone.zone_id == zone_id).first()
     if not zone:
-        print(f"❌ 错误: 找不到分区 {zone_id}")
-        return
+        logger.error("找不到分区", extra={"zone_id": zone_id})
+        return "zone_missing"
 
-    # 步骤 2: (可选, 用于模拟) 更新当前物理温度
-    _simulate_physical_temperature_change(zone)
+    # 步骤 2: (可选, 用于模拟) 更新当前物理温度；控制器报告室温时沿用库中的 current_temp
+    if simulates_room_temperature():
+        _simulate_physical_temperature_change(zone)
 
-    # 步骤 3: 获取近期所有有效投票
-    time_threshold = datetime.utcnow() - timedelta(minutes=VOTE_VALID_DURATION_MINUTES)
-    recent_votes = db.query(models.Vote).filter(
-        models.Vote.zone_id == zone_id,
-        models.Vote.created_at >= time_threshold
-    ).all()
+    # 步骤 3: 从滑动窗口聚合器获取近期有效投票的汇总（只处理新增和过期的投票）
+    with metrics.RECOMPUTE_STEP_SECONDS.labels("vote_fetch").time():
+        vote_count, avg_score = _window_vote_score(db, zone_id)
 
     # 步骤 4: 检查是否有足够的票数来进行有效计算
-    if len(recent_votes) < MIN_VALID_VOTES_TO_CALCULATE:
-        print(f"ℹ️ Zone {zone_id}: 投票数不足({len(recent_votes)}/{MIN_VALID_VOTES_TO_CALCULATE})，跳过本次计算。")
-        return
-
-    # 步骤 5: 批量获取所有投票者的用户类型
-    user_ids = list({v.user_id for v in recent_votes})
-    user_activity = _load_user_activity(db, user_ids)
-    
-    # 步骤 6: 计算加权平均分 (S_zone)
-    total_weight, weighted_vote_sum = 0, 0
-    for vote in recent_votes:
-        is_frequent = user_activity.get(vote.user_id, {}).get('is_frequent', False)
-        weight = WEIGHT_FREQUENT_USER if is_frequent else WEIGHT_NORMAL_USER
-        weighted_vote_sum += vote.vote_value * weight
-        total_weight += weight
-
-    if total_weight == 0:
-        return
-
-    avg_score = weighted_vote_sum / total_weight
+    if vote_count < MIN_VALID_VOTES_TO_CALCULATE:
+        logger.debug("投票数不足，跳过本次计算",
+                     extra={"zone_id": zone_id, "votes": vote_count, "min_votes": MIN_VALID_VOTES_TO_CALCULATE})
+        return "skipped_min_votes"
+
+    # 步骤 5-6: 按用户类型加权后的平均分 (S_zone) 已由聚合器的累加和得出
+    if avg_score is None:
+        return "unchanged"
     
-    # 步骤 7: 根据平均分，动态调整温度系数alpha，使系统在偏冷时响应更快
-    alpha = 0.7 if avg_score < -0.5 else TEMPERATURE_ADJUSTMENT_FACTOR
-
-    # 步骤 8: 计算温度变化量，并限制单次最大调整幅度
-    change = alpha * avg_score
-    if abs(change) > MAX_TEMP_CHANGE_PER_CYCLE:
-        change = MAX_TEMP_CHANGE_PER_CYCLE if change > 0 else -MAX_TEMP_CHANGE_PER_CYCLE
-    
-    # 步骤 9: 计算新的推荐温度
-    # 核心逻辑：新的推荐温度是在“上一次的推荐温度”基础上进行微调，而不是基于物理温度。
-    # 这能保证系统的调节是平滑、渐进的，避免因物理温度的短期波动而产生剧烈震荡。
-    new_temp = float(zone.recommended_temp) + change
+    # 步骤 7-9: 根据平均分计算新的推荐温度
+    new_temp = _compute_new_temp(zone.recommended_temp, avg_score)
     
     # 步骤 10: 只有在推荐温度确实发生变化时，才执行更新
-    if abs(zone.recommended_temp - Decimal(new_temp)) > 0.05:
+    if _setpoint_changed(zone.recommended_temp, new_temp):
         zone.recommended_temp = round(new_temp, 1)
 
         # 记录本次决策到历史表
         history_record = models.History(
             zone_id=zone_id,
             current_temp=zone.current_temp,
-            recommended_temp=zone.recommended_temp
+            recommended_temp=zone.recommended_temp,
+            timestamp=datetime.utcnow()
         )
         db.add(history_record)
+        # 同一事务中累加到分钟/小时汇总表
+        rollups.record_history(db, [(zone_id, history_record.timestamp, zone.current_temp, zone.recommended_temp)])
         
         # 一次性提交所有更改到数据库
-        db.commit()
+        with metrics.RECOMPUTE_STEP_SECONDS.labels("commit").time():
+            db.commit()
 
-        print(f"✅ Zone '{zone_id}' 推荐温度更新为: {zone.recommended_temp}°C (基于 {len(recent_votes)} 票)")
+        logger.info("推荐温度已更新",
+                    extra={"zone_id": zone_id, "recommended_temp": zone.recommended_temp, "votes": vote_count})
         
-        # 步骤 11: 调用硬件控制器，发出物理调节指令
-        hvac_controller.set_zone_temperature(zone_id, zone.recommended_temp)
+        # 步骤 11: 把新的设定值交给HVAC下发队列，由后台线程调用硬件控制器（不阻塞重算）
+        with metrics.RECOMPUTE_STEP_SECONDS.labels("hvac_dispatch").time():
+            hvac_dispatcher.submit(zone_id, zone.recommended_temp)
+        return "updated"
+    return "unchanged"
 
 def calculate_all_zones(db: Session):
     """
     【管理功能】一个方便的工具函数，用于一次性触发所有分区的温度计算。
-    未来可以设置一个定时任务来周期性地调用它。
+    【性能优化】使用 batch_strategy 的批量引擎：一次查询加载全部分区的有效投票，
+    用 NumPy 分组计算后在一个事务中写入，结果与逐个调用 calculate_recommended_temperature 一致。
+    返回推荐温度发生变化的分区ID列表。
     """
-    zones = db.query(models.Zone).all()
-    print(f"\n--- 开始周期性地为所有 {len(zones)} 个分区计算推荐温度 ---")
-    for zone in zones:
-        calculate_recommended_temperature(db, zone.zone_id)
-    print("--- 周期性计算完成 ---\n")
\ No newline at end of file
+    result = batch_strategy.calculate_zones_batch(db)
+    logger.info("全量计算完成",
+                extra={"zones": result.zones, "updated": len(result.updated), "skipped": result.skipped})
+    return result.updated
@@ -0,0 +1,127 @@
+# file: server/app/vote_counts.py
+"""
+【性能优化】让共享分区状态表中的票数跟上滑动时间窗，/stats 和 /snapshot 的票数直接读表，不再查询投票表。
+
+时间窗内的票数在两种情况下变化：写入新投票，以及投票滑出时间窗。重算只在有新投票时发生，
+投票过期时没有任何路径会更新表中的票数，因此由本模块的后台线程每 VOTE_COUNTS_PUBLISH_SECONDS 秒：
+
+1. 同步本进程的滑动窗口聚合器（一次增量查询，同时弹出过期的投票）；
+2. 取出票数发生变化的分区（vote_aggregator.pop_changed()），逐个交给 event_broker.publish_zone_update()：
+   写入本机的共享分区状态表，并经 NOTIFY 让其它worker（包括其它主机上的）在 _dispatch 中更新各自的表。
+
+每个分区只由一个进程发布：启用分区分片时是分区的归属进程，否则是持有咨询锁的leader。
+表中的票数最多滞后一个发布周期。
+"""
+import logging
+import os
+import threading
+import time
+
+from . import strategy
+from .database import engine, SessionLocal
+from .events import event_broker
+from .periodic import AdvisoryLockLeader
+from .sharding import zone_sharding
+
+logger = logging.getLogger(__name__)
+
+# 两次发布票数之间的间隔（秒），设为0表示不启用（/stats 和 /snapshot 改为按时间窗查询投票表）
+VOTE_COUNTS_PUBLISH_SECONDS = float(os.getenv("VOTE_COUNTS_PUBLISH_SECONDS", "1"))
+
+# 关闭分片时选出唯一发布者的 PostgreSQL 咨询锁的键
+VOTE_COUNTS_LOCK_KEY = 0x7468_6576   # "thev"
+
+
+class VoteCountPublisher:
+    """把滑动时间窗内票数的变化（新投票和过期）发布到共享分区状态表和推送频道。"""
+
+    def __init__(self, interval: float = VOTE_COUNTS_PUBLISH_SECONDS, bind=engine, session_factory=SessionLocal):
+        self.interval = interval
+        self.session_factory = session_factory
+        self._leader = AdvisoryLockLeader(bind, VOTE_COUNTS_LOCK_KEY, "票数发布")
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+        # 统计指标
+        self.is_leader = False
+        self.sweeps_total = 0
+        self.zones_published_total = 0
+        self.errors_total = 0
+        self.last_sweep_seconds = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.interval > 0
+
+    @property
+    def running(self) -> bool:
+        """后台线程在运行时，共享分区状态表中的票数才跟得上时间窗，接口才能直接读表中的票数。"""
+        return self._thread is not None
+
+    def start(self):
+        if not self.enabled or self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="vote-count-publisher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join()
+        self._thread = None
+        self._leader.release()
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            try:
+                self.sweep()
+            except Exception:
+                with self._lock:
+                    self.errors_total += 1
+                logger.exception("发布票数失败")
+
+    def sweep(self) -> list:
+        """同步聚合器并发布本进程负责的、票数发生变化的分区，返回发布的分区列表。"""
+        leader = zone_sharding.enabled or self._leader.acquire()
+        with self._lock:
+            self.is_leader = leader
+        if not leader:
+            # 不负责发布时也取出变化的分区，避免成为leader后重复发布已由上一任发布过的变化
+            strategy.vote_aggregator.pop_changed()
+            return []
+        started = time.perf_counter()
+        db = self.session_factory()
+        try:
+            if not strategy.vote_aggregator.seeded:
+                strategy.vote_aggregator.seed(db)
+            strategy.vote_aggregator.refresh(db)
+            zone_ids = sorted(zone_id for zone_id in strategy.vote_aggregator.pop_changed()
+                              if zone_sharding.owns(zone_id))
+            for zone_id in zone_ids:
+                event_broker.publish_zone_update(db, zone_id)
+        finally:
+            db.close()
+        with self._lock:
+            self.sweeps_total += 1
+            self.zones_published_total += len(zone_ids)
+            self.last_sweep_seconds = round(time.perf_counter() - started, 4)
+        return zone_ids
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "running": self.running,
+                "interval_seconds": self.interval,
+                "is_leader": self.is_leader,
+                "sweeps_total": self.sweeps_total,
+                "zones_published_total": self.zones_published_total,
+                "errors_total": self.errors_total,
+                "last_sweep_seconds": self.last_sweep_seconds,
+            }
+
+
+# 当前进程使用的票数发布器，由 main.py 的 lifespan 启动和停止
+vote_count_publisher = VoteCountPublisher()
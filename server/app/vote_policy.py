@@ -0,0 +1,105 @@
+# file: server/app/vote_policy.py
+"""
+【性能优化】投票写入前的策略层：按 (user_id, zone_id) 限流，以及“时间窗内最新一票生效”模式。
+
+- 限流：每个 (用户, 分区) 一个令牌桶，容量 VOTE_RATE_BURST，每分钟补充 VOTE_RATE_PER_MINUTE 个令牌。
+  超出的单票请求返回 429，批量请求中超出的投票被丢弃并计入 throttled。令牌桶在进程内维护，
+  多worker部署时每个worker各自计数，实际上限约为 worker数 × 配置值；
+- 最新一票生效（VOTE_LATEST_WINS=true）：用户在 VOTE_VALID_DURATION_MINUTES 内对同一分区再次投票时，
+  更新已有的那一票（投票值和时间），而不是插入新行。每个用户在每个分区的时间窗内最多一票，
+  投票表的行数和策略计算的输入规模都与投票频率无关。
+"""
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from fastapi import HTTPException
+
+from . import metrics
+
+# 每个 (用户, 分区) 每分钟补充的令牌数，0 表示不限流
+VOTE_RATE_PER_MINUTE = float(os.getenv("VOTE_RATE_PER_MINUTE", "1"))
+# 令牌桶容量：允许的连续投票数
+VOTE_RATE_BURST = int(os.getenv("VOTE_RATE_BURST", "3"))
+# 进程内最多保留的令牌桶数，超过后淘汰最久未使用的（被淘汰的桶相当于重新装满）
+VOTE_RATE_MAX_KEYS = int(os.getenv("VOTE_RATE_MAX_KEYS", "100000"))
+# 同一用户在时间窗内对同一分区的重复投票是否改为更新已有的一票
+VOTE_LATEST_WINS = os.getenv("VOTE_LATEST_WINS", "false").lower() in ("1", "true", "yes")
+
+
+class VoteRateLimiter:
+    """按 (user_id, zone_id) 的令牌桶限流器（线程安全，LRU淘汰）。"""
+
+    def __init__(self, rate_per_minute: float = VOTE_RATE_PER_MINUTE, burst: int = VOTE_RATE_BURST,
+                 max_keys: int = VOTE_RATE_MAX_KEYS):
+        self.rate = rate_per_minute / 60.0
+        self.burst = max(1, burst)
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._buckets: OrderedDict = OrderedDict()   # (user_id, zone_id) -> [令牌数, 上次更新时间]
+        self.allowed = 0
+        self.throttled = 0
+        self.evicted = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def acquire(self, user_id, zone_id, now: float = None) -> float:
+        """取一个令牌。成功返回0，否则返回需要等待的秒数（不消耗令牌）。"""
+        if not self.enabled:
+            return 0.0
+        now = time.monotonic() if now is None else now
+        key = (user_id, zone_id)
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [float(self.burst), now]
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+                    self.evicted += 1
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(float(self.burst), bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                self.allowed += 1
+                return 0.0
+            self.throttled += 1
+            wait = (1 - bucket[0]) / self.rate
+        metrics.VOTES_TOTAL.labels("throttled").inc()
+        return wait
+
+    def admit(self, votes: list) -> tuple[list, int]:
+        """批量投票逐票取令牌，返回 (放行的投票, 被限流的票数)。"""
+        now = time.monotonic()
+        accepted = [vote for vote in votes if self.acquire(vote.user_id, vote.zone_id, now) == 0]
+        return accepted, len(votes) - len(accepted)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "rate_per_minute": self.rate * 60,
+                "burst": self.burst,
+                "keys": len(self._buckets),
+                "allowed": self.allowed,
+                "throttled": self.throttled,
+                "evicted": self.evicted,
+                "latest_wins": VOTE_LATEST_WINS,
+            }
+
+
+# 当前进程使用的投票限流器
+vote_limiter = VoteRateLimiter()
+
+
+def enforce(vote):
+    """单票请求取一个令牌，超出限流时返回 429，Retry-After 为需要等待的秒数。"""
+    wait = vote_limiter.acquire(vote.user_id, vote.zone_id)
+    if wait:
+        raise HTTPException(status_code=429, detail="Too many votes for this zone",
+                            headers={"Retry-After": str(math.ceil(wait))})
@@ -0,0 +1,315 @@
+# file: server/app/vote_window.py
+import heapq
+import threading
+from bisect import bisect_right
+from collections import deque
+from itertools import chain
+from datetime import datetime, timedelta
+from typing import Callable, NamedTuple
+
+from sqlalchemy import func, or_
+from sqlalchemy.orm import Session
+
+from . import models
+
+# 增量同步时回看的 vote_id 数量。
+# 并发事务可能“先分配ID、后提交”，回看一小段ID区间可以补上这类迟到的投票（靠 vote_id 去重）。
+SYNC_OVERLAP_IDS = 200
+# 增量同步时按时间回看的秒数：“最新一票生效”模式下被更新的投票 vote_id 不变、created_at 变为更新时间，
+# 按时间回看才能同步到其它worker改写的投票
+SYNC_OVERLAP_SECONDS = 5
+# record() 推入、等待下一次 refresh 计入窗口的投票最多保留的条数。
+# 长时间没有 refresh 时丢弃最旧的投票：它们已经写入数据库，下一次 refresh 会按 vote_id / 时间同步回来
+MAX_PENDING_VOTES = 10000
+
+
+class WindowStats(NamedTuple):
+    """一个分区在当前时间窗内的投票汇总（已按用户类型拆分）。"""
+    count: int
+    value_sum: int
+    frequent_count: int
+    frequent_value_sum: int
+
+
+EMPTY_STATS = WindowStats(0, 0, 0, 0)
+
+
+class _UserState:
+    __slots__ = ("is_frequent", "frequent_since", "zones")
+
+    def __init__(self, is_frequent: bool, frequent_since):
+        self.is_frequent = is_frequent
+        self.frequent_since = frequent_since
+        self.zones = set()
+
+
+class _ZoneWindow:
+    """单个分区的时间有序投票缓冲区，以及按用户拆分的累加和。"""
+    __slots__ = ("entries", "per_user", "value_counts", "count", "value_sum", "frequent_count", "frequent_value_sum")
+
+    def __init__(self):
+        self.entries = deque()   # (created_at, vote_id, user_id, vote_value)，按时间升序
+        self.per_user = {}       # user_id -> [票数, 票值之和]
+        self.value_counts = {}   # 投票值 -> 票数，用于投票统计
+        self.count = 0
+        self.value_sum = 0
+        self.frequent_count = 0
+        self.frequent_value_sum = 0
+
+    def stats(self) -> WindowStats:
+        return WindowStats(self.count, self.value_sum, self.frequent_count, self.frequent_value_sum)
+
+
+class VoteWindowAggregator:
+    """
+    【性能优化】按分区维护的滑动窗口投票聚合器。
+
+    每个分区保存一个按时间排序的投票缓冲区和累加和，过期的投票从队头弹出并扣减，
+    因此重算一次推荐温度只需处理“新增 + 过期”的投票，而不是每次重新加载整个时间窗。
+    全部分区共用一个按投票时间排序的过期堆，推进窗口时只访问有投票到期的分区，不遍历全部分区。
+
+    - 启动时通过 seed() 从数据库加载窗口内的投票；
+    - submit_vote 写库后通过 record() 直接推入新投票；
+    - refresh() 按 vote_id 增量同步其它worker写入的投票（按时间同步被改写的投票），并处理过期和“固定用户”升级。
+
+    用户是否为固定用户由注入的 load_user_activity 决定（与 strategy 中的定义保持一致）。
+    由于固定用户身份只会从“否”变为“是”，聚合器只需在用户有新投票或到达 frequent_since 时重新判断。
+    """
+
+    def __init__(self, window_minutes: int, load_user_activity: Callable[[Session, list], dict]):
+        self.window = timedelta(minutes=window_minutes)
+        self._load_user_activity = load_user_activity
+        self._lock = threading.Lock()
+        self._zones: dict[str, _ZoneWindow] = {}
+        self._users: dict = {}
+        self._seen: dict = {}         # vote_id -> (zone_id, 缓冲区中的条目)
+        self._promotions: list = []   # 小顶堆: (frequent_since, user_id)
+        self._expiry: list = []       # 小顶堆: (created_at, zone_id)，每张计入窗口的投票一项
+        self._pending = deque(maxlen=MAX_PENDING_VOTES)   # record() 推入、尚未计入窗口的投票
+        self._changed: set = set()    # 自上次 pop_changed() 以来票数变化的分区（新投票或投票过期）
+        self._last_vote_id = 0
+        self._synced_at = None
+        self.seeded = False
+
+    # --- 数据入口 ---
+    def seed(self, db: Session):
+        """从数据库加载当前时间窗内的全部投票，作为聚合器的初始状态。"""
+        threshold = datetime.utcnow() - self.window
+        rows = (
+            db.query(models.Vote.vote_id, models.Vote.user_id, models.Vote.zone_id,
+                     models.Vote.vote_value, models.Vote.created_at)
+            .filter(models.Vote.created_at >= threshold)
+            .order_by(models.Vote.created_at.asc())
+            .all()
+        )
+        max_id = db.query(func.max(models.Vote.vote_id)).scalar() or 0
+        with self._lock:
+            self._zones.clear()
+            self._users.clear()
+            self._seen.clear()
+            self._promotions.clear()
+            self._expiry.clear()
+            self._pending.clear()
+            self._apply_votes(db, rows, threshold)
+            self._last_vote_id = max_id
+            self._synced_at = threshold + self.window
+            self._changed.clear()
+            self.seeded = True
+
+    def record(self, vote):
+        """在投票写库成功后调用，把新投票推入聚合器（下一次 refresh 时生效）。"""
+        with self._lock:
+            self._pending.append(
+                (vote.vote_id, vote.user_id, vote.zone_id, vote.vote_value, vote.created_at)
+            )
+
+    def refresh(self, db: Session, now: datetime = None):
+        """
+        同步新投票、处理固定用户升级并弹出过期投票。
+        投票查询和新投票者的活跃度查询都在锁外执行，只在合并进窗口时持锁，不阻塞并发的 zone_stats / record。
+        """
+        now = now or datetime.utcnow()
+        threshold = now - self.window
+        with self._lock:
+            last_vote_id, synced_at = self._last_vote_id, self._synced_at
+        changed = models.Vote.vote_id > last_vote_id - SYNC_OVERLAP_IDS
+        if synced_at is not None:
+            changed = or_(changed, models.Vote.created_at >= synced_at - timedelta(seconds=SYNC_OVERLAP_SECONDS))
+        rows = (
+            db.query(models.Vote.vote_id, models.Vote.user_id, models.Vote.zone_id,
+                     models.Vote.vote_value, models.Vote.created_at)
+            .filter(changed, models.Vote.created_at >= threshold)
+            .all()
+        )
+        with self._lock:
+            to_classify = self._unclassified(chain(self._pending, rows))
+        # 没有活跃度记录的用户不在返回结果中，也记为已加载，合并时不再重复查询
+        activity = {user_id: {} for user_id in to_classify}
+        if to_classify:
+            activity.update(self._load_user_activity(db, to_classify))
+        with self._lock:
+            new_votes = list(self._pending) + list(rows)
+            self._pending.clear()
+            self._advance(db, new_votes, now, activity)
+            # 并发的 refresh 可能以更早的 now 后完成，同步时间只前进不后退
+            self._synced_at = now if self._synced_at is None else max(self._synced_at, now)
+
+    def advance(self, db: Session, votes: list, now: datetime):
+        """
+        把 votes（(vote_id, user_id, zone_id, vote_value, created_at) 元组）计入窗口，并把窗口推进到 now。
+        不查询投票表，供离线回放（replay.py）按历史时间驱动聚合器。
+        """
+        with self._lock:
+            self._advance(db, votes, now)
+
+    def zone_ids(self) -> list[str]:
+        """当前时间窗内有投票的分区。"""
+        with self._lock:
+            return list(self._zones)
+
+    def zone_stats(self, zone_id: str) -> WindowStats:
+        with self._lock:
+            window = self._zones.get(zone_id)
+            return window.stats() if window else EMPTY_STATS
+
+    def vote_counts(self, zone_id: str) -> dict:
+        """分区在当前时间窗内每种投票值的票数，格式与 /stats 接口一致。"""
+        with self._lock:
+            window = self._zones.get(zone_id)
+            counts = window.value_counts if window else {}
+            return {str(value): counts.get(value, 0) for value in (-1, 0, 1)}
+
+    def pop_changed(self) -> set:
+        """返回并清空自上次调用以来票数发生变化的分区（新投票计入或投票滑出时间窗），供 vote_counts.py 发布。"""
+        with self._lock:
+            changed, self._changed = self._changed, set()
+            return changed
+
+    # --- 内部实现（调用方需持有锁） ---
+    def _advance(self, db: Session, votes, now: datetime, activity: dict = None):
+        threshold = now - self.window
+        self._apply_votes(db, votes, threshold, activity)
+        self._promote_due(now)
+        self._expire(threshold)
+
+    def _unclassified(self, votes) -> list:
+        # 新投票会改变用户的总票数，因此只需为尚未成为固定用户的投票者重新加载活跃度
+        return list({
+            vote[1] for vote in votes
+            if vote[1] not in self._users or not self._users[vote[1]].is_frequent
+        })
+
+    def _apply_votes(self, db: Session, votes, threshold: datetime, preloaded: dict = None):
+        # 同一张投票出现多次时（本进程推入的和从数据库同步的，或被改写前后的两个版本）只保留时间最新的版本
+        latest = {}
+        for vote in votes:
+            if vote[4] >= threshold and (vote[0] not in latest or latest[vote[0]][4] < vote[4]):
+                latest[vote[0]] = vote
+        fresh = []
+        for vote in latest.values():
+            vote_id, user_id, zone_id, vote_value, created_at = vote
+            entry = (created_at, vote_id, user_id, vote_value)
+            seen = self._seen.get(vote_id)
+            if seen is not None:
+                if seen == (zone_id, entry) or seen[1] > entry:
+                    continue
+                # “最新一票生效”模式下被改写的投票：先撤销旧值，再按新值计入
+                self._remove(*seen)
+            self._seen[vote_id] = (zone_id, entry)
+            self._last_vote_id = max(self._last_vote_id, vote_id)
+            fresh.append(vote)
+        if not fresh:
+            return
+
+        to_classify = self._unclassified(fresh)
+        # refresh() 在锁外预先加载的活跃度可以直接使用，此后才出现的投票者在这里补查
+        preloaded = preloaded or {}
+        missing = [user_id for user_id in to_classify if user_id not in preloaded]
+        activity = {**preloaded, **self._load_user_activity(db, missing)} if missing else preloaded
+        for user_id in to_classify:
+            info = activity.get(user_id, {})
+            state = self._users.get(user_id)
+            if state is None:
+                state = self._users[user_id] = _UserState(False, None)
+            self._set_frequent_since(user_id, state, info.get('frequent_since'))
+            if info.get('is_frequent'):
+                self._promote(user_id, state)
+
+        for vote_id, user_id, zone_id, vote_value, created_at in fresh:
+            window = self._zones.get(zone_id)
+            if window is None:
+                window = self._zones[zone_id] = _ZoneWindow()
+            entry = (created_at, vote_id, user_id, vote_value)
+            if window.entries and window.entries[-1] > entry:
+                # 乱序到达（例如其它worker迟提交），按时间插入以保证队头总是最旧的投票
+                window.entries.insert(bisect_right(window.entries, entry), entry)
+            else:
+                window.entries.append(entry)
+            heapq.heappush(self._expiry, (created_at, zone_id))
+            self._add(window, zone_id, user_id, vote_value, 1)
+
+    def _add(self, window: _ZoneWindow, zone_id: str, user_id, vote_value: int, sign: int):
+        state = self._users[user_id]
+        totals = window.per_user.setdefault(user_id, [0, 0])
+        totals[0] += sign
+        totals[1] += sign * vote_value
+        window.count += sign
+        window.value_sum += sign * vote_value
+        window.value_counts[vote_value] = window.value_counts.get(vote_value, 0) + sign
+        self._changed.add(zone_id)
+        if state.is_frequent:
+            window.frequent_count += sign
+            window.frequent_value_sum += sign * vote_value
+        if totals[0]:
+            state.zones.add(zone_id)
+            return
+        del window.per_user[user_id]
+        state.zones.discard(zone_id)
+        if not state.zones:
+            # 用户已不在任何时间窗中，下次出现时重新从数据库判断
+            del self._users[user_id]
+
+    def _remove(self, zone_id: str, entry: tuple):
+        window = self._zones[zone_id]
+        window.entries.remove(entry)
+        self._add(window, zone_id, entry[2], entry[3], -1)
+        if not window.entries:
+            del self._zones[zone_id]
+
+    def _set_frequent_since(self, user_id, state: _UserState, frequent_since):
+        state.frequent_since = frequent_since
+        if frequent_since is not None and not state.is_frequent:
+            heapq.heappush(self._promotions, (frequent_since, user_id))
+
+    def _promote(self, user_id, state: _UserState):
+        if state.is_frequent:
+            return
+        state.is_frequent = True
+        for zone_id in state.zones:
+            window = self._zones[zone_id]
+            count, value_sum = window.per_user[user_id]
+            window.frequent_count += count
+            window.frequent_value_sum += value_sum
+
+    def _promote_due(self, now: datetime):
+        # 与 strategy 的判断保持一致: first_seen_at < now - N天，即 frequent_since < now
+        while self._promotions and self._promotions[0][0] < now:
+            frequent_since, user_id = heapq.heappop(self._promotions)
+            state = self._users.get(user_id)
+            if state is not None and state.frequent_since == frequent_since:
+                self._promote(user_id, state)
+
+    def _expire(self, threshold: datetime):
+        # 堆中可能残留已被弹出或改写的投票对应的项，这些项出堆时分区的队头已不早于阈值（或分区已删除），不做任何处理
+        while self._expiry and self._expiry[0][0] < threshold:
+            _, zone_id = heapq.heappop(self._expiry)
+            window = self._zones.get(zone_id)
+            if window is None:
+                continue
+            entries = window.entries
+            while entries and entries[0][0] < threshold:
+                _, vote_id, user_id, vote_value = entries.popleft()
+                self._seen.pop(vote_id, None)
+                self._add(window, zone_id, user_id, vote_value, -1)
+            if not entries:
+                del self._zones[zone_id]
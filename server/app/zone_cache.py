@@ -0,0 +1,142 @@
+# file: server/app/zone_cache.py
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, NamedTuple
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
+# 缓存条目的最长存活时间（秒）。正常情况下条目会在投票写入或重算提交时被主动失效，TTL只是兜底
+ZONE_CACHE_TTL_SECONDS = float(os.getenv("ZONE_CACHE_TTL_SECONDS", "5"))
+
+# 分区列表在缓存中使用的键
+ZONES_KEY = "__zones__"
+
+
+class CacheEntry(NamedTuple):
+    body: bytes        # 已序列化的JSON响应体
+    etag: str          # 基于内容的版本号，不同worker对相同数据得到相同的ETag
+    expires_at: float
+
+
+class ZoneSnapshotCache:
+    """
+    【性能优化】按分区的快照缓存（进程内，带TTL）。
+
+    - 命中时直接返回已序列化好的响应体，不访问数据库；
+    - 投票写入、重算提交（包括其它worker通过推送通道广播的更新）时主动失效对应分区，
+      重算提交时同时失效分区列表（列表中带有各分区的当前温度）；
+    - 每个条目带一个由内容计算的 ETag，客户端带 If-None-Match 轮询且数据未变时返回 304。
+    """
+
+    def __init__(self, ttl: float = ZONE_CACHE_TTL_SECONDS):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: dict[str, CacheEntry] = {}
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.invalidations = 0
+
+    def get(self, key: str):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at > now:
+                self.hits += 1
+                return entry
+            self.misses += 1
+            return None
+
+    def put(self, key: str, payload: Any) -> CacheEntry:
+        body = json.dumps(jsonable_encoder(payload), ensure_ascii=False, separators=(",", ":")).encode()
+        etag = 'W/"%s"' % hashlib.blake2b(body, digest_size=8).hexdigest()
+        entry = CacheEntry(body, etag, time.monotonic() + self.ttl)
+        with self._lock:
+            self._entries[key] = entry
+        return entry
+
+    def invalidate(self, *keys: str):
+        with self._lock:
+            for key in keys:
+                if self._entries.pop(key, None) is not None:
+                    self.invalidations += 1
+
+    def invalidate_zone(self, zone_id: str):
+        """分区的温度或推荐温度已变化：失效该分区的快照，以及包含各分区当前温度的分区列表。"""
+        self.invalidate(zone_id, ZONES_KEY)
+
+    def respond(self, request: Request, entry: CacheEntry) -> Response:
+        """根据 If-None-Match 返回 304 或带 ETag 的完整响应。"""
+        headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+        candidates = {tag.strip() for tag in request.headers.get("if-none-match", "").split(",")}
+        if entry.etag in candidates or "*" in candidates:
+            with self._lock:
+                self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        return Response(content=entry.body, media_type="application/json", headers=headers)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "ttl_seconds": self.ttl,
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0,
+                "not_modified": self.not_modified,
+                "invalidations": self.invalidations,
+            }
+
+
+# 当前进程使用的分区快照缓存
+zone_cache = ZoneSnapshotCache()
+
+
+class KnownZoneIds:
+    """
+    【性能优化】进程内的分区ID集合，投票写入时用它校验分区是否存在，不再每票查询一次 zones 表。
+
+    启动时加载全部分区ID；集合中没有的ID由调用方回查数据库，查到的再加入集合，
+    因此在其它进程中新建的分区无需重启即可投票。分区不会被删除（投票和历史记录通过外键引用它），集合只增不减。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids: set[str] = set()
+        self.hits = 0
+        self.misses = 0
+
+    def add(self, zone_ids) -> set[str]:
+        """把已确认存在的分区ID加入集合，返回这些ID。"""
+        zone_ids = set(zone_ids)
+        with self._lock:
+            self._ids |= zone_ids
+        return zone_ids
+
+    def partition(self, zone_ids) -> tuple[set[str], set[str]]:
+        """返回 (集合中已有的ID, 需要回查数据库的ID)。"""
+        zone_ids = set(zone_ids)
+        with self._lock:
+            known = zone_ids & self._ids
+            unknown = zone_ids - known
+            self.hits += len(known)
+            self.misses += len(unknown)
+        return known, unknown
+
+    def contains(self, zone_id: str) -> bool:
+        """只查集合、不计入命中统计（集合中没有不代表分区不存在）。"""
+        with self._lock:
+            return zone_id in self._ids
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"zones": len(self._ids), "hits": self.hits, "misses": self.misses}
+
+
+# 当前进程已知存在的分区ID
+known_zone_ids = KnownZoneIds()
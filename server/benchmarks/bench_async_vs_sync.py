@@ -0,0 +1,116 @@
+# file: server/benchmarks/bench_async_vs_sync.py
+"""
+对比同步模式与异步模式(DB_ASYNC_MODE)下投票和状态接口的吞吐量 (requests/s)。
+
+脚本会分别以两种模式启动一个 uvicorn 进程（连接 .env 中配置的同一个数据库），
+用固定并发持续压测 /api/zones/{id}/status、/api/zones/{id}/stats 和 /api/vote/，最后打印对比表。
+
+用法（在 server/ 目录下）:
+    python -m benchmarks.bench_async_vs_sync --concurrency 64 --duration 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+import uuid
+
+import httpx
+
+ENDPOINTS = ("status", "stats", "vote")
+
+
+def _start_server(async_mode: bool, port: int) -> subprocess.Popen:
+    # 每个压测连接固定用一个用户投票，关闭 (用户, 分区) 限流，测的是写入路径本身的吞吐量
+    env = dict(os.environ, DB_ASYNC_MODE="true" if async_mode else "false", VOTE_RATE_PER_MINUTE="0")
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        env=env,
+    )
+
+
+async def _wait_ready(client: httpx.AsyncClient, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get("/")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("服务未能在规定时间内启动")
+
+
+async def _hammer(client: httpx.AsyncClient, endpoint: str, zone_id: str, concurrency: int, duration: float):
+    deadline = time.monotonic() + duration
+    ok = errors = 0
+    user_ids = [str(uuid.uuid4()) for _ in range(concurrency)]
+
+    async def worker(user_id: str):
+        nonlocal ok, errors
+        while time.monotonic() < deadline:
+            if endpoint == "vote":
+                response = await client.post(
+                    "/api/vote/", json={"user_id": user_id, "zone_id": zone_id, "vote_value": 0}
+                )
+            else:
+                response = await client.get(f"/api/zones/{zone_id}/{endpoint}")
+            if response.status_code < 300:
+                ok += 1
+            else:
+                errors += 1
+
+    started = time.monotonic()
+    await asyncio.gather(*(worker(user_id) for user_id in user_ids))
+    elapsed = time.monotonic() - started
+    return {"requests": ok, "errors": errors, "rps": round(ok / elapsed, 1)}
+
+
+async def _bench_mode(async_mode: bool, port: int, concurrency: int, duration: float) -> dict:
+    server = _start_server(async_mode, port)
+    limits = httpx.Limits(max_connections=concurrency)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=30) as client:
+            await _wait_ready(client)
+            zones = (await client.get("/api/zones/")).json()
+            if not zones:
+                raise RuntimeError("数据库中没有分区，请先运行 python -m app.migrate 和 python -m app.init_db")
+            zone_id = zones[0]["zone_id"]
+            return {
+                endpoint: await _hammer(client, endpoint, zone_id, concurrency, duration)
+                for endpoint in ENDPOINTS
+            }
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="同步/异步模式吞吐量对比")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0, help="每个接口的压测时长（秒）")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--output", help="把结果另存为JSON文件")
+    args = parser.parse_args()
+
+    results = {
+        "sync": asyncio.run(_bench_mode(False, args.port, args.concurrency, args.duration)),
+        "async": asyncio.run(_bench_mode(True, args.port + 1, args.concurrency, args.duration)),
+    }
+
+    print(f"{'endpoint':<10}{'sync rps':>12}{'async rps':>12}{'speedup':>10}")
+    for endpoint in ENDPOINTS:
+        sync_rps = results["sync"][endpoint]["rps"]
+        async_rps = results["async"][endpoint]["rps"]
+        speedup = f"{async_rps / sync_rps:.2f}x" if sync_rps else "-"
+        print(f"{endpoint:<10}{sync_rps:>12}{async_rps:>12}{speedup:>10}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"concurrency": args.concurrency, "duration": args.duration, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
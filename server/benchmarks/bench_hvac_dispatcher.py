@@ -0,0 +1,138 @@
+# file: server/benchmarks/bench_hvac_dispatcher.py
+"""
+用带延迟和失败率的 FakeHVACController 压测 HVAC 下发队列，并与原来的同步直接调用对比。
+
+对比三种方式:
+  - direct:   在重算线程中逐条同步调用控制器（原实现）；
+  - queued:   下发队列，逐分区调用（控制器不支持多分区写入）；
+  - batched:  下发队列，把多个分区合并成一次调用。
+
+输出重算线程被阻塞的总时间、全部指令下发完成的耗时、控制器调用次数、去重/重试/死信数量，
+并检查每个分区最终生效的温度是否等于最后一次提交的设定值（进入死信的分区除外）。
+不需要数据库：死信只记录在内存中。
+
+用法（在 server/ 目录下）:
+    python -m benchmarks.bench_hvac_dispatcher --setpoints 2000 --latency 0.02 --failure-rate 0.1
+"""
+import argparse
+import random
+import time
+from decimal import Decimal
+
+from app.hvac_controller import FakeHVACController
+from app.hvac_dispatcher import HVACDispatcher
+
+
+def _workload(zones: int, setpoints: int, seed: int = 42):
+    rng = random.Random(seed)
+    return [
+        (f"zone-{rng.randrange(zones)}", Decimal(rng.randint(180, 280)) / 10)
+        for _ in range(setpoints)
+    ]
+
+
+def _pace(index: int, started: float, rate: float):
+    # 按固定速率提交，模拟重算线程持续产生设定值
+    if rate > 0:
+        delay = started + index / rate - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+def run_direct(workload, args) -> dict:
+    controller = FakeHVACController(args.latency, args.failure_rate)
+    failures, blocked = 0, 0.0
+    started = time.monotonic()
+    for index, (zone_id, temperature) in enumerate(workload):
+        _pace(index, started, args.rate)
+        call_started = time.monotonic()
+        try:
+            controller.set_temperature(zone_id, temperature)
+        except ConnectionError:
+            failures += 1
+        blocked += time.monotonic() - call_started
+    return {
+        "blocked_seconds": blocked,
+        "drain_seconds": time.monotonic() - started,
+        "controller_calls": controller.calls,
+        "failed_without_retry": failures,
+        "correct": _check(controller, workload, set()),
+    }
+
+
+def run_dispatcher(workload, args, batched: bool) -> dict:
+    controller = FakeHVACController(args.latency, args.failure_rate)
+    controller.supports_batch = batched
+    dead = []
+    dispatcher = HVACDispatcher(
+        controller, max_concurrency=args.concurrency, batch_size=args.batch_size,
+        timeout=args.timeout, max_retries=args.retries, backoff=args.backoff, dead_letter=dead.extend
+    )
+    dispatcher.start()
+    blocked = 0.0
+    started = time.monotonic()
+    for index, (zone_id, temperature) in enumerate(workload):
+        _pace(index, started, args.rate)
+        call_started = time.monotonic()
+        dispatcher.submit(zone_id, temperature)
+        blocked += time.monotonic() - call_started
+    while True:
+        stats = dispatcher.stats()
+        if not stats["pending"] and not stats["in_flight"]:
+            break
+        time.sleep(0.005)
+    drain = time.monotonic() - started
+    dispatcher.stop()
+    stats = dispatcher.stats()
+    return {
+        "blocked_seconds": blocked,
+        "drain_seconds": drain,
+        "controller_calls": stats["calls_total"],
+        "deduplicated": stats["deduplicated_total"],
+        "retries": stats["retries_total"],
+        "timeouts": stats["timeouts_total"],
+        "dead_letters": stats["dead_letters_total"],
+        "correct": _check(controller, workload, {letter.zone_id for letter in dead}),
+    }
+
+
+def _check(controller: FakeHVACController, workload, dead_zones: set) -> bool:
+    latest = dict(workload)
+    return all(controller.applied.get(zone_id) == temperature
+               for zone_id, temperature in latest.items() if zone_id not in dead_zones)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HVAC下发队列压测")
+    parser.add_argument("--zones", type=int, default=200)
+    parser.add_argument("--setpoints", type=int, default=1000, help="提交的设定值总数")
+    parser.add_argument("--rate", type=float, default=500, help="每秒提交的设定值数，0表示不限速")
+    parser.add_argument("--latency", type=float, default=0.02, help="假控制器每次调用的延迟（秒）")
+    parser.add_argument("--failure-rate", type=float, default=0.05, help="假控制器每次调用的失败概率")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--timeout", type=float, default=1.0)
+    parser.add_argument("--retries", type=int, default=3)
+    parser.add_argument("--backoff", type=float, default=0.05)
+    args = parser.parse_args()
+
+    workload = _workload(args.zones, args.setpoints)
+    results = {
+        "direct": run_direct(workload, args),
+        "queued": run_dispatcher(workload, args, batched=False),
+        "batched": run_dispatcher(workload, args, batched=True),
+    }
+
+    columns = ["blocked_seconds", "drain_seconds", "controller_calls", "deduplicated",
+               "retries", "timeouts", "dead_letters", "failed_without_retry", "correct"]
+    print(f"{'mode':<10}" + "".join(f"{column:>22}" for column in columns))
+    for mode, result in results.items():
+        cells = []
+        for column in columns:
+            value = result.get(column, "-")
+            cells.append(f"{value:>22.3f}" if isinstance(value, float) else f"{str(value):>22}")
+        print(f"{mode:<10}" + "".join(cells))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+# file: server/benchmarks/bench_shared_state.py
+"""
+跨worker共享分区状态表（app/shared_state.py）的一致性和读取延迟。
+
+- consistency：一个写进程不停改写全部分区（每次写入的温度和票数满足固定关系），多个读进程同时随机读取并校验该关系，
+  统计读取次数、重试次数和读到不一致数据的次数（应为0）；
+- latency：同一批分区的 /status 数据，分别从共享状态表读取和查询数据库的耗时（/stats 的票数总是查询投票表）。
+
+用法（在 server/ 目录下）:
+    python -m benchmarks.bench_shared_state --zones 10000 --readers 4 --seconds 5
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.common import default_sqlite_url, use_database, seed_database, summarize, timed, write_results
+
+
+def _table_path(name: str) -> str:
+    return os.path.join("/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(),
+                        f"thermasense-bench-{name}-{os.getpid()}.tbl")
+
+
+def _state(zone_id: str, value: int) -> dict:
+    # 写入的各字段都由 value 决定，读到的字段之间不满足该关系即说明读到了写了一半的槽位
+    return {"name": f"{zone_id}-{value}", "current_temp": value / 10, "recommended_temp": value / 10 + 1,
+            "votes": {"-1": value, "0": value + 1, "1": value + 2}}
+
+
+def _writer(path, capacity, zone_ids, ready, stop, counts):
+    from app.shared_state import SharedZoneTable
+
+    table = SharedZoneTable(path, capacity, enabled=True)
+    table.open()
+    ready.wait()
+    value = 0
+    while not stop.is_set():
+        value += 1
+        for zone_id in zone_ids:
+            table.write(zone_id, **_state(zone_id, value))
+    counts["writes"] = value * len(zone_ids)
+
+
+def _reader(path, capacity, zone_ids, ready, stop, counts, index):
+    from app.shared_state import SharedZoneTable
+    from app.zone_cache import known_zone_ids
+
+    known_zone_ids.add(zone_ids)
+    table = SharedZoneTable(path, capacity, enabled=True)
+    table.open()
+    ready.wait()
+    rng = random.Random(index)
+    reads = inconsistent = 0
+    while not stop.is_set():
+        # stop 是跨进程代理，每次检查都是一次IPC，因此每1000次读取检查一次
+        for zone_id in rng.choices(zone_ids, k=1000):
+            state = table.read(zone_id)
+            reads += 1
+            expected = _state(zone_id, state.votes["-1"])
+            if state._replace(version=0, updated_at=0) != state._replace(version=0, updated_at=0, **expected):
+                inconsistent += 1
+    counts[f"reader-{index}"] = (reads, table.read_retries, inconsistent)
+
+
+def run_consistency(args) -> dict:
+    from app.shared_state import SharedZoneTable
+
+    path = _table_path("consistency")
+    zone_ids = [f"zone-{i:05d}" for i in range(args.zones)]
+    table = SharedZoneTable(path, args.zones, enabled=True)
+    table.open()
+    table.write_many({zone_id: _state(zone_id, 0) for zone_id in zone_ids})
+
+    context = multiprocessing.get_context("spawn")
+    with context.Manager() as manager:
+        stop, counts = manager.Event(), manager.dict()
+        # 子进程启动（导入 app）可能比测试时长还慢，全部就绪后再开始计时
+        ready = manager.Barrier(args.readers + 2)
+        processes = [context.Process(target=_writer, args=(path, args.zones, zone_ids, ready, stop, counts))]
+        processes += [context.Process(target=_reader, args=(path, args.zones, zone_ids, ready, stop, counts, i))
+                      for i in range(args.readers)]
+        for process in processes:
+            process.start()
+        ready.wait()
+        time.sleep(args.seconds)
+        stop.set()
+        for process in processes:
+            process.join()
+        counts = dict(counts)
+    table.close()
+    os.remove(path)
+
+    readers = [value for key, value in counts.items() if key.startswith("reader-")]
+    return {
+        "seconds": args.seconds,
+        "writes": counts.get("writes", 0),
+        "reads": sum(reads for reads, _, _ in readers),
+        "reads_per_second": round(sum(reads for reads, _, _ in readers) / args.seconds),
+        "read_retries": sum(retries for _, retries, _ in readers),
+        "inconsistent_reads": sum(bad for _, _, bad in readers),
+    }
+
+
+def run_latency(args) -> dict:
+    data = seed_database(args.zones, 1000, args.zones * 5, with_rollups=False)
+
+    import app.main  # noqa: F401  api 依赖 main 中的 templates，需要先导入 main
+    from app import models, schemas, strategy
+    from app.database import SessionLocal
+    from app.shared_state import SharedZoneTable, zone_fields
+    from app.zone_cache import known_zone_ids
+
+    zone_ids = data["zone_ids"]
+    rng = random.Random(0)
+    sample = [rng.choice(zone_ids) for _ in range(args.reads)]
+    db = SessionLocal()
+    try:
+        strategy.vote_aggregator.seed(db)
+        known_zone_ids.add(zone_ids)
+        table = SharedZoneTable(_table_path("latency"), args.zones, enabled=True)
+        table.open()
+        table.write_many({zone.zone_id: zone_fields(zone, strategy.vote_aggregator.vote_counts(zone.zone_id))
+                          for zone in db.query(models.Zone)})
+
+        def from_database(zone_id):
+            zone = db.query(models.Zone).filter(models.Zone.zone_id == zone_id).first()
+            return schemas.ZoneStatus.model_validate(zone)
+
+        def from_table(zone_id):
+            return table.read(zone_id).status()
+
+        results = {
+            "database": summarize(timed(from_database, len(sample), setup=sample.__getitem__)),
+            "shared_table": summarize(timed(from_table, len(sample), setup=sample.__getitem__)),
+        }
+        table.close()
+        os.remove(table.path)
+        return results
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="共享分区状态表的一致性和读取延迟")
+    parser.add_argument("--database-url", default=default_sqlite_url("shared-state"))
+    parser.add_argument("--zones", type=int, default=10000)
+    parser.add_argument("--readers", type=int, default=4, help="并发读取的进程数")
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--reads", type=int, default=5000, help="延迟测试的读取次数")
+    parser.add_argument("--output", help="结果文件路径，默认写入 benchmarks/results/")
+    args = parser.parse_args()
+
+    use_database(args.database_url)
+    consistency = run_consistency(args)
+    print(f"一致性：{consistency['writes']} 次写入期间 {args.readers} 个进程读取 {consistency['reads']} 次"
+          f"（{consistency['reads_per_second']}/秒），重试 {consistency['read_retries']} 次，"
+          f"不一致 {consistency['inconsistent_reads']} 次")
+    latency = run_latency(args)
+    for name, stats in latency.items():
+        print(f"{name:<14} p50 {stats['p50_ms']} ms  p99 {stats['p99_ms']} ms")
+
+    params = {key: value for key, value in vars(args).items() if key not in ("database_url", "output")}
+    path = write_results("shared-state", params, {"consistency": consistency, **latency}, args.output)
+    print(f"\n结果已写入 {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+# file: server/benchmarks/common.py
+"""
+压测脚本共用的工具：选择数据库、生成测试数据、统计耗时和写出结果文件。
+
+注意：use_database() 必须在导入 app 中任何模块之前调用，因为 app.database 在导入时就创建了引擎。
+"""
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+# 结果文件的默认目录
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+def default_sqlite_url(name: str) -> str:
+    return f"sqlite:///{os.path.join(tempfile.gettempdir(), f'thermasense-{name}.db')}"
+
+
+def use_database(url: str, reset: bool = True):
+    """让之后导入的 app 模块连接指定的数据库；reset 时删除旧的 SQLite 文件。"""
+    from sqlalchemy.engine import make_url
+
+    if "app" in sys.modules:
+        raise RuntimeError("use_database() 必须在导入 app 之前调用")
+    parsed = make_url(url)
+    if reset and parsed.get_backend_name() == "sqlite" and parsed.database and os.path.exists(parsed.database):
+        os.remove(parsed.database)
+    os.environ["DATABASE_URL"] = url
+
+
+def seed_database(zones: int, users: int, votes: int, history_per_zone: int = 0,
+                  frequent_ratio: float = 0.5, seed: int = 42, backlog_votes: int = 0, backlog_days: int = 30,
+                  with_rollups: bool = True) -> dict:
+    """
+    执行数据库迁移并批量写入测试数据，返回 {"zone_ids": [...], "user_ids": [...]}。
+    投票均匀分布在当前有效时间窗内；另有 backlog_votes 张早于时间窗的历史投票，均匀分布在之前的 backlog_days 天内。
+    frequent_ratio 比例的用户首次出现时间早于固定用户的天数阈值。
+    之后重建 user_activity 和汇总表（with_rollups=False 时跳过，大数据量时汇总较慢），使数据与正常写入路径得到的结果一致。
+    """
+    from sqlalchemy import insert
+
+    from app import models, strategy, activity, rollups, migrate
+    from app.database import SessionLocal, engine
+
+    rng = random.Random(seed)
+    migrate.upgrade(engine)
+    now = datetime.utcnow()
+    zone_ids = [f"zone-{i:05d}" for i in range(zones)]
+    user_ids = [uuid.UUID(int=rng.getrandbits(128), version=4) for _ in range(users)]
+    old = now - timedelta(days=strategy.FREQUENT_USER_DAYS_THRESHOLD + 30)
+
+    db = SessionLocal()
+    try:
+        db.execute(insert(models.Zone), [
+            {"zone_id": zone_id, "name": zone_id, "current_temp": 24.0, "recommended_temp": 24.0}
+            for zone_id in zone_ids
+        ])
+        db.execute(insert(models.User), [
+            {"user_id": user_id, "first_seen_at": old if rng.random() < frequent_ratio else now, "last_seen_at": now}
+            for user_id in user_ids
+        ])
+        window = strategy.VOTE_VALID_DURATION_MINUTES * 60 - 5
+        backlog = backlog_days * 86400
+        for start in range(0, votes + backlog_votes, 10_000):
+            db.execute(insert(models.Vote), [
+                {"user_id": rng.choice(user_ids), "zone_id": rng.choice(zone_ids), "vote_value": rng.choice((-1, 0, 1)),
+                 "created_at": now - timedelta(seconds=rng.uniform(0, window) if i < votes
+                                               else window + 5 + rng.uniform(0, backlog))}
+                for i in range(start, min(votes + backlog_votes, start + 10_000))
+            ])
+        if history_per_zone:
+            for zone_id in zone_ids:
+                db.execute(insert(models.History), [
+                    {"zone_id": zone_id, "current_temp": rng.uniform(20, 28), "recommended_temp": rng.uniform(20, 28),
+                     "timestamp": now - timedelta(hours=24) * (i / history_per_zone)}
+                    for i in range(history_per_zone)
+                ])
+        db.commit()
+        activity.rebuild_user_activity(db)
+        if with_rollups:
+            rollups.rebuild_rollups(db)
+    finally:
+        db.close()
+    return {"zone_ids": zone_ids, "user_ids": user_ids}
+
+
+def summarize(timings: list[float]) -> dict:
+    """把一组耗时（秒）汇总为毫秒级的统计值。"""
+    ordered = sorted(timings)
+
+    def percentile(p: float) -> float:
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+    return {
+        "n": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+        "p50_ms": round(percentile(50) * 1000, 3),
+        "p95_ms": round(percentile(95) * 1000, 3),
+        "p99_ms": round(percentile(99) * 1000, 3),
+        "min_ms": round(ordered[0] * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+def timed(fn, repeat: int, setup=None) -> list[float]:
+    """重复调用 fn 并返回每次的耗时（秒）；setup 在每次计时之前调用，不计入耗时。"""
+    timings = []
+    for i in range(repeat):
+        argument = setup(i) if setup else None
+        started = time.perf_counter()
+        fn(argument) if setup else fn()
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(benchmark: str, params: dict, results: dict, output: str = None) -> str:
+    """
+    把结果写成JSON文件（默认 benchmarks/results/<benchmark>-<时间>.json），返回文件路径。
+    results 为 {名称: summarize() 的结果或其它指标}，可以用 benchmarks.compare 对比两次运行。
+    """
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{benchmark}-{datetime.now():%Y%m%d-%H%M%S}.json")
+    from sqlalchemy.engine import make_url
+
+    url = os.environ.get("DATABASE_URL")
+    document = {
+        "benchmark": benchmark,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "git_revision": _git_revision(),
+        "database": make_url(url).get_backend_name() if url else None,
+        "python": sys.version.split()[0],
+        "params": params,
+        "results": results,
+    }
+    with open(output, "w") as f:
+        json.dump(document, f, indent=2, ensure_ascii=False)
+    return output
@@ -0,0 +1,63 @@
+# file: server/benchmarks/compare.py
+"""
+对比两次压测的结果文件（bench_core / load_votes 输出的JSON），列出各项延迟的变化。
+
+任何一项的延迟指标比基线慢超过 --threshold（默认10%）时视为回归，脚本以退出码1结束，便于在CI中使用。
+
+用法（在 server/ 目录下）:
+    python -m benchmarks.compare benchmarks/results/core-old.json benchmarks/results/core-new.json
+"""
+import argparse
+import json
+import sys
+
+# 参与比较的指标（数值越小越好）
+METRICS = ("p50_ms", "p95_ms", "p99_ms", "mean_ms")
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> list[tuple]:
+    """返回 (名称, 指标, 基线值, 当前值, 比值, 是否回归) 列表。"""
+    rows = []
+    for name, stats in current["results"].items():
+        base_stats = baseline["results"].get(name)
+        if not isinstance(stats, dict) or not isinstance(base_stats, dict):
+            continue
+        for metric in METRICS:
+            if metric not in stats or not base_stats.get(metric):
+                continue
+            ratio = stats[metric] / base_stats[metric]
+            rows.append((name, metric, base_stats[metric], stats[metric], ratio, ratio > 1 + threshold))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对比两次压测结果")
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=0.10, help="判定为回归的变慢比例")
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    if baseline.get("benchmark") != current.get("benchmark"):
+        sys.exit(f"两个文件属于不同的压测: {baseline.get('benchmark')} / {current.get('benchmark')}")
+    if baseline.get("params") != current.get("params"):
+        print("⚠️ 两次运行的参数不同，结果可能不可比")
+
+    rows = compare(baseline, current, args.threshold)
+    print(f"{'benchmark':<36}{'metric':>10}{'baseline':>12}{'current':>12}{'change':>10}")
+    for name, metric, base_value, value, ratio, regressed in rows:
+        flag = "  ❌" if regressed else ""
+        print(f"{name:<36}{metric:>10}{base_value:>12}{value:>12}{ratio - 1:>+10.1%}{flag}")
+
+    regressions = [row for row in rows if row[5]]
+    if regressions:
+        print(f"\n{len(regressions)} 项指标变慢超过 {args.threshold:.0%}")
+        sys.exit(1)
+    print("\n没有发现性能回归")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+# file: server/benchmarks/load_votes.py
+"""
+投票接口的HTTP负载生成器：按“平稳背景流量 + 周期性突发”的模式回放投票。
+
+现实中的投票往往是突发的：会议开始、课间或空调故障时，少数几个分区在一两秒内涌入大量投票。
+脚本预先生成整个压测期间的到达时间表（背景流量为泊松到达，突发集中在随机选出的热点分区上，
+用户按长尾分布重复投票），然后按时间表向 /api/vote/ 发请求，分别统计全部请求和突发期间请求的延迟。
+
+默认在临时 SQLite 数据库上启动一个 uvicorn 进程；也可以用 --base-url 压测已经运行的服务。
+
+用法（在 server/ 目录下）:
+    python -m benchmarks.load_votes --duration 30 --base-rate 20 --burst-size 300
+    python -m benchmarks.load_votes --base-url http://127.0.0.1:8000 --duration 60
+"""
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import time
+import uuid
+
+import httpx
+
+from benchmarks.common import default_sqlite_url, use_database, seed_database, summarize, write_results
+
+
+def build_schedule(args, zone_ids: list[str], rng: random.Random) -> list[tuple]:
+    """生成 (发送时间偏移秒, zone_id, user_id, vote_value, 是否属于突发) 列表，按时间排序。"""
+    users = [str(uuid.UUID(int=rng.getrandbits(128), version=4)) for _ in range(args.users)]
+    # 长尾分布：少数用户投票很频繁，多数用户只投一两次
+    user_weights = [1 / (rank + 1) for rank in range(len(users))]
+    arrivals = []
+
+    elapsed = rng.expovariate(args.base_rate) if args.base_rate > 0 else args.duration
+    while elapsed < args.duration:
+        arrivals.append((elapsed, rng.choice(zone_ids), False))
+        elapsed += rng.expovariate(args.base_rate)
+
+    burst_at = args.burst_every
+    while args.burst_size and burst_at < args.duration:
+        hot = rng.sample(zone_ids, min(args.hot_zones, len(zone_ids)))
+        # 突发中的投票方向一致性较高（例如大家都觉得冷）
+        bias = rng.choice((-1, 1))
+        for _ in range(args.burst_size):
+            offset = burst_at + rng.uniform(0, args.burst_span)
+            arrivals.append((offset, rng.choice(hot), True, bias))
+        burst_at += args.burst_every
+
+    schedule = []
+    for arrival in sorted(arrivals, key=lambda item: item[0]):
+        offset, zone_id, in_burst = arrival[:3]
+        if in_burst:
+            vote_value = arrival[3] if rng.random() < 0.8 else rng.choice((-1, 0, 1))
+        else:
+            vote_value = rng.choice((-1, 0, 1))
+        user_id = rng.choices(users, weights=user_weights)[0]
+        schedule.append((offset, zone_id, user_id, vote_value, in_burst))
+    return schedule
+
+
+async def replay(client: httpx.AsyncClient, schedule: list[tuple], concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = {"all": [], "burst": [], "background": []}
+    statuses: dict = {}
+    lags = []
+
+    async def send(offset, zone_id, user_id, vote_value, in_burst, started):
+        async with semaphore:
+            # 调度延迟：受并发上限限制而晚于计划时间发出的时长
+            lags.append(time.monotonic() - started - offset)
+            sent = time.monotonic()
+            try:
+                response = await client.post(
+                    "/api/vote/", json={"user_id": user_id, "zone_id": zone_id, "vote_value": vote_value}
+                )
+                status = str(response.status_code)
+            except httpx.HTTPError as exc:
+                status = type(exc).__name__
+            elapsed = time.monotonic() - sent
+        statuses[status] = statuses.get(status, 0) + 1
+        latencies["all"].append(elapsed)
+        latencies["burst" if in_burst else "background"].append(elapsed)
+
+    started = time.monotonic()
+    tasks = []
+    for offset, *request in schedule:
+        delay = started + offset - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(send(offset, *request, started)))
+    await asyncio.gather(*tasks)
+    wall = time.monotonic() - started
+
+    results = {name: summarize(values) for name, values in latencies.items() if values}
+    results["throughput"] = {
+        "requests": len(schedule),
+        "wall_seconds": round(wall, 3),
+        "requests_per_second": round(len(schedule) / wall, 1),
+        "max_schedule_lag_ms": round(max(lags) * 1000, 3) if lags else 0,
+        "statuses": statuses,
+    }
+    return results
+
+
+def _start_server(port: int) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        env=dict(os.environ), stdout=subprocess.DEVNULL
+    )
+
+
+async def _wait_ready(client: httpx.AsyncClient, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get("/")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("服务未能在规定时间内启动")
+
+
+async def run(args) -> dict:
+    server = None
+    base_url = args.base_url
+    if base_url is None:
+        server = _start_server(args.port)
+        base_url = f"http://127.0.0.1:{args.port}"
+    limits = httpx.Limits(max_connections=args.concurrency)
+    try:
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+            await _wait_ready(client)
+            zone_ids = [zone["zone_id"] for zone in (await client.get("/api/zones/")).json()]
+            if not zone_ids:
+                raise RuntimeError("数据库中没有分区，请先运行 python -m app.migrate 和 python -m app.init_db")
+            schedule = build_schedule(args, zone_ids, random.Random(args.seed))
+            return await replay(client, schedule, args.concurrency)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="投票接口突发负载回放")
+    parser.add_argument("--base-url", help="压测已运行的服务；不指定时在临时数据库上启动一个uvicorn进程")
+    parser.add_argument("--database-url", default=default_sqlite_url("load-votes"), help="自动启动服务时使用的数据库")
+    parser.add_argument("--zones", type=int, default=50, help="自动启动服务时创建的分区数")
+    parser.add_argument("--port", type=int, default=8200)
+    parser.add_argument("--duration", type=float, default=30.0, help="压测时长（秒）")
+    parser.add_argument("--base-rate", type=float, default=20.0, help="背景流量（票/秒）")
+    parser.add_argument("--burst-every", type=float, default=10.0, help="两次突发之间的间隔（秒）")
+    parser.add_argument("--burst-size", type=int, default=200, help="每次突发的投票数")
+    parser.add_argument("--burst-span", type=float, default=2.0, help="一次突发持续的时间（秒）")
+    parser.add_argument("--hot-zones", type=int, default=3, help="每次突发涉及的分区数")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=100, help="同时进行中的请求数上限")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="结果文件路径，默认写入 benchmarks/results/")
+    args = parser.parse_args()
+
+    if args.base_url is None:
+        use_database(args.database_url)
+        seed_database(args.zones, users=0, votes=0)
+
+    results = asyncio.run(run(args))
+    params = {key: value for key, value in vars(args).items() if key not in ("database_url", "output")}
+    path = write_results("load_votes", params, results, args.output)
+
+    print(f"{'requests':<12}{'n':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name in ("all", "background", "burst"):
+        if name in results:
+            stats = results[name]
+            print(f"{name:<12}{stats['n']:>8}{stats['p50_ms']:>10}{stats['p95_ms']:>10}"
+                  f"{stats['p99_ms']:>10}{stats['max_ms']:>10}")
+    throughput = results["throughput"]
+    print(f"\n{throughput['requests_per_second']} req/s，状态码 {throughput['statuses']}")
+    print(f"结果已写入 {path}")
+
+
+if __name__ == "__main__":
+    main()
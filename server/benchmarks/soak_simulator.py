@@ -0,0 +1,128 @@
+# file: server/benchmarks/soak_simulator.py
+"""
+用模拟建筑（HVAC_CONTROLLER=simulator）对整个系统做浸泡测试：上万个分区的室温和使用者投票由 NumPy 向量化推进，
+投票送回系统，重算后的设定值经 HVAC 下发队列回到模拟建筑，形成闭环。
+
+- --via api：每个tick的投票按 1000 张一批 POST 到 /api/votes/batch（经过完整的HTTP、校验、限流和写入路径）；
+- --via ingest：投票直接走 simulation_runner 的默认路径（与批量接口相同的限流和写入，不经过HTTP）。
+
+tick 按真实时间 --tick-seconds 推进（--no-pace 时连续执行），每个tick推进 tick × --time-scale 秒的室温变化。
+定期打印舒适度、投票数、重算和下发情况，最后把tick耗时、吞吐和舒适度写入结果文件。
+
+用法（在 server/ 目录下）:
+    python -m benchmarks.soak_simulator --zones 10000 --duration 600
+    python -m benchmarks.soak_simulator --zones 2000 --duration 60 --tick-seconds 1 --time-scale 60 --via api
+"""
+import argparse
+import logging
+import os
+import resource
+import time
+
+from benchmarks.common import default_sqlite_url, use_database, seed_database, summarize, write_results
+
+
+def _api_sink(client):
+    def submit(votes):
+        accepted = throttled = 0
+        for start in range(0, len(votes), 1000):
+            response = client.post("/api/votes/batch", json={"votes": [
+                {"zone_id": zone_id, "user_id": str(user_id), "vote_value": value}
+                for zone_id, user_id, value in votes[start:start + 1000]
+            ]})
+            response.raise_for_status()
+            body = response.json()
+            accepted += body["accepted"]
+            throttled += body["throttled"]
+        return accepted, throttled
+    return submit
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模拟建筑闭环浸泡测试")
+    parser.add_argument("--database-url", default=default_sqlite_url("soak"))
+    parser.add_argument("--zones", type=int, default=10000)
+    parser.add_argument("--duration", type=float, default=300, help="运行的真实时间（秒）")
+    parser.add_argument("--tick-seconds", type=float, default=5.0)
+    parser.add_argument("--time-scale", type=float, default=1.0, help="模拟时间倍速")
+    parser.add_argument("--occupants-per-zone", type=int, default=10)
+    parser.add_argument("--via", choices=("api", "ingest"), default="ingest")
+    parser.add_argument("--no-pace", action="store_true", help="tick之间不等待，尽快执行")
+    parser.add_argument("--report-every", type=float, default=30, help="打印进度的间隔（秒）")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="结果文件路径，默认写入 benchmarks/results/")
+    args = parser.parse_args()
+
+    use_database(args.database_url)
+    # 模拟推进由本脚本驱动（HVAC_SIM_TICK_SECONDS=0 时 lifespan 不启动后台线程）
+    os.environ.update({
+        "HVAC_CONTROLLER": "simulator",
+        "HVAC_SIM_TICK_SECONDS": "0",
+        "HVAC_SIM_OCCUPANTS_PER_ZONE": str(args.occupants_per_zone),
+        "HVAC_SIM_SEED": str(args.seed),
+    })
+    seed_database(args.zones, 0, 0, with_rollups=False)
+
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+    from app.hvac_dispatcher import hvac_dispatcher
+    from app.hvac_simulator import simulation_runner
+    from app.scheduler import recompute_scheduler
+
+    logging.getLogger("app").setLevel(logging.WARNING)
+    timings, report_at = [], 0.0
+    with TestClient(app) as client:
+        runner = simulation_runner
+        runner.tick_seconds, runner.time_scale = args.tick_seconds, args.time_scale
+        sink = _api_sink(client) if args.via == "api" else None
+        initial = runner.building.comfort()
+        print(f"{runner.building.stats()['zones']} 个分区，{runner.building.stats()['occupants']} 名使用者，初始舒适度 {initial}")
+        print(f"{'elapsed':>8}{'sim h':>8}{'votes':>10}{'throttled':>10}{'recomputes':>11}{'hvac sent':>10}"
+              f"{'comfort':>9}{'MAE °C':>8}{'tick p99':>10}")
+        started = next_tick = time.monotonic()
+        while time.monotonic() - started < args.duration:
+            tick_started = time.perf_counter()
+            runner.tick(sink)
+            timings.append(time.perf_counter() - tick_started)
+            elapsed = time.monotonic() - started
+            if elapsed >= report_at:
+                report_at += args.report_every
+                stats, comfort = runner.stats(), runner.building.comfort()
+                print(f"{elapsed:>8.0f}{stats['sim_hours']:>8.2f}{stats['votes_submitted']:>10}"
+                      f"{stats['votes_throttled']:>10}{recompute_scheduler.stats()['runs_total']:>11}"
+                      f"{hvac_dispatcher.stats()['sent_total']:>10}{comfort['comfortable_ratio']:>9.3f}"
+                      f"{comfort['mean_abs_error_c']:>8.2f}{summarize(timings[-100:])['p99_ms']:>10.1f}")
+            if not args.no_pace:
+                next_tick += args.tick_seconds
+                time.sleep(max(0.0, next_tick - time.monotonic()))
+        wall = time.monotonic() - started
+        final = runner.stats()
+        # 退出 TestClient 时 lifespan 把剩余的重算和下发跑完
+    final_comfort = runner.building.comfort()
+
+    results = {
+        "tick": summarize(timings),
+        "throughput": {
+            "wall_seconds": round(wall, 1),
+            "votes_submitted": final["votes_submitted"],
+            "votes_throttled": final["votes_throttled"],
+            "votes_per_second": round(final["votes_submitted"] / wall, 1),
+            "recompute_runs": recompute_scheduler.stats()["runs_total"],
+            "hvac_sent": hvac_dispatcher.stats()["sent_total"],
+            "setpoints_applied": final["setpoints_applied"],
+            "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        },
+        "comfort_initial": initial,
+        "comfort_final": final_comfort,
+    }
+    params = {key: value for key, value in vars(args).items() if key not in ("database_url", "output")}
+    path = write_results("soak-simulator", params, results, args.output)
+    print(f"\n最终舒适度 {final_comfort}")
+    print(f"tick p50 {results['tick']['p50_ms']} ms / p99 {results['tick']['p99_ms']} ms，"
+          f"写入 {results['throughput']['votes_per_second']} 票/秒，峰值内存 {results['throughput']['peak_rss_mb']} MB")
+    print(f"结果已写入 {path}")
+
+
+if __name__ == "__main__":
+    main()
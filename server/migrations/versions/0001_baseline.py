@@ -0,0 +1,88 @@
+"""baseline: tables created by models.Base.metadata.create_all before migrations were introduced
+
+Revision ID: 0001_baseline
+Revises:
+Create Date: 2026-10-16
+"""
+from alembic import context, op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision = "0001_baseline"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def _rollup_columns():
+    return [
+        sa.Column("zone_id", sa.String(), sa.ForeignKey("zones.zone_id"), primary_key=True),
+        sa.Column("bucket", sa.DateTime(), primary_key=True),
+        sa.Column("temp_count", sa.Integer(), nullable=False),
+        sa.Column("current_temp_min", sa.Float()),
+        sa.Column("current_temp_max", sa.Float()),
+        sa.Column("current_temp_sum", sa.Float(), nullable=False),
+        sa.Column("recommended_temp_min", sa.Float()),
+        sa.Column("recommended_temp_max", sa.Float()),
+        sa.Column("recommended_temp_sum", sa.Float(), nullable=False),
+        sa.Column("votes_minus_one", sa.Integer(), nullable=False),
+        sa.Column("votes_zero", sa.Integer(), nullable=False),
+        sa.Column("votes_plus_one", sa.Integer(), nullable=False),
+    ]
+
+
+TABLES = {
+    "users": lambda: [
+        sa.Column("user_id", postgresql.UUID(as_uuid=True), primary_key=True),
+        sa.Column("first_seen_at", sa.DateTime(), server_default=sa.func.now()),
+        sa.Column("last_seen_at", sa.DateTime(), server_default=sa.func.now()),
+    ],
+    "user_activity": lambda: [
+        sa.Column("user_id", postgresql.UUID(as_uuid=True), sa.ForeignKey("users.user_id"), primary_key=True),
+        sa.Column("total_votes", sa.Integer(), nullable=False),
+        sa.Column("frequent_since", sa.DateTime(), nullable=True),
+    ],
+    "zones": lambda: [
+        sa.Column("zone_id", sa.String(), primary_key=True, index=True),
+        sa.Column("name", sa.String(), nullable=False),
+        sa.Column("current_temp", sa.Numeric(4, 1), nullable=False),
+        sa.Column("recommended_temp", sa.Numeric(4, 1), nullable=False),
+    ],
+    "votes": lambda: [
+        sa.Column("vote_id", sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column("user_id", postgresql.UUID(as_uuid=True), sa.ForeignKey("users.user_id")),
+        sa.Column("zone_id", sa.String(), sa.ForeignKey("zones.zone_id")),
+        sa.Column("vote_value", sa.SmallInteger(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), server_default=sa.func.now(), nullable=False),
+    ],
+    "history": lambda: [
+        sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column("zone_id", sa.String(), sa.ForeignKey("zones.zone_id"), nullable=False),
+        sa.Column("current_temp", sa.Float(), nullable=False),
+        sa.Column("recommended_temp", sa.Float(), nullable=False),
+        sa.Column("timestamp", sa.DateTime()),
+    ],
+    "zone_rollups_minute": _rollup_columns,
+    "zone_rollups_hour": _rollup_columns,
+    "hvac_dead_letters": lambda: [
+        sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column("zone_id", sa.String(), sa.ForeignKey("zones.zone_id"), nullable=False),
+        sa.Column("temperature", sa.Numeric(4, 1), nullable=False),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column("last_error", sa.String()),
+        sa.Column("created_at", sa.DateTime(), server_default=sa.func.now(), nullable=False),
+    ],
+}
+
+
+def upgrade():
+    # 之前的版本在启动时用 create_all 建表，已有的表保持不变，只创建缺少的表（生成SQL脚本时创建全部表）
+    existing = set() if context.is_offline_mode() else set(sa.inspect(op.get_bind()).get_table_names())
+    for name, columns in TABLES.items():
+        if name not in existing:
+            op.create_table(name, *columns())
+
+
+def downgrade():
+    for name in reversed(list(TABLES)):
+        op.drop_table(name)
@@ -0,0 +1,40 @@
+"""indexes for the hot votes / history queries
+
+Revision ID: 0002_hot_query_indexes
+Revises: 0001_baseline
+Create Date: 2026-10-16
+"""
+from alembic import op
+
+revision = "0002_hot_query_indexes"
+down_revision = "0001_baseline"
+branch_labels = None
+depends_on = None
+
+# (索引名, 表名, 索引列, PostgreSQL INCLUDE 列)，与 models.py 中的 __table_args__ 保持一致
+INDEXES = [
+    ("ix_votes_zone_id_created_at", "votes", ["zone_id", "created_at"], ["vote_value", "user_id"]),
+    ("ix_votes_created_at", "votes", ["created_at"], ["zone_id", "vote_value", "user_id"]),
+    ("ix_votes_user_id_created_at", "votes", ["user_id", "created_at"], []),
+    ("ix_history_zone_id_timestamp", "history", ["zone_id", "timestamp"], []),
+    ("ix_history_timestamp", "history", ["timestamp"], []),
+]
+
+
+def upgrade():
+    if op.get_bind().dialect.name == "postgresql":
+        # CONCURRENTLY：在已有的大表上建索引时不阻塞投票写入（不能在事务中执行）
+        with op.get_context().autocommit_block():
+            for name, table, columns, include in INDEXES:
+                op.create_index(name, table, columns, if_not_exists=True,
+                                postgresql_include=include, postgresql_concurrently=True)
+    else:
+        for name, table, columns, _ in INDEXES:
+            op.create_index(name, table, columns, if_not_exists=True)
+    op.execute("ANALYZE votes")
+    op.execute("ANALYZE history")
+
+
+def downgrade():
+    for name, table, _, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table, if_exists=True)
@@ -0,0 +1,32 @@
+"""optional monthly range partitioning of votes / history (PostgreSQL, DB_PARTITIONING=true)
+
+Revision ID: 0003_partition_votes_history
+Revises: 0002_hot_query_indexes
+Create Date: 2026-10-16
+"""
+from alembic import context, op
+
+from app import partitions
+
+revision = "0003_partition_votes_history"
+down_revision = "0002_hot_query_indexes"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 未启用分区或不是 PostgreSQL 时不做任何改动；之后仍可用 python -m app.partitions --convert 单独转换
+    # 转换需要读取现有数据，生成SQL脚本（--sql）时同样跳过
+    if not partitions.DB_PARTITIONING or context.is_offline_mode():
+        return
+    connection = op.get_bind()
+    if connection.dialect.name != "postgresql":
+        return
+    for table in partitions.PARTITIONED_TABLES:
+        if not partitions.is_partitioned(connection, table):
+            partitions.convert_to_partitioned(connection, table)
+
+
+def downgrade():
+    # 分区表与普通表的列完全相同，之前版本的代码可以直接使用，因此不转换回普通表
+    pass
@@ -0,0 +1,30 @@
+"""lease table for zone-sharded recompute ownership
+
+Revision ID: 0004_shard_members
+Revises: 0003_partition_votes_history
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0004_shard_members"
+down_revision = "0003_partition_votes_history"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "shard_members",
+        sa.Column("member_id", sa.String(), primary_key=True),
+        sa.Column("hostname", sa.String(), nullable=False),
+        sa.Column("pid", sa.Integer(), nullable=False),
+        sa.Column("started_at", sa.DateTime(), nullable=False),
+        sa.Column("heartbeat_at", sa.DateTime(), nullable=False),
+    )
+    op.create_index("ix_shard_members_heartbeat_at", "shard_members", ["heartbeat_at"])
+
+
+def downgrade():
+    op.drop_index("ix_shard_members_heartbeat_at", table_name="shard_members")
+    op.drop_table("shard_members")
@@ -0,0 +1,40 @@
+# file: server/tests/conftest.py
+"""
+测试共用的夹具。
+
+所有测试使用一个临时 SQLite 数据库：DATABASE_URL 必须在导入 app 中任何模块之前设置
+（app.database 在导入时就创建了引擎），因此这里无条件覆盖，避免误连到开发或生产数据库。
+"""
+import os
+import tempfile
+
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="thermasense-tests-"), "test.db")
+os.environ["SHARED_ZONE_STATE"] = "false"
+
+import pytest
+
+
+@pytest.fixture(scope="session")
+def migrated_engine():
+    from app import migrate
+    from app.database import engine
+
+    migrate.upgrade(engine)
+    return engine
+
+
+@pytest.fixture
+def db(migrated_engine):
+    """每个测试开始前清空全部表，返回一个新的会话。"""
+    from app import activity
+    from app.database import Base, SessionLocal
+
+    with migrated_engine.begin() as connection:
+        for table in reversed(Base.metadata.sorted_tables):
+            connection.execute(table.delete())
+    activity.clear_cache()
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
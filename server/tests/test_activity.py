@@ -0,0 +1,59 @@
+# file: server/tests/test_activity.py
+"""
+用户活跃度计数：frequent_since = max(首次出现 + N天, 第 FREQUENT_USER_VOTES_THRESHOLD 票的时间)；
+写入投票时的增量计数与根据投票表重建的结果一致。
+"""
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+from app import activity, models, strategy
+
+
+def _activity(db) -> dict:
+    rows = db.execute(select(models.UserActivity.user_id, models.UserActivity.total_votes,
+                             models.UserActivity.frequent_since)).all()
+    return {row.user_id: (row.total_votes, row.frequent_since) for row in rows}
+
+
+def _write(db, user_id, timestamps: list[datetime]):
+    # 与写入路径相同：投票和活跃度计数在同一个事务中写入
+    db.add_all(models.Vote(user_id=user_id, zone_id="zone-a", vote_value=1, created_at=ts) for ts in timestamps)
+    activity.record_votes(db, [(user_id, ts) for ts in timestamps])
+    db.commit()
+
+
+def test_incremental_counts_match_rebuild(db):
+    now = datetime(2026, 10, 1, 12)
+    veteran, newcomer, occasional = (uuid.uuid4() for _ in range(3))
+    db.add(models.Zone(zone_id="zone-a", name="zone-a", current_temp=24, recommended_temp=24))
+    db.add_all([
+        models.User(user_id=veteran, first_seen_at=now - timedelta(days=30)),
+        models.User(user_id=newcomer, first_seen_at=now - timedelta(days=2)),
+        models.User(user_id=occasional, first_seen_at=now - timedelta(days=30)),
+    ])
+    db.commit()
+    votes_needed = strategy.FREQUENT_USER_VOTES_THRESHOLD
+    eligible_days = timedelta(days=strategy.FREQUENT_USER_DAYS_THRESHOLD)
+
+    # 老用户：达标的那一票落在第二批中间，且批内时间乱序
+    early = [now - timedelta(days=20, hours=i) for i in range(votes_needed - 2)]
+    late = [now - timedelta(days=10), now - timedelta(days=12), now - timedelta(days=11)]
+    _write(db, veteran, early)
+    _write(db, veteran, late)
+    # 新用户：票数一次达标，但首次出现还不满N天
+    _write(db, newcomer, [now - timedelta(hours=i) for i in range(votes_needed)])
+    _write(db, occasional, [now - timedelta(days=3)])
+
+    incremental = _activity(db)
+    assert incremental == {
+        veteran: (votes_needed + 1, now - timedelta(days=11)),
+        newcomer: (votes_needed, now - timedelta(days=2) + eligible_days),
+        occasional: (1, None),
+    }
+    loaded = activity.load_user_activity(db, [veteran, newcomer, occasional], now)
+    assert [loaded[user_id]["is_frequent"] for user_id in (veteran, newcomer, occasional)] == [True, False, False]
+
+    assert activity.rebuild_user_activity(db, chunk_size=2) == 3
+    assert _activity(db) == incremental
@@ -0,0 +1,56 @@
+# file: server/tests/test_batch_strategy.py
+"""批量策略引擎与逐分区的标量实现应得到逐位相同的结果。"""
+import uuid
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from app import batch_strategy, models, strategy
+
+
+def _scalar_simulated(current_temp, recommended_temp) -> Decimal:
+    zone = models.Zone(current_temp=current_temp, recommended_temp=recommended_temp)
+    strategy._simulate_physical_temperature_change(zone)
+    return zone.current_temp
+
+
+def test_simulated_temperature_matches_scalar_path_for_any_precision():
+    cases = [
+        ("24.0", "24.53"),    # 温差不是0.1的倍数
+        ("24.53", "24.0"),    # 负的温差
+        ("24.05", "24.0"),    # 负的温差，10%后不足0.01°C
+        ("21.07", "21.1"),
+        ("25.3", "24.0"),     # 负的温差，按0.1°C的温度
+        ("30.0", "20.0"),     # 超过0.2°C的限幅
+        ("18.25", "28.125"),
+        ("22.2", "22.2"),     # 无温差
+        ("-3.057", "-1.2"),
+        ("24", "26"),
+    ]
+    current = [Decimal(c) for c, _ in cases]
+    recommended = [Decimal(r) for _, r in cases]
+    simulated = batch_strategy._simulate_current_temps(current, recommended)
+    for c, r, batch in zip(current, recommended, simulated):
+        assert batch == _scalar_simulated(c, r), (c, r)
+
+    # 每一对单独计算（各自的小数位数不同）与合在一起计算的结果相同
+    for c, r, batch in zip(current, recommended, simulated):
+        assert batch_strategy._simulate_current_temps([c], [r]) == [batch]
+
+
+def test_batch_engine_matches_per_zone_engine(db):
+    now = datetime.utcnow()
+    temps = [("25.3", "24.0"), ("20.0", "23.7"), ("24.0", "24.0"), ("26.9", "21.4")]
+    db.add_all(models.Zone(zone_id=f"zone-{i}", name=f"zone-{i}", current_temp=Decimal(c), recommended_temp=Decimal(r))
+               for i, (c, r) in enumerate(temps))
+    users = [uuid.uuid4() for _ in range(6)]
+    db.add_all(models.User(user_id=u) for u in users)
+    db.add_all(models.UserActivity(user_id=u, total_votes=10, frequent_since=now - timedelta(days=1)) for u in users[:2])
+    db.add_all(models.Vote(user_id=u, zone_id=f"zone-{i}", vote_value=(-1, 1, 0, -1)[i],
+                           created_at=now - timedelta(minutes=j))
+               for i in range(len(temps)) for j, u in enumerate(users))
+    db.commit()
+
+    assert batch_strategy.verify_batch_engine(db) == {}
+    plans = {plan.zone_id: plan for plan in batch_strategy.plan_all_zones(db)}
+    assert plans["zone-0"].current_temp == Decimal("25.17")
+    assert plans["zone-1"].recommended_temp is not None
@@ -0,0 +1,36 @@
+# file: server/tests/test_downsample.py
+"""LTTB 降采样：总是保留首尾两点，返回的点数不超过 threshold，下标严格升序，孤立的尖峰不会被丢掉。"""
+import math
+import random
+
+import pytest
+
+from app.downsample import lttb_indices
+
+
+@pytest.mark.parametrize("n, threshold", [(10, 3), (100, 7), (1000, 300), (1001, 1000), (5000, 250)])
+def test_keeps_endpoints_and_at_most_threshold_points(n, threshold):
+    rng = random.Random(n)
+    xs = sorted(rng.uniform(0, 86400) for _ in range(n))
+    series = [[20 + 3 * math.sin(x / 3600) + rng.gauss(0, 0.3) for x in xs], [24 + rng.gauss(0, 0.5) for _ in xs]]
+    indices = lttb_indices(xs, series, threshold)
+    assert indices[0] == 0 and indices[-1] == n - 1
+    assert len(indices) <= threshold
+    assert all(a < b for a, b in zip(indices, indices[1:]))
+
+
+def test_short_series_is_returned_unchanged():
+    xs = [0.0, 1.0, 2.0]
+    assert lttb_indices(xs, [[1.0, 2.0, 3.0]], 3) == [0, 1, 2]
+    assert lttb_indices([], [[]], 10) == []
+    with pytest.raises(ValueError):
+        lttb_indices(list(map(float, range(10))), [[0.0] * 10], 2)
+
+
+def test_spike_in_any_series_is_kept():
+    n = 500
+    xs = [float(i) for i in range(n)]
+    flat = [22.0] * n
+    spiky = [24.0] * n
+    spiky[317] = 30.0
+    assert 317 in lttb_indices(xs, [flat, spiky], 20)
@@ -0,0 +1,47 @@
+# file: server/tests/test_export.py
+"""中断的导出从最后记录的游标续传后，输出与一次完整导出的内容相同：不重复、不遗漏，CSV 表头只出现一次。"""
+import gzip
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import models
+from app.database import SessionLocal
+from app.export import stream_export
+
+
+def _export(**kwargs) -> bytes:
+    return b"".join(stream_export("history", session_factory=SessionLocal, chunk_size=3, **kwargs))
+
+
+@pytest.mark.parametrize("fmt, compress", [("csv", False), ("ndjson", True)])
+def test_resumed_export_matches_single_run(db, fmt, compress):
+    db.add(models.Zone(zone_id="zone-a", name="zone-a", current_temp=24, recommended_temp=24))
+    base = datetime(2026, 7, 1)
+    # 同一时刻的多行跨越块边界，续传时按主键继续
+    db.add_all(
+        models.History(zone_id="zone-a", current_temp=20 + i / 10, recommended_temp=24,
+                       timestamp=base + timedelta(minutes=i // 4))
+        for i in range(11)
+    )
+    db.commit()
+    expected = _export(fmt=fmt, compress=compress)
+
+    # 与命令行相同：每块写完后记录 (游标, 输出长度)，在第三块写到一半时中断
+    out, progress = bytearray(), []
+    chunks = stream_export("history", fmt, compress, session_factory=SessionLocal, chunk_size=3,
+                           on_chunk=lambda cursor: progress.append((cursor, len(out))))
+    for data in chunks:
+        if len(progress) == 2:
+            out += data[:len(data) // 2]
+            chunks.close()
+            break
+        out += data
+    cursor, offset = progress[-1]
+    del out[offset:]
+    out += _export(fmt=fmt, compress=compress, cursor=cursor)
+
+    # gzip 成员头中带有压缩时间，比较解压后的内容
+    text, expected_text = ((gzip.decompress(data) if compress else data).decode() for data in (bytes(out), expected))
+    assert text == expected_text
+    assert len(text.splitlines()) == 11 + (fmt == "csv")
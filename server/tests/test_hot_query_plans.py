@@ -0,0 +1,53 @@
+# file: server/tests/test_hot_query_plans.py
+"""
+热点查询的执行计划必须使用索引，不能对 votes / history 做全表扫描。
+
+app.database 在导入时就绑定了数据库，而测试进程已绑定到临时 SQLite（见 conftest.py），
+因此在子进程中运行 benchmarks.explain_hot_queries 并解析其 --json 输出。
+PostgreSQL 的用例需要设置 TEST_POSTGRES_URL 指向一个可以清空的临时数据库（请不要指向生产库），未设置时跳过。
+"""
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+
+import pytest
+
+from benchmarks.explain_hot_queries import hot_paths
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEST_POSTGRES_URL = os.getenv("TEST_POSTGRES_URL")
+
+# PostgreSQL 的规划器按表的统计信息选择执行计划，需要接近真实比例的数据量（与脚本的默认值相同）
+POSTGRES_SIZES = ["--zones", "200", "--users", "20000", "--votes", "20000",
+                  "--backlog-votes", "300000", "--history-per-zone", "1000"]
+SQLITE_SIZES = ["--zones", "100", "--users", "2000", "--votes", "5000",
+                "--backlog-votes", "50000", "--history-per-zone", "200"]
+
+
+def _explain(database_url: str, sizes: list[str]) -> list[dict]:
+    completed = subprocess.run(
+        [sys.executable, "-m", "benchmarks.explain_hot_queries", "--database-url", database_url, "--json", *sizes],
+        cwd=SERVER_DIR, capture_output=True, text=True, timeout=600,
+    )
+    assert completed.returncode == 0, completed.stderr
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def _assert_uses_indexes(results: list[dict]):
+    # 每条热点代码路径都要有被检查的语句，避免查询改写后捕获不到语句而误报通过
+    assert {result["name"] for result in results} == set(hot_paths(None, ["zone"], random.Random(0)).keys())
+    full_scans = {result["name"]: result["full_scans"] for result in results if result["full_scans"]}
+    assert not full_scans
+
+
+@pytest.mark.skipif(not TEST_POSTGRES_URL, reason="未设置 TEST_POSTGRES_URL")
+def test_hot_queries_use_indexes_on_postgres():
+    _assert_uses_indexes(_explain(TEST_POSTGRES_URL, POSTGRES_SIZES))
+
+
+def test_hot_queries_use_indexes_on_sqlite():
+    database_url = "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="thermasense-explain-"), "explain.db")
+    _assert_uses_indexes(_explain(database_url, SQLITE_SIZES))
@@ -0,0 +1,105 @@
+# file: server/tests/test_hvac_dispatcher.py
+"""HVAC下发队列：同一分区的旧设定值被覆盖，失败按次数重试后写入死信，卡死的调用超时后仍占用并发名额直到返回。"""
+import threading
+import time
+from decimal import Decimal
+
+from app.hvac_controller import FakeHVACController
+from app.hvac_dispatcher import HVACDispatcher
+
+
+class _HangingController(FakeHVACController):
+    """第一次调用卡住，直到测试放行。"""
+
+    def __init__(self):
+        super().__init__(latency=0)
+        self.release = threading.Event()
+        self.hung = threading.Event()
+
+    def set_temperatures(self, setpoints: dict):
+        if not self.hung.is_set():
+            self.hung.set()
+            self.release.wait(5)
+        super().set_temperatures(setpoints)
+
+
+def _wait_until(predicate, timeout: float = 5) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return predicate()
+
+
+def test_pending_setpoints_are_deduplicated_and_batched():
+    controller = FakeHVACController(latency=0)
+    dispatcher = HVACDispatcher(controller, max_concurrency=1, batch_size=10, dead_letter=lambda letters: None)
+    # 启动前提交：同一分区只保留最新的设定值
+    dispatcher.submit("zone-a", Decimal("23.0"))
+    dispatcher.submit("zone-a", Decimal("23.5"))
+    dispatcher.submit("zone-b", Decimal("25.0"))
+    dispatcher.start()
+    try:
+        assert _wait_until(lambda: dispatcher.stats()["sent_total"] == 2)
+    finally:
+        dispatcher.stop()
+    assert controller.applied == {"zone-a": Decimal("23.5"), "zone-b": Decimal("25.0")}
+    assert controller.calls == 1
+    stats = dispatcher.stats()
+    assert (stats["submitted_total"], stats["deduplicated_total"]) == (3, 1)
+
+
+def test_failed_setpoint_is_retried_then_dead_lettered():
+    letters = []
+    controller = FakeHVACController(latency=0, failure_rate=1.0)
+    dispatcher = HVACDispatcher(controller, max_concurrency=1, max_retries=2, backoff=0.01,
+                                dead_letter=letters.extend)
+    dispatcher.start()
+    try:
+        dispatcher.submit("zone-a", Decimal("22.0"))
+        assert _wait_until(lambda: letters)
+    finally:
+        dispatcher.stop()
+    # 首次下发 + max_retries 次重试
+    assert controller.calls == 3
+    assert [(letter.zone_id, letter.temperature, letter.attempts) for letter in letters] == [
+        ("zone-a", Decimal("22.0"), 3)
+    ]
+    assert letters[0].last_error.startswith("ConnectionError")
+    stats = dispatcher.stats()
+    assert (stats["retries_total"], stats["dead_letters_total"], stats["sent_total"]) == (2, 1, 0)
+
+
+def test_hanging_call_times_out_but_holds_its_slot_until_it_returns():
+    letters = []
+    controller = _HangingController()
+    dispatcher = HVACDispatcher(controller, max_concurrency=1, timeout=0.1, max_retries=0,
+                                dead_letter=letters.extend)
+    assert controller.timeout == 0.1
+    dispatcher.start()
+    try:
+        dispatcher.submit("zone-a", Decimal("22.0"))
+        assert controller.hung.wait(5)
+        assert _wait_until(lambda: dispatcher.stats()["timeouts_total"] == 1)
+        # 超时按失败处理：不再重试，直接写入死信
+        assert [(letter.zone_id, letter.attempts) for letter in letters] == [("zone-a", 1)]
+        assert letters[0].last_error.startswith("TimeoutError")
+
+        # 卡死的调用仍占用唯一的并发名额，新的设定值要等它返回后才下发
+        dispatcher.submit("zone-b", Decimal("24.0"))
+        time.sleep(0.2)
+        stats = dispatcher.stats()
+        assert (stats["stuck_calls"], stats["pending"], stats["in_flight"]) == (1, 1, 1)
+        assert controller.calls == 0
+
+        controller.release.set()
+        assert _wait_until(lambda: dispatcher.stats()["sent_total"] == 1)
+    finally:
+        controller.release.set()
+        dispatcher.stop()
+    stats = dispatcher.stats()
+    assert (stats["stuck_calls"], stats["timeouts_total"], stats["dead_letters_total"]) == (0, 1, 1)
+    # 卡死的调用最终返回了，但它的结果已按超时处理，不计入成功
+    assert controller.applied == {"zone-a": Decimal("22.0"), "zone-b": Decimal("24.0")}
+    assert controller.calls == 2
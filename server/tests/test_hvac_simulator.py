@@ -0,0 +1,108 @@
+# file: server/tests/test_hvac_simulator.py
+"""
+模拟建筑每个tick与数据库同步：加入新建的分区、以推荐温度为设定值，并把室温写回 zones.current_temp。
+使用模拟建筑时 current_temp 只由模拟建筑写入，重算不再模拟物理温度变化。
+"""
+import json
+import uuid
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pytest
+
+from app import batch_strategy, events, hvac_controller, models, strategy
+from app.activity import load_user_activity
+from app.shared_state import SharedZoneTable, fcntl, zone_fields
+from app.zone_cache import known_zone_ids
+from app.hvac_simulator import SimulatedBuildingController, SimulationRunner
+
+
+def test_tick_syncs_zones_and_persists_current_temp(db, monkeypatch):
+    building = SimulatedBuildingController(seed=1)
+    monkeypatch.setattr(hvac_controller, "current_controller", building)
+    db.add(models.Zone(zone_id="zone-a", name="zone-a", current_temp=24, recommended_temp=24))
+    db.commit()
+    runner = SimulationRunner(tick_seconds=60, time_scale=10, sink=lambda votes: (0, 0), persist=True)
+    runner.load_zones(db)
+
+    # 其它进程新建的分区和写入的推荐温度在下一个tick同步进模拟建筑
+    db.add(models.Zone(zone_id="zone-b", name="zone-b", current_temp=20, recommended_temp=26))
+    db.query(models.Zone).filter_by(zone_id="zone-a").update({"recommended_temp": 22})
+    db.commit()
+    runner.tick()
+    assert building.zone_ids == ["zone-a", "zone-b"]
+    assert list(building.setpoint) == [22.0, 26.0]
+
+    db.expire_all()
+    stored = {zone.zone_id: zone.current_temp for zone in db.query(models.Zone)}
+    simulated = building.temperatures(["zone-a", "zone-b"])
+    assert stored == {"zone-a": Decimal(f"{simulated[0]:.1f}"), "zone-b": Decimal(f"{simulated[1]:.1f}")}
+    assert stored["zone-b"] > Decimal("20.0")
+    assert runner.stats()["temps_persisted"] >= 1
+
+
+@pytest.mark.skipif(fcntl is None, reason="共享状态表需要 fcntl")
+def test_persisted_temps_are_pushed_to_the_shared_table(db, monkeypatch, tmp_path):
+    # 写回的室温经推送中心发布，由各worker（包括其它主机上的）的 _dispatch 写入共享状态表，而不只是本机的表
+    table = SharedZoneTable(str(tmp_path / "zones.tbl"), capacity=4, enabled=True)
+    table.open()
+    monkeypatch.setattr(events, "shared_zone_table", table)
+    dispatched = []
+    monkeypatch.setattr(events.event_broker, "_dispatch",
+                        lambda message, dispatch=events.event_broker._dispatch: (dispatched.append(message), dispatch(message)))
+    building = SimulatedBuildingController(seed=3)
+    monkeypatch.setattr(hvac_controller, "current_controller", building)
+    zone = models.Zone(zone_id="zone-a", name="zone-a", current_temp=20, recommended_temp=26)
+    db.add(zone)
+    db.commit()
+    known_zone_ids.add(["zone-a"])
+    table.write("zone-a", **zone_fields(zone, {"-1": 0, "0": 0, "1": 0}))
+    runner = SimulationRunner(tick_seconds=60, time_scale=10, sink=lambda votes: (0, 0), persist=True)
+    runner.load_zones(db)
+
+    runner.tick()
+    stored = _stored(db, "zone-a")
+    assert [json.loads(message)["changes"] for message in dispatched] == [{"current_temp": float(stored)}]
+    assert table.read("zone-a").current_temp == float(stored)
+    table.close()
+
+
+def _stored(db, zone_id: str) -> Decimal:
+    db.expire_all()
+    return db.query(models.Zone).filter_by(zone_id=zone_id).one().current_temp
+
+
+def test_simulated_room_temperature_wins_over_recompute(db, monkeypatch):
+    building = SimulatedBuildingController(seed=2)
+    monkeypatch.setattr(hvac_controller, "current_controller", building)
+    monkeypatch.setattr(strategy, "vote_aggregator",
+                        strategy.vote_window.VoteWindowAggregator(strategy.VOTE_VALID_DURATION_MINUTES, load_user_activity))
+    monkeypatch.setattr(strategy.hvac_dispatcher, "submit", lambda zone_id, temperature: None)
+    now = datetime.utcnow()
+    users = [uuid.uuid4() for _ in range(5)]
+    db.add(models.Zone(zone_id="zone-a", name="zone-a", current_temp=20, recommended_temp=24))
+    db.add_all(models.User(user_id=u) for u in users)
+    db.add_all(models.Vote(user_id=u, zone_id="zone-a", vote_value=1, created_at=now - timedelta(minutes=1)) for u in users)
+    db.commit()
+    runner = SimulationRunner(tick_seconds=60, time_scale=10, sink=lambda votes: (0, 0), persist=True)
+    runner.load_zones(db)
+
+    runner.tick()
+    ticked = _stored(db, "zone-a")
+    assert ticked == Decimal(f"{building.temperatures(['zone-a'])[0]:.1f}") != Decimal("20.0")
+
+    # 逐分区重算只更新推荐温度，历史记录的是模拟建筑写回的室温
+    strategy.calculate_recommended_temperature(db, "zone-a")
+    zone = db.query(models.Zone).filter_by(zone_id="zone-a").one()
+    assert zone.recommended_temp != Decimal("24.0")
+    assert _stored(db, "zone-a") == ticked
+    assert [Decimal(str(row.current_temp)) for row in db.query(models.History)] == [ticked]
+
+    # 下一个tick以新的推荐温度为设定值并写回室温；之后的批量重算同样不覆盖它
+    runner.tick()
+    assert building.setpoint[0] == float(zone.recommended_temp)
+    ticked = _stored(db, "zone-a")
+    assert ticked == Decimal(f"{building.temperatures(['zone-a'])[0]:.1f}")
+    assert batch_strategy.calculate_zones_batch(db).updated == ["zone-a"]
+    assert _stored(db, "zone-a") == ticked
+    assert batch_strategy.verify_batch_engine(db) == {}
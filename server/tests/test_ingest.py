@@ -0,0 +1,103 @@
+# file: server/tests/test_ingest.py
+"""
+投票写后缓冲区：写库失败的投票按原顺序放回队头；缓冲区满时接口返回 503；
+关闭时仍无法落库的投票保存到 spill_dir，下次启动时放回缓冲区并写入数据库。
+"""
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+from sqlalchemy.exc import OperationalError
+
+from app.main import app
+from app import api, ingest, models, schemas
+from app.database import SessionLocal
+from app.ingest import VoteWriteBuffer
+
+
+def _votes(n: int, zone_id: str = "zone-a") -> list[schemas.VoteCreate]:
+    return [schemas.VoteCreate(user_id=uuid.uuid4(), zone_id=zone_id, vote_value=i % 3 - 1) for i in range(n)]
+
+
+def _failing_sessions(on_execute=lambda: None):
+    """模拟数据库不可用的会话工厂：任何语句都抛出 OperationalError。"""
+    def factory():
+        session = SessionLocal()
+
+        def execute(*args, **kwargs):
+            on_execute()
+            raise OperationalError("INSERT", {}, ConnectionError("数据库不可用"))
+
+        session.execute = execute
+        return session
+    return factory
+
+
+@pytest.fixture
+def written(monkeypatch):
+    """记录落库后通知的投票，不触发聚合器和重算调度器。"""
+    rows = []
+    monkeypatch.setattr(ingest, "notify_votes_written", rows.extend)
+    return rows
+
+
+def test_failed_flush_puts_votes_back_in_order(db, written, tmp_path):
+    votes = _votes(3)
+    late = _votes(1)
+    buffer = VoteWriteBuffer(max_size=2, enabled=True, spill_dir=str(tmp_path))
+    # 写库过程中又有新投票进入缓冲区
+    buffer.session_factory = _failing_sessions(lambda: buffer.add(late))
+    assert buffer.add(votes)
+
+    assert buffer.flush() == 0
+    assert buffer._buffer == votes + late
+    assert buffer.stats()["errors_total"] == 1
+
+    buffer.session_factory = SessionLocal
+    assert buffer.flush() == 2
+    assert buffer.flush() == 2
+    assert [(row.user_id, row.vote_value) for row in written] == [
+        (vote.user_id, vote.vote_value) for vote in votes + late
+    ]
+
+
+def test_full_buffer_rejects_votes_with_503(db, written, tmp_path, monkeypatch):
+    buffer = VoteWriteBuffer(max_size=10, flush_interval=1.5, enabled=True, capacity=10, spill_dir=str(tmp_path))
+    monkeypatch.setattr(ingest, "vote_write_buffer", buffer)
+    monkeypatch.setattr(api, "vote_write_buffer", buffer)
+    db.add(models.Zone(zone_id="zone-a", name="zone-a", current_temp=24, recommended_temp=24))
+    db.commit()
+    client = TestClient(app)
+
+    def post(n: int):
+        return client.post("/api/votes/batch", json={"votes": [vote.model_dump(mode="json") for vote in _votes(n)]})
+
+    assert post(8).status_code == 202
+    # 放不下整批时整批拒绝，已缓冲的投票不受影响
+    rejected = post(3)
+    assert rejected.status_code == 503
+    assert rejected.headers["Retry-After"] == "2"
+    assert post(2).status_code == 202
+    stats = buffer.stats()
+    assert (stats["buffered"], stats["rejected_total"]) == (10, 3)
+
+
+def test_unflushed_votes_are_spilled_on_stop_and_restored_on_start(db, written, tmp_path):
+    votes = _votes(5)
+    spill_dir = str(tmp_path / "spill")
+    down = VoteWriteBuffer(_failing_sessions(), max_size=2, flush_interval=60, enabled=True, spill_dir=spill_dir)
+    down.start()
+    assert down.add(votes)
+    down.stop()
+    assert down.stats()["spilled_total"] == 5
+    assert len(list((tmp_path / "spill").glob("votes-*.ndjson"))) == 1
+
+    up = VoteWriteBuffer(max_size=2, flush_interval=60, enabled=True, spill_dir=spill_dir)
+    up.start()
+    assert up.stats()["restored_total"] == 5
+    assert list((tmp_path / "spill").iterdir()) == []
+    up.stop()
+    assert up.stats()["votes_flushed_total"] == 5
+    stored = db.execute(select(models.Vote.user_id, models.Vote.vote_value).order_by(models.Vote.vote_id)).all()
+    assert [tuple(row) for row in stored] == [(vote.user_id, vote.vote_value) for vote in votes]
@@ -0,0 +1,40 @@
+# file: server/tests/test_periodic.py
+"""周期性重算每轮只重算上一轮之后收到过投票的分区，不会每轮重复叠加同一批投票的调整。"""
+import time
+import uuid
+from datetime import datetime
+from decimal import Decimal
+
+from app import models
+from app.hvac_dispatcher import hvac_dispatcher
+from app.periodic import PeriodicRecomputeScheduler
+
+
+def _recommended(db) -> dict:
+    db.expire_all()
+    return {zone.zone_id: zone.recommended_temp for zone in db.query(models.Zone)}
+
+
+def test_each_tick_only_recomputes_zones_with_new_votes(db, monkeypatch):
+    monkeypatch.setattr(hvac_dispatcher, "submit", lambda zone_id, temperature: None)
+    users = [uuid.uuid4() for _ in range(4)]
+    db.add_all(models.Zone(zone_id=z, name=z, current_temp=24, recommended_temp=24) for z in ("zone-a", "zone-b"))
+    db.add_all(models.User(user_id=u) for u in users)
+    db.add_all(models.Vote(user_id=u, zone_id="zone-a", vote_value=1, created_at=datetime.utcnow()) for u in users[:3])
+    db.commit()
+    periodic = PeriodicRecomputeScheduler(interval=60, shards=2, max_workers=1, budget=60)
+
+    periodic._tick(time.monotonic(), 0)
+    first = _recommended(db)
+    assert first["zone-a"] != Decimal("24.0") and first["zone-b"] == Decimal("24.0")
+    assert periodic.last_tick["zones"] == 1
+
+    # 没有新投票：同一批投票不会再调整一次
+    periodic._tick(time.monotonic(), 0)
+    assert _recommended(db) == first
+    assert periodic.last_tick["zones"] == 0
+
+    db.add(models.Vote(user_id=users[3], zone_id="zone-a", vote_value=1, created_at=datetime.utcnow()))
+    db.commit()
+    periodic._tick(time.monotonic(), 0)
+    assert _recommended(db)["zone-a"] != first["zone-a"]
@@ -0,0 +1,49 @@
+# file: server/tests/test_retention.py
+"""数据保留策略只删除超过保留期限的原始记录和分钟汇总，期限内的数据和小时汇总保持不变；归档文件包含被删除的全部行。"""
+import csv
+import gzip
+import uuid
+from datetime import datetime, timedelta
+
+from app import models, retention
+
+
+def test_only_expired_rows_are_purged(db, tmp_path):
+    now = datetime(2026, 10, 1, 12)
+    raw_cutoff = now - timedelta(days=retention.RAW_RETENTION_DAYS)
+    minute_cutoff = now - timedelta(days=retention.MINUTE_ROLLUP_RETENTION_DAYS)
+    user = uuid.uuid4()
+    db.add(models.Zone(zone_id="zone-a", name="zone-a", current_temp=24, recommended_temp=24))
+    db.add(models.User(user_id=user))
+    db.commit()
+
+    # 边界上的记录（恰好等于截止时间）保留
+    ages = [timedelta(days=400), timedelta(seconds=1), timedelta(0), -timedelta(days=1)]
+    db.add_all(models.Vote(user_id=user, zone_id="zone-a", vote_value=1, created_at=raw_cutoff - age) for age in ages)
+    db.add_all(models.History(zone_id="zone-a", current_temp=22, recommended_temp=24, timestamp=raw_cutoff - age)
+               for age in ages)
+    db.add_all(models.ZoneMinuteRollup(zone_id="zone-a", bucket=minute_cutoff - age) for age in ages)
+    db.add_all(models.ZoneHourRollup(zone_id="zone-a", bucket=raw_cutoff - age) for age in ages)
+    db.commit()
+
+    archive_dir = tmp_path / "archive"
+    result = retention.run_retention(db, now=now, archive_dir=str(archive_dir))
+    assert result == {"votes": 2, "history": 2, "zone_rollups_minute": 2}
+    assert sorted(ts for ts, in db.query(models.Vote.created_at)) == [raw_cutoff, raw_cutoff + timedelta(days=1)]
+    assert sorted(ts for ts, in db.query(models.History.timestamp)) == [raw_cutoff, raw_cutoff + timedelta(days=1)]
+    assert sorted(ts for ts, in db.query(models.ZoneMinuteRollup.bucket)) == [
+        minute_cutoff, minute_cutoff + timedelta(days=1)
+    ]
+    assert db.query(models.ZoneHourRollup).count() == 4
+
+    (votes_archive,) = archive_dir.glob("votes-*.csv.gz")
+    with gzip.open(votes_archive, "rt", newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert sorted(row["created_at"] for row in rows) == sorted(
+        str(raw_cutoff - age) for age in ages[:2]
+    )
+
+    # 再次执行时没有可删除的数据
+    assert retention.run_retention(db, now=now, archive_dir=str(archive_dir)) == {
+        "votes": 0, "history": 0, "zone_rollups_minute": 0
+    }
@@ -0,0 +1,96 @@
+# file: server/tests/test_rollups.py
+"""分批增量累加（包括被改写的投票）得到的分钟/小时汇总，与直接按原始 votes / history 表计算的结果一致，也与重建的结果一致。"""
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+from app import models, rollups
+
+FIELDS = ["temp_count", "current_temp_min", "current_temp_max", "current_temp_sum",
+          "recommended_temp_min", "recommended_temp_max", "recommended_temp_sum",
+          "votes_minus_one", "votes_zero", "votes_plus_one"]
+
+
+def _rollup_table(db, granularity: str) -> dict:
+    model = rollups.GRANULARITIES[granularity]
+    return {
+        (row.zone_id, row.bucket): tuple(getattr(row, field) for field in FIELDS)
+        for row in db.query(model).all()
+    }
+
+
+def _from_raw(db, granularity: str) -> dict:
+    buckets = {}
+
+    def bucket(zone_id, timestamp):
+        return buckets.setdefault((zone_id, rollups.truncate(timestamp, granularity)), {
+            "temp_count": 0, "current": [], "recommended": [], -1: 0, 0: 0, 1: 0,
+        })
+
+    for zone_id, vote_value, created_at in db.execute(
+            select(models.Vote.zone_id, models.Vote.vote_value, models.Vote.created_at)):
+        bucket(zone_id, created_at)[vote_value] += 1
+    for zone_id, timestamp, current_temp, recommended_temp in db.execute(
+            select(models.History.zone_id, models.History.timestamp,
+                   models.History.current_temp, models.History.recommended_temp)):
+        row = bucket(zone_id, timestamp)
+        row["temp_count"] += 1
+        row["current"].append(current_temp)
+        row["recommended"].append(recommended_temp)
+    return {
+        key: (row["temp_count"],
+              min(row["current"], default=None), max(row["current"], default=None), float(sum(row["current"])),
+              min(row["recommended"], default=None), max(row["recommended"], default=None),
+              float(sum(row["recommended"])),
+              row[-1], row[0], row[1])
+        for key, row in buckets.items()
+    }
+
+
+def test_incremental_rollups_match_raw_tables(db):
+    base = datetime(2026, 10, 1, 8, 58)
+    users = [uuid.uuid4() for _ in range(4)]
+    db.add_all(models.Zone(zone_id=zone_id, name=zone_id, current_temp=24, recommended_temp=24)
+               for zone_id in ("zone-a", "zone-b"))
+    db.add_all(models.User(user_id=u) for u in users)
+    db.commit()
+
+    # 三批写入，时间跨越分钟和小时边界；同一时间桶在不同批次中被多次累加
+    for batch in range(3):
+        votes = [
+            models.Vote(user_id=users[i], zone_id=("zone-a", "zone-b")[i % 2], vote_value=(i + batch) % 3 - 1,
+                        created_at=base + timedelta(seconds=40 * batch + 25 * i))
+            for i in range(len(users))
+        ]
+        history = [
+            models.History(zone_id=zone_id, current_temp=22 + 0.5 * (batch - i), recommended_temp=24 - 0.25 * batch,
+                           timestamp=base + timedelta(seconds=50 * batch + 30 * i))
+            for i, zone_id in enumerate(("zone-a", "zone-b", "zone-a"))
+        ]
+        db.add_all(votes + history)
+        db.flush()
+        rollups.record_votes(db, [(vote.zone_id, vote.vote_value, vote.created_at) for vote in votes])
+        rollups.record_history(db, [(h.zone_id, h.timestamp, h.current_temp, h.recommended_temp) for h in history])
+        db.commit()
+
+    # “最新一票生效”改写一张投票：旧值从原时间桶扣减，新值计入新时间桶
+    vote = db.query(models.Vote).order_by(models.Vote.vote_id).first()
+    old = (vote.zone_id, vote.vote_value, vote.created_at)
+    vote.vote_value, vote.created_at = (vote.vote_value + 2) % 3 - 1, base + timedelta(hours=1, minutes=5)
+    rollups.record_votes(db, [(vote.zone_id, vote.vote_value, vote.created_at)], removed=[old])
+    db.commit()
+
+    for granularity in rollups.GRANULARITIES:
+        raw = _from_raw(db, granularity)
+        stored = _rollup_table(db, granularity)
+        # 被改写投票的旧时间桶可能只剩全零的行，忽略这些行后与原始数据完全一致
+        assert {key: row for key, row in stored.items() if any(row)} == raw
+    assert len(_from_raw(db, "hour")) == 5
+
+    incremental = {granularity: _rollup_table(db, granularity) for granularity in rollups.GRANULARITIES}
+    assert rollups.rebuild_rollups(db, chunk_size=5) == {"votes": 12, "history": 9}
+    for granularity in rollups.GRANULARITIES:
+        assert _rollup_table(db, granularity) == {
+            key: row for key, row in incremental[granularity].items() if any(row)
+        }
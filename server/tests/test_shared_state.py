@@ -0,0 +1,60 @@
+# file: server/tests/test_shared_state.py
+"""共享分区状态表的文件只会变大或被整体替换，已映射的进程（这里用另一个表对象模拟）始终能继续读写。"""
+import os
+import struct
+
+import pytest
+
+from app.shared_state import SharedZoneTable, fcntl
+from app.zone_cache import known_zone_ids
+
+pytestmark = pytest.mark.skipif(fcntl is None, reason="共享状态表需要 fcntl")
+
+
+def _fields(value: int) -> dict:
+    return {"name": f"zone-{value}", "current_temp": 20 + value / 10, "recommended_temp": 24.0,
+            "votes": {"-1": value, "0": 0, "1": 0}}
+
+
+def test_larger_capacity_grows_the_file_for_existing_mappings(tmp_path):
+    path = str(tmp_path / "zones.tbl")
+    zone_ids = [f"grow-{i}" for i in range(8)]
+    known_zone_ids.add(zone_ids)
+    small = SharedZoneTable(path, capacity=4, enabled=True)
+    small.open()
+    small.write_many({zone_id: _fields(i) for i, zone_id in enumerate(zone_ids[:4])})
+
+    large = SharedZoneTable(path, capacity=8, enabled=True)
+    large.open()
+    large.write_many({zone_id: _fields(i) for i, zone_id in enumerate(zone_ids[4:], start=4)})
+    # 已映射的表对象扫描到超出自己映射范围的槽位时重新映射，原有的槽位保持不变
+    assert [small.read(zone_id).current_temp for zone_id in zone_ids] == [20 + i / 10 for i in range(8)]
+    assert small.capacity == 8
+
+    # 容量配置更小的进程沿用文件中更大的容量，不截断文件
+    smaller = SharedZoneTable(path, capacity=2, enabled=True)
+    smaller.open()
+    assert smaller.capacity == 8
+    assert smaller.read(zone_ids[7]).current_temp == 20.7
+    for table in (small, large, smaller):
+        table.close()
+
+
+def test_incompatible_layout_is_replaced_not_truncated(tmp_path):
+    path = str(tmp_path / "zones.tbl")
+    known_zone_ids.add(["old-zone"])
+    old = SharedZoneTable(path, capacity=4, enabled=True)
+    old.open()
+    old.write("old-zone", **_fields(1))
+    with open(path, "r+b") as f:
+        f.seek(4)
+        f.write(struct.pack("<I", 999))   # 模拟升级后布局版本不同的文件
+
+    new = SharedZoneTable(path, capacity=4, enabled=True)
+    new.open()
+    assert new.read("old-zone") is None
+    # 仍映射旧文件的表对象不受影响
+    assert old.read("old-zone").current_temp == 20.1
+    assert os.path.getsize(path) == 64 + 4 * 256
+    old.close()
+    new.close()
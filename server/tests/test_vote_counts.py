@@ -0,0 +1,76 @@
+# file: server/tests/test_vote_counts.py
+"""
+共享分区状态表中的票数跟随时间窗：新投票和投票过期都由票数发布器写入表中；
+其它worker（或其它主机）发布的推送消息由 _dispatch 写入本机的表。
+"""
+import json
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import events, models, strategy
+from app.activity import load_user_activity
+from app.shared_state import SharedZoneTable, fcntl
+from app.vote_counts import VoteCountPublisher
+from app.vote_window import VoteWindowAggregator
+from app.zone_cache import known_zone_ids
+
+pytestmark = pytest.mark.skipif(fcntl is None, reason="共享状态表需要 fcntl")
+
+
+@pytest.fixture
+def table(tmp_path, monkeypatch):
+    table = SharedZoneTable(str(tmp_path / "zones.tbl"), capacity=16, enabled=True)
+    table.open()
+    monkeypatch.setattr(events, "shared_zone_table", table)
+    yield table
+    table.close()
+
+
+def test_dispatch_applies_remote_changes_to_the_table(table):
+    known_zone_ids.add(["remote-zone"])
+    table.write("remote-zone", name="remote-zone", current_temp=24.0, recommended_temp=24.0,
+                votes={"-1": 0, "0": 0, "1": 0})
+    broker = events.EventBroker()
+    # 另一台主机上的归属进程重算后发布的消息：只携带变化的字段
+    broker._dispatch(json.dumps({"zone_id": "remote-zone", "changes": {
+        "recommended_temp": 23.5, "stats": {"-1": 0, "0": 1, "1": 4}, "history_point": {"t": 0},
+    }}))
+    state = table.read("remote-zone")
+    assert (state.current_temp, state.recommended_temp) == (24.0, 23.5)
+    assert state.votes == {"-1": 0, "0": 1, "1": 4}
+
+
+def test_publisher_keeps_counts_current_as_votes_arrive_and_expire(db, table, monkeypatch):
+    aggregator = VoteWindowAggregator(strategy.VOTE_VALID_DURATION_MINUTES, load_user_activity)
+    monkeypatch.setattr(strategy, "vote_aggregator", aggregator)
+    known_zone_ids.add(["zone-a"])
+    now = datetime.utcnow()
+    users = [uuid.uuid4() for _ in range(3)]
+    db.add(models.Zone(zone_id="zone-a", name="zone-a", current_temp=24, recommended_temp=24))
+    db.add_all(models.User(user_id=u) for u in users)
+    db.commit()
+    publisher = VoteCountPublisher(interval=1)
+    # 第一次同步时加载聚合器（与 worker 启动时相同，此时的票数已由启动流程写入表中）
+    assert publisher.sweep() == []
+
+    window = timedelta(minutes=strategy.VOTE_VALID_DURATION_MINUTES)
+    # 一票在1秒后滑出时间窗
+    db.add(models.Vote(user_id=users[0], zone_id="zone-a", vote_value=-1, created_at=now - window + timedelta(seconds=1)))
+    db.add(models.Vote(user_id=users[1], zone_id="zone-a", vote_value=1, created_at=now))
+    db.commit()
+    assert publisher.sweep() == ["zone-a"]
+    assert table.read("zone-a").votes == {"-1": 1, "0": 0, "1": 1}
+    # 票数没有变化时不再发布
+    assert publisher.sweep() == []
+
+    db.add(models.Vote(user_id=users[2], zone_id="zone-a", vote_value=0, created_at=datetime.utcnow()))
+    db.commit()
+    assert publisher.sweep() == ["zone-a"]
+    assert table.read("zone-a").votes == {"-1": 1, "0": 1, "1": 1}
+
+    time.sleep(1.2)
+    assert publisher.sweep() == ["zone-a"]
+    assert table.read("zone-a").votes == {"-1": 0, "0": 1, "1": 1}
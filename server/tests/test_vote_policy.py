@@ -0,0 +1,97 @@
+# file: server/tests/test_vote_policy.py
+"""投票策略层：(用户, 分区) 令牌桶限流（429 与令牌补充），以及“最新一票生效”模式下重复投票改写已有的一票。"""
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import crud, models, schemas, strategy, vote_policy
+from app.main import app
+from app.vote_policy import VoteRateLimiter
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+def test_token_bucket_returns_429_until_tokens_refill(db, monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(vote_policy, "time", clock)
+    monkeypatch.setattr(vote_policy, "vote_limiter", VoteRateLimiter(rate_per_minute=6, burst=2))
+    db.add(models.Zone(zone_id="zone-a", name="zone-a", current_temp=24, recommended_temp=24))
+    db.commit()
+    client = TestClient(app)
+    vote = {"user_id": str(uuid.uuid4()), "zone_id": "zone-a", "vote_value": 1}
+
+    assert [client.post("/api/vote/", json=vote).status_code for _ in range(2)] == [200, 200]
+    throttled = client.post("/api/vote/", json=vote)
+    assert throttled.status_code == 429
+    # 每分钟补充6个令牌：10秒后才有下一个
+    assert throttled.headers["Retry-After"] == "10"
+    # 其它用户不受影响
+    assert client.post("/api/vote/", json={**vote, "user_id": str(uuid.uuid4())}).status_code == 200
+
+    clock.now += 9
+    assert client.post("/api/vote/", json=vote).status_code == 429
+    clock.now += 1
+    assert client.post("/api/vote/", json=vote).status_code == 200
+    # 令牌最多补满到桶容量
+    clock.now += 3600
+    assert [client.post("/api/vote/", json=vote).status_code for _ in range(3)] == [200, 200, 429]
+    assert vote_policy.vote_limiter.stats()["throttled"] == 3
+
+
+def test_batch_drops_throttled_votes():
+    limiter = VoteRateLimiter(rate_per_minute=1, burst=1)
+    user_id = uuid.uuid4()
+    votes = [schemas.VoteCreate(user_id=user_id, zone_id=zone_id, vote_value=0) for zone_id in ("a", "a", "b")]
+    accepted, throttled = limiter.admit(votes)
+    assert [vote.zone_id for vote in accepted] == ["a", "b"]
+    assert throttled == 1
+
+
+@pytest.fixture
+def latest_wins(db, monkeypatch):
+    monkeypatch.setattr(vote_policy, "VOTE_LATEST_WINS", True)
+    db.add(models.Zone(zone_id="zone-a", name="zone-a", current_temp=24, recommended_temp=24))
+    db.commit()
+    return db
+
+
+def _votes(db) -> list:
+    db.expire_all()
+    return [(vote.user_id, vote.vote_value) for vote in db.query(models.Vote).order_by(models.Vote.vote_id)]
+
+
+def test_latest_vote_in_window_replaces_the_previous_one(latest_wins):
+    db = latest_wins
+    user_id, other = uuid.uuid4(), uuid.uuid4()
+    first = crud.bulk_create_votes(db, [schemas.VoteCreate(user_id=user_id, zone_id="zone-a", vote_value=-1)])
+    # 同一批中的重复投票只保留最后一票；其它用户的投票照常插入
+    written = crud.bulk_create_votes(db, [
+        schemas.VoteCreate(user_id=user_id, zone_id="zone-a", vote_value=0),
+        schemas.VoteCreate(user_id=other, zone_id="zone-a", vote_value=1),
+        schemas.VoteCreate(user_id=user_id, zone_id="zone-a", vote_value=1),
+    ])
+    assert _votes(db) == [(user_id, 1), (other, 1)]
+    replaced = [row for row in written if row.user_id == user_id]
+    assert [(row.vote_id, row.vote_value) for row in replaced] == [(first[0].vote_id, 1)]
+    assert replaced[0].created_at >= first[0].created_at
+    # 用户活跃度只统计新插入的投票
+    assert db.get(models.UserActivity, user_id).total_votes == 1
+
+
+def test_vote_outside_the_window_is_not_replaced(latest_wins):
+    db = latest_wins
+    user_id = uuid.uuid4()
+    db.add(models.User(user_id=user_id))
+    db.add(models.Vote(user_id=user_id, zone_id="zone-a", vote_value=-1,
+                       created_at=datetime.utcnow() - timedelta(minutes=strategy.VOTE_VALID_DURATION_MINUTES + 1)))
+    db.commit()
+    crud.bulk_create_votes(db, [schemas.VoteCreate(user_id=user_id, zone_id="zone-a", vote_value=1)])
+    assert _votes(db) == [(user_id, -1), (user_id, 1)]
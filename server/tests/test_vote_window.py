@@ -0,0 +1,151 @@
+# file: server/tests/test_vote_window.py
+"""滑动窗口聚合器与按时间窗重新查询投票表（原始SQL实现）的结果应当完全一致，包括窗口边界上的过期。"""
+import random
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+from app import models, strategy, vote_window
+from app.activity import load_user_activity
+from app.vote_window import VoteWindowAggregator, WindowStats, EMPTY_STATS
+
+WINDOW = timedelta(minutes=strategy.VOTE_VALID_DURATION_MINUTES)
+
+
+def _aggregator() -> VoteWindowAggregator:
+    return VoteWindowAggregator(strategy.VOTE_VALID_DURATION_MINUTES, load_user_activity)
+
+
+def _sql_stats(db, zone_id: str, now: datetime) -> WindowStats:
+    # 与 strategy._sql_vote_score 相同的口径：created_at >= now - 时间窗，固定用户按 now 时刻判断
+    votes = db.query(models.Vote).filter(models.Vote.zone_id == zone_id,
+                                         models.Vote.created_at >= now - WINDOW).all()
+    activity = load_user_activity(db, list({vote.user_id for vote in votes}), now)
+    frequent = [vote for vote in votes if activity.get(vote.user_id, {}).get("is_frequent", False)]
+    return WindowStats(len(votes), sum(vote.vote_value for vote in votes),
+                       len(frequent), sum(vote.vote_value for vote in frequent))
+
+
+def _seed(db, now: datetime, zones: int = 5, users: int = 20, votes: int = 300, seed: int = 7):
+    rng = random.Random(seed)
+    zone_ids = [f"zone-{i}" for i in range(zones)]
+    user_ids = [uuid.UUID(int=rng.getrandbits(128), version=4) for _ in range(users)]
+    db.add_all(models.Zone(zone_id=z, name=z, current_temp=24, recommended_temp=24) for z in zone_ids)
+    db.add_all(models.User(user_id=u, first_seen_at=now - timedelta(days=30)) for u in user_ids)
+    # 三分之一的用户已是固定用户，三分之一在测试过程中才达标，其余不是固定用户
+    db.add_all(
+        models.UserActivity(user_id=u, total_votes=10, frequent_since=(
+            now - timedelta(days=1) if i % 3 == 0 else now + timedelta(minutes=rng.uniform(1, 20)) if i % 3 == 1 else None))
+        for i, u in enumerate(user_ids)
+    )
+    db.add_all(
+        models.Vote(user_id=rng.choice(user_ids), zone_id=rng.choice(zone_ids), vote_value=rng.choice((-1, 0, 1)),
+                    created_at=now - timedelta(seconds=rng.uniform(0, WINDOW.total_seconds() - 1)))
+        for _ in range(votes)
+    )
+    db.commit()
+    return zone_ids, user_ids, rng
+
+
+def test_window_matches_sql_as_votes_arrive_and_expire(db):
+    now = datetime.utcnow()
+    zone_ids, user_ids, rng = _seed(db, now)
+    aggregator = _aggregator()
+    aggregator.seed(db)
+
+    for step in range(12):
+        now += timedelta(minutes=2)
+        # 本进程写入的投票经 record() 推入，其余（模拟其它worker写入的）由 refresh() 从数据库同步
+        for i in range(10):
+            vote = models.Vote(user_id=rng.choice(user_ids), zone_id=rng.choice(zone_ids),
+                               vote_value=rng.choice((-1, 0, 1)), created_at=now - timedelta(seconds=i))
+            db.add(vote)
+            db.flush()
+            if i % 2:
+                aggregator.record(vote)
+        db.commit()
+        aggregator.refresh(db, now)
+        for zone_id in zone_ids:
+            assert aggregator.zone_stats(zone_id) == _sql_stats(db, zone_id, now), (step, zone_id)
+            counts = _sql_stats(db, zone_id, now)
+            assert sum(aggregator.vote_counts(zone_id).values()) == counts.count
+
+
+def test_vote_expires_exactly_at_window_boundary(db):
+    now = datetime.utcnow()
+    user_id = uuid.uuid4()
+    db.add(models.Zone(zone_id="zone-a", name="zone-a", current_temp=24, recommended_temp=24))
+    db.add(models.Zone(zone_id="zone-b", name="zone-b", current_temp=24, recommended_temp=24))
+    db.add(models.User(user_id=user_id))
+    db.add_all([
+        models.Vote(user_id=user_id, zone_id="zone-a", vote_value=1, created_at=now),
+        models.Vote(user_id=user_id, zone_id="zone-a", vote_value=-1, created_at=now - timedelta(microseconds=1)),
+        models.Vote(user_id=user_id, zone_id="zone-b", vote_value=0, created_at=now + timedelta(minutes=1)),
+    ])
+    db.commit()
+    aggregator = _aggregator()
+    aggregator.seed(db)
+
+    # 时间窗为 [now - WINDOW, now]：恰好在下界上的投票仍然有效，早1微秒的投票已过期
+    boundary = now + WINDOW
+    aggregator.refresh(db, boundary)
+    assert aggregator.zone_stats("zone-a") == _sql_stats(db, "zone-a", boundary) == WindowStats(1, 1, 0, 0)
+    assert aggregator.vote_counts("zone-a") == {"-1": 0, "0": 0, "1": 1}
+
+    aggregator.refresh(db, boundary + timedelta(microseconds=1))
+    assert aggregator.zone_stats("zone-a") == _sql_stats(db, "zone-a", boundary + timedelta(microseconds=1)) == EMPTY_STATS
+    assert aggregator.zone_ids() == ["zone-b"]
+    assert aggregator.zone_stats("zone-b") == WindowStats(1, 0, 0, 0)
+
+
+def test_window_score_matches_sql_vote_score(db):
+    now = datetime.utcnow()
+    zone_ids, _, _ = _seed(db, now)
+    strategy.vote_aggregator.seed(db)
+    for zone_id in zone_ids:
+        assert strategy._window_vote_score(db, zone_id) == strategy._sql_vote_score(db, zone_id)
+
+
+def test_refresh_queries_without_holding_the_lock(db):
+    now = datetime.utcnow()
+    zone_ids, _, _ = _seed(db, now, votes=50)
+    held = []
+
+    def load(db, user_ids):
+        held.append(aggregator._lock.locked())
+        return load_user_activity(db, user_ids)
+
+    def before_execute(*args):
+        held.append(aggregator._lock.locked())
+
+    aggregator = VoteWindowAggregator(strategy.VOTE_VALID_DURATION_MINUTES, load)
+    engine = db.get_bind()
+    event.listen(engine, "before_cursor_execute", before_execute)
+    try:
+        aggregator.refresh(db, now)
+    finally:
+        event.remove(engine, "before_cursor_execute", before_execute)
+    assert held and not any(held)
+    for zone_id in zone_ids:
+        assert aggregator.zone_stats(zone_id) == _sql_stats(db, zone_id, now)
+
+
+def test_pending_votes_are_bounded_and_resynced_from_the_database(db, monkeypatch):
+    monkeypatch.setattr(vote_window, "MAX_PENDING_VOTES", 5)
+    now = datetime.utcnow()
+    zone_ids, user_ids, rng = _seed(db, now, votes=0)
+    aggregator = _aggregator()
+    aggregator.seed(db)
+    for i in range(20):
+        vote = models.Vote(user_id=rng.choice(user_ids), zone_id=rng.choice(zone_ids),
+                           vote_value=rng.choice((-1, 0, 1)), created_at=now - timedelta(seconds=i))
+        db.add(vote)
+        db.flush()
+        aggregator.record(vote)
+    db.commit()
+    # 长时间没有 refresh 时只保留最新的 MAX_PENDING_VOTES 张，被丢弃的投票由 refresh 从数据库同步
+    assert len(aggregator._pending) == 5
+    aggregator.refresh(db, now)
+    for zone_id in zone_ids:
+        assert aggregator.zone_stats(zone_id) == _sql_stats(db, zone_id, now)
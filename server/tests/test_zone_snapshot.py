@@ -0,0 +1,49 @@
+# file: server/tests/test_zone_snapshot.py
+"""
+/api/zones/{id}/snapshot 的 ETag 条件请求：数据未变时返回 304，写入投票后下一次请求返回 200 和新的 ETag。
+投票写入引起的快照失效经推送频道广播给其它worker。
+"""
+import json
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import events, models
+from app.main import app
+from app.zone_cache import zone_cache
+
+
+@pytest.fixture
+def client(db):
+    db.add(models.Zone(zone_id="zone-a", name="zone-a", current_temp=24, recommended_temp=24))
+    db.commit()
+    zone_cache.invalidate("zone-a")
+    # 不进入 lifespan：测试只需要请求路径，不启动后台线程
+    return TestClient(app)
+
+
+def test_unchanged_snapshot_returns_304_until_a_vote_is_written(client):
+    first = client.get("/api/zones/zone-a/snapshot")
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+    assert first.json()["stats"] == {"-1": 0, "0": 0, "1": 0}
+
+    again = client.get("/api/zones/zone-a/snapshot", headers={"If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.headers["ETag"] == etag
+
+    vote = client.post("/api/vote/", json={"user_id": str(uuid.uuid4()), "zone_id": "zone-a", "vote_value": 1})
+    assert vote.status_code == 200
+    after = client.get("/api/zones/zone-a/snapshot", headers={"If-None-Match": etag})
+    assert after.status_code == 200
+    assert after.headers["ETag"] != etag
+    assert after.json()["stats"] == {"-1": 0, "0": 0, "1": 1}
+
+
+def test_invalidation_message_from_another_worker_drops_the_snapshot(client):
+    assert client.get("/api/zones/zone-a/snapshot").status_code == 200
+    assert zone_cache.get("zone-a") is not None
+    broker = events.EventBroker()
+    broker._handlers[events.INVALIDATE_CHANNEL](json.dumps(["zone-a"]))
+    assert zone_cache.get("zone-a") is None